@@ -184,8 +184,7 @@ def send_slack_summary(total_adsets, processed_adsets, skipped_adsets, errors):
         return
     
     try:
-        from slack_sdk import WebClient
-        client = WebClient(token=SLACK_BOT_TOKEN)
+        import slack_client
         
         # サマリーメッセージを作成
         summary_text = f"""
@@ -198,16 +197,47 @@ def send_slack_summary(total_adsets, processed_adsets, skipped_adsets, errors):
 • エラー: {errors}
 """
         
-        response = client.chat_postMessage(
-            channel=SLACK_CHANNEL_ID,
-            text=summary_text
-        )
+        response = slack_client.post_message(summary_text)
         
-        print(f"✅ Slackサマリー送信成功: {response['ts']}")
+        if response and response.get("ok"):
+            print(f"✅ Slackサマリー送信成功: {response['ts']}")
     
     except Exception as e:
         print(f"❌ Slackサマリー送信エラー: {e}")
 
+def run_plan():
+    """全キャンペーンのコピー計画を作成（書き込みAPIは呼ばない）"""
+    from ad_copy_low_impression import build_copy_plan, save_copy_plan, print_plan_summary
+    
+    campaign_ids = [cid.strip() for cid in CAMPAIGN_IDS if cid.strip()]
+    plan = build_copy_plan(campaign_ids=campaign_ids)
+    if not save_copy_plan(plan):
+        sys.exit(1)
+    print_plan_summary(plan)
+
+def run_apply():
+    """保存済みのコピー計画を適用（書き込みAPIのみ）"""
+    from ad_copy_low_impression import load_copy_plan, validate_copy_plan, apply_copy_plan
+    
+    plan = load_copy_plan()
+    if not plan or not validate_copy_plan(plan):
+        sys.exit(1)
+    
+    results = apply_copy_plan(plan)
+    total_adsets = len(plan.get("adsets", [])) + len(plan.get("skipped", []))
+    skipped_adsets = len(plan.get("skipped", [])) + results["skipped"]
+    
+    print("\n" + "=" * 60)
+    print("計画の適用完了")
+    print("=" * 60)
+    print(f"対象広告セット数: {total_adsets}")
+    print(f"処理成功: {results['applied']}")
+    print(f"スキップ: {skipped_adsets}")
+    print(f"エラー: {results['errors']}")
+    print("=" * 60)
+    
+    send_slack_summary(total_adsets, results["applied"], skipped_adsets, results["errors"])
+
 def main():
     """メイン処理"""
     print("=" * 60)
@@ -227,6 +257,15 @@ def main():
         print("❌ アクセストークンの権限が不足しています")
         sys.exit(1)
     
+    # 実行モード（引数なし: 広告セットごとに即時実行 / plan: 計画作成のみ / apply: 計画の書き込みのみ）
+    mode = sys.argv[1] if len(sys.argv) > 1 else ""
+    if mode == "plan":
+        run_plan()
+        return
+    if mode == "apply":
+        run_apply()
+        return
+    
     # 統計情報
     total_adsets = 0
     processed_adsets = 0
@@ -4,11 +4,16 @@
 """
 
 import os
+import sys
 import json
 import requests
 import time
 from datetime import datetime, timedelta
 
+import slack_client
+from local_state import file_lock, atomic_write_json, read_json, update_json
+from state import load_copy_history, append_copy_history
+
 try:
     from dotenv import load_dotenv
 except ModuleNotFoundError:
@@ -31,8 +36,12 @@ DATE_RANGE_DAYS = 14  # 使用しない（全期間で判定）
 MAX_RETRIES = 3  # 最大リトライ回数
 RETRY_DELAY = 60  # リトライ間隔（秒）
 
-# コピー履歴ファイル
-COPY_HISTORY_FILE = "ad_copy_history.json"
+# plan/applyモード設定
+COPY_PLAN_FILE = os.getenv("COPY_PLAN_FILE", "ad_copy_plan.json")  # コピー計画ファイル
+COPY_PLAN_MAX_AGE_HOURS = float(os.getenv("COPY_PLAN_MAX_AGE_HOURS", "24"))  # 計画の有効期限（時間）
+INSIGHTS_CACHE_FILE = "ad_insights_cache.json"  # 一括取得したインプレッションのキャッシュ
+INSIGHTS_CACHE_MAX_AGE_HOURS = float(os.getenv("INSIGHTS_CACHE_MAX_AGE_HOURS", "6"))  # キャッシュの有効期限（時間）
+LIFETIME_DAYS = 730  # 全期間として扱う日数（過去2年間）
 
 
 def api_request_with_retry(method, url, max_retries=MAX_RETRIES, **kwargs):
@@ -81,28 +90,6 @@ def api_request_with_retry(method, url, max_retries=MAX_RETRIES, **kwargs):
     return None
 
 
-def load_copy_history():
-    """コピー履歴を読み込み"""
-    if os.path.exists(COPY_HISTORY_FILE):
-        try:
-            with open(COPY_HISTORY_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"コピー履歴読み込みエラー: {e}")
-    return []
-
-
-def save_copy_history(history):
-    """コピー履歴を保存"""
-    try:
-        with open(COPY_HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
-        return True
-    except Exception as e:
-        print(f"コピー履歴保存エラー: {e}")
-        return False
-
-
 def fetch_adset_details(adset_id):
     """広告セットの詳細情報を取得"""
     url = f"https://graph.facebook.com/v21.0/{adset_id}"
@@ -176,6 +163,111 @@ def fetch_ad_insights(ad_id, days=14):
         return {}
 
 
+def fetch_all_pages(url, params):
+    """ページングをたどって全件取得（取得失敗時はNone）"""
+    items = []
+    try:
+        while url:
+            res = api_request_with_retry("GET", url, params=params)
+            if not res or res.status_code != 200:
+                print(f"❌ 一括取得失敗: {res.status_code if res else 'None'} - {res.text[:200] if res else 'No response'}")
+                return None
+            data = res.json()
+            items.extend(data.get("data", []))
+            url = data.get("paging", {}).get("next")
+            params = {}  # 次のページではparamsは不要
+    except Exception as e:
+        print(f"❌ 一括取得エラー: {e}")
+        return None
+    return items
+
+
+def fetch_ad_impressions_bulk(object_id):
+    """キャンペーンまたは広告セット配下の全広告のインプレッションを1回の一括取得で集計（全期間）"""
+    since = (datetime.now() - timedelta(days=LIFETIME_DAYS)).strftime("%Y-%m-%d")
+    until = datetime.now().strftime("%Y-%m-%d")
+
+    url = f"https://graph.facebook.com/v21.0/{object_id}/insights"
+    params = {
+        "access_token": ACCESS_TOKEN,
+        "level": "ad",
+        "time_range": json.dumps({"since": since, "until": until}),
+        "fields": "ad_id,impressions",
+        "limit": 500
+    }
+
+    rows = fetch_all_pages(url, params)
+    if rows is None:
+        return None
+
+    # 配信実績のない広告は結果に含まれない（=0 impとして扱う）
+    return {row["ad_id"]: int(row.get("impressions", 0)) for row in rows if row.get("ad_id")}
+
+
+def load_insights_cache():
+    """インプレッションキャッシュを読み込み"""
+    try:
+        return read_json(INSIGHTS_CACHE_FILE, {})
+    except Exception as e:
+        print(f"インプレッションキャッシュ読み込みエラー: {e}")
+    return {}
+
+
+def save_insights_cache(cache):
+    """インプレッションキャッシュを保存（他プロセスが取得した分とマージ）"""
+    try:
+        update_json(INSIGHTS_CACHE_FILE, {}, lambda current: current.update(cache))
+        return True
+    except Exception as e:
+        print(f"インプレッションキャッシュ保存エラー: {e}")
+        return False
+
+
+def get_ad_impressions(object_id, cache):
+    """キャッシュが有効ならキャッシュから、なければ一括取得してインプレッションを返す"""
+    entry = cache.get(object_id)
+    if entry:
+        fetched_at = datetime.fromisoformat(entry["fetched_at"])
+        if datetime.now() - fetched_at < timedelta(hours=INSIGHTS_CACHE_MAX_AGE_HOURS):
+            print(f"📦 キャッシュ済みインプレッションを使用: {object_id} ({entry['fetched_at']})")
+            return entry["impressions"]
+
+    impressions = fetch_ad_impressions_bulk(object_id)
+    if impressions is not None:
+        cache[object_id] = {
+            "fetched_at": datetime.now().isoformat(),
+            "impressions": impressions
+        }
+    return impressions
+
+
+def fetch_active_adsets(campaign_id):
+    """キャンペーン内のACTIVEな広告セットを取得（account_id付き）"""
+    url = f"https://graph.facebook.com/v21.0/{campaign_id}/adsets"
+    params = {
+        "access_token": ACCESS_TOKEN,
+        "fields": "id,name,account_id,effective_status",
+        "limit": 100
+    }
+
+    adsets = fetch_all_pages(url, params)
+    if adsets is None:
+        return []
+    return [adset for adset in adsets if adset.get("effective_status") == "ACTIVE"]
+
+
+def fetch_ads_bulk(object_id):
+    """キャンペーンまたは広告セット配下の全広告をcreative_id付きで一括取得（取得失敗時はNone）"""
+    url = f"https://graph.facebook.com/v21.0/{object_id}/ads"
+    params = {
+        "access_token": ACCESS_TOKEN,
+        "fields": "id,name,status,adset_id,creative{id}",
+        "limit": 500
+    }
+
+    return fetch_all_pages(url, params)
+
+
 def create_v2_adset(original_adset_id, original_name):
     """V2広告セットをコピーAPIで作成"""
     v2_name = f"{original_name}V2"
@@ -208,25 +300,27 @@ def create_v2_adset(original_adset_id, original_name):
         return None
 
 
-def copy_ad_to_adset(ad_id, target_adset_id, ad_name, ad_account_id):
-    """広告を指定の広告セットに新規作成（配信中状態）"""
-    # 元の広告からcreative_idを取得
-    ad_url = f"https://graph.facebook.com/v21.0/{ad_id}"
-    ad_params = {
-        "access_token": ACCESS_TOKEN,
-        "fields": "creative,name"
-    }
-    
+def copy_ad_to_adset(ad_id, target_adset_id, ad_name, ad_account_id, creative_id=None):
+    """広告を指定の広告セットに新規作成（配信中状態）
+
+    creative_idが渡された場合は広告詳細の取得を省略する
+    """
     try:
-        # 広告詳細を取得
-        ad_res = api_request_with_retry("GET", ad_url, params=ad_params)
-        if not ad_res or ad_res.status_code != 200:
-            print(f"  ❌ 広告詳細取得失敗: {ad_name}")
-            return None
-        
-        ad_data = ad_res.json()
-        creative_id = ad_data.get("creative", {}).get("id")
-        
+        if not creative_id:
+            # 元の広告からcreative_idを取得
+            ad_url = f"https://graph.facebook.com/v21.0/{ad_id}"
+            ad_params = {
+                "access_token": ACCESS_TOKEN,
+                "fields": "creative,name"
+            }
+            ad_res = api_request_with_retry("GET", ad_url, params=ad_params)
+            if not ad_res or ad_res.status_code != 200:
+                print(f"  ❌ 広告詳細取得失敗: {ad_name}")
+                return None
+
+            ad_data = ad_res.json()
+            creative_id = ad_data.get("creative", {}).get("id")
+
         if not creative_id:
             print(f"  ❌ creative_idが取得できません: {ad_name}")
             return None
@@ -279,108 +373,82 @@ def pause_adset(adset_id, adset_name):
 
 def send_slack_notification(message):
     """Slackに通知を送信"""
-    if not SLACK_BOT_TOKEN or not SLACK_CHANNEL_ID:
-        print("[警告] Slack設定が未設定のため、通知をスキップします")
-        return
-    
-    url = "https://slack.com/api/chat.postMessage"
-    headers = {
-        "Authorization": f"Bearer {SLACK_BOT_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "channel": SLACK_CHANNEL_ID,
-        "text": message
-    }
-    
     try:
-        res = requests.post(url, headers=headers, json=payload)
-        if res.status_code == 200 and res.json().get("ok"):
-            print("✅ Slack通知送信成功")
-        else:
-            print(f"❌ Slack通知送信失敗: {res.text}")
+        slack_client.post_message(message)
     except Exception as e:
         print(f"❌ Slack通知送信エラー: {e}")
 
 
-def process_adset(adset_id):
-    """広告セットを処理"""
-    print(f"\n{'='*60}")
-    print(f"広告セット処理開始: {adset_id}")
-    print(f"{'='*60}\n")
-    
-    # 広告セット詳細を取得
-    adset_details = fetch_adset_details(adset_id)
-    if not adset_details:
-        print("❌ 広告セット詳細の取得に失敗しました")
-        return
-    
-    adset_name = adset_details.get("name", "")
-    print(f"広告セット名: {adset_name}")
-    
-    # 広告を取得
-    ads = fetch_ads_in_adset(adset_id)
-    active_ads = [ad for ad in ads if ad.get("status") == "ACTIVE"]
-    print(f"広告数: {len(ads)}件 (ACTIVE: {len(active_ads)}件)")
-    
-    if not ads:
-        print("⚠️  広告が見つかりませんでした")
-        return
-    
-    # インプレッション500以下の広告を抽出
+def select_low_impression_ads(ads, impressions_by_id):
+    """インプレッション閾値以下の広告を抽出（creative_id付き）"""
     low_impression_ads = []
-    
-    print("\n広告のインサイトを取得中...")
     for ad in ads:
-        ad_id = ad["id"]
-        ad_name = ad["name"]
-        
-        insights = fetch_ad_insights(ad_id)  # 全期間で取得
-        impressions = int(insights.get("impressions", 0))
-        
-        print(f"  - {ad_name}: {impressions} imp")
-        
+        impressions = int(impressions_by_id.get(ad["id"], 0))
         if impressions <= IMPRESSION_THRESHOLD:
             low_impression_ads.append({
-                "id": ad_id,
-                "name": ad_name,
-                "impressions": impressions
+                "id": ad["id"],
+                "name": ad["name"],
+                "impressions": impressions,
+                "creative_id": ad.get("creative_id") or ad.get("creative", {}).get("id")
             })
-    
-    print(f"\nインプレッション{IMPRESSION_THRESHOLD}以下の広告: {len(low_impression_ads)}件")
-    
+    return low_impression_ads
+
+
+def build_adset_plan(adset, ads, impressions_by_id):
+    """広告セット1件分のコピー計画を作成（書き込みAPIは呼ばない）
+
+    Returns:
+        (plan_entry, skip_message): コピー対象外の場合はplan_entryがNone
+    """
+    adset_name = adset.get("name", "")
+    low_impression_ads = select_low_impression_ads(ads, impressions_by_id)
+
     # 広告数チェック
     if len(low_impression_ads) < MIN_AD_COUNT:
-        message = f"⚠️  広告数が{MIN_AD_COUNT}個未満のためスキップ\n\n広告セット: {adset_name}\n対象広告数: {len(low_impression_ads)}件"
-        print(f"\n{message}")
-        send_slack_notification(message)
-        return
-    
+        return None, f"⚠️  広告数が{MIN_AD_COUNT}個未満のためスキップ\n\n広告セット: {adset_name}\n対象広告数: {len(low_impression_ads)}件"
+
     # コピー後に元の広告セットに残る広告数をチェック（全広告で判断）
     remaining_ads_count = len(ads) - len(low_impression_ads)
-    print(f"\nコピー後に残る広告数: {remaining_ads_count}件（全広告で判断）")
-    
     if remaining_ads_count == 0:
-        message = f"⚠️  広告コピースキップ\n\n*広告セット:* {adset_name}\n*理由:* コピー後に広告が0個になるため\n*対象広告数:* {len(low_impression_ads)}件"
-        print(f"\n{message}")
-        send_slack_notification(message)
-        return
-    
+        return None, f"⚠️  広告コピースキップ\n\n*広告セット:* {adset_name}\n*理由:* コピー後に広告が0個になるため\n*対象広告数:* {len(low_impression_ads)}件"
+
+    return {
+        "adset_id": adset["id"],
+        "adset_name": adset_name,
+        "campaign_id": adset.get("campaign_id"),
+        "account_id": adset.get("account_id"),
+        "total_ads": len(ads),
+        "remaining_ads": remaining_ads_count,
+        "v2_adset_name": f"{adset_name}V2",
+        "expected_v2_size": len(low_impression_ads),
+        "ads": low_impression_ads
+    }, None
+
+
+def apply_adset_plan(entry):
+    """コピー計画に従ってV2広告セット作成と広告コピーのみを実行（読み取りAPIは呼ばない）
+
+    Returns:
+        コピーした広告のリスト（V2広告セット作成に失敗した場合はNone）
+    """
+    adset_id = entry["adset_id"]
+    adset_name = entry["adset_name"]
+
     # V2広告セットを作成
     print(f"\nV2広告セットを作成中...")
     v2_adset_id = create_v2_adset(adset_id, adset_name)
-    
+
     if not v2_adset_id:
         print("❌ V2広告セットの作成に失敗しました")
-        return
-    
+        return None
+
     # 広告をコピー
     print(f"\n広告をコピー中...")
     copied_ads = []
-    ad_account_id = adset_details.get("account_id")
-    
-    for ad in low_impression_ads:
-        new_ad_id = copy_ad_to_adset(ad["id"], v2_adset_id, ad["name"], ad_account_id)
+    ad_account_id = entry["account_id"]
+
+    for ad in entry["ads"]:
+        new_ad_id = copy_ad_to_adset(ad["id"], v2_adset_id, ad["name"], ad_account_id, creative_id=ad.get("creative_id"))
         if new_ad_id:
             copied_ads.append({
                 "original_id": ad["id"],
@@ -388,10 +456,9 @@ def process_adset(adset_id):
                 "name": ad["name"],
                 "impressions": ad["impressions"]
             })
-    
+
     # コピー履歴を保存
-    history = load_copy_history()
-    history.append({
+    append_copy_history({
         "timestamp": datetime.now().isoformat(),
         "original_adset_id": adset_id,
         "original_adset_name": adset_name,
@@ -399,8 +466,7 @@ def process_adset(adset_id):
         "v2_adset_name": f"{adset_name}V2",
         "copied_ads": copied_ads
     })
-    save_copy_history(history)
-    
+
     # Slack通知
     message = f"""✅ 広告コピー完了
 
@@ -412,24 +478,256 @@ def process_adset(adset_id):
 """
     for ad in copied_ads:
         message += f"\n  • {ad['name']} ({ad['impressions']} imp)"
-    
+
     print(f"\n{message}")
     send_slack_notification(message)
+
+    return copied_ads
+
+
+def process_adset(adset_id):
+    """広告セットを処理"""
+    print(f"\n{'='*60}")
+    print(f"広告セット処理開始: {adset_id}")
+    print(f"{'='*60}\n")
+    
+    # 広告セット詳細を取得
+    adset_details = fetch_adset_details(adset_id)
+    if not adset_details:
+        print("❌ 広告セット詳細の取得に失敗しました")
+        return
+    
+    adset_name = adset_details.get("name", "")
+    print(f"広告セット名: {adset_name}")
+    
+    # 広告を取得
+    ads = fetch_ads_in_adset(adset_id)
+    active_ads = [ad for ad in ads if ad.get("status") == "ACTIVE"]
+    print(f"広告数: {len(ads)}件 (ACTIVE: {len(active_ads)}件)")
+    
+    if not ads:
+        print("⚠️  広告が見つかりませんでした")
+        return
+    
+    # 広告セット内の全広告のインプレッションを一括取得
+    print("\n広告のインサイトを取得中...")
+    impressions_by_id = fetch_ad_impressions_bulk(adset_id)
+    if impressions_by_id is None:
+        print("❌ インサイトの取得に失敗しました")
+        return
+
+    for ad in ads:
+        print(f"  - {ad['name']}: {impressions_by_id.get(ad['id'], 0)} imp")
+
+    entry, skip_message = build_adset_plan({"id": adset_id, **adset_details}, ads, impressions_by_id)
+
+    if not entry:
+        print(f"\n{skip_message}")
+        send_slack_notification(skip_message)
+        return
+
+    print(f"\nインプレッション{IMPRESSION_THRESHOLD}以下の広告: {entry['expected_v2_size']}件")
+    print(f"コピー後に残る広告数: {entry['remaining_ads']}件（全広告で判断）")
+
+    apply_adset_plan(entry)
     
     print(f"\n{'='*60}")
     print("処理完了")
     print(f"{'='*60}\n")
 
 
+def build_copy_plan(campaign_ids=None, adset_id=None):
+    """全キャンペーン（または単一の広告セット）のコピー計画を作成
+
+    インサイトはキャンペーン単位の一括取得またはキャッシュから読み、書き込みAPIは一切呼ばない
+    """
+    plan = {
+        "created_at": datetime.now().isoformat(),
+        "impression_threshold": IMPRESSION_THRESHOLD,
+        "min_ad_count": MIN_AD_COUNT,
+        "adsets": [],
+        "skipped": []
+    }
+
+    # (一括取得の対象ID, 対象広告セット) の組を作る
+    targets = []
+    if adset_id:
+        adset_details = fetch_adset_details(adset_id)
+        if adset_details:
+            targets.append((adset_id, [{"id": adset_id, **adset_details}]))
+    else:
+        for campaign_id in campaign_ids or []:
+            adsets = fetch_active_adsets(campaign_id)
+            for adset in adsets:
+                adset.setdefault("campaign_id", campaign_id)
+            print(f"📣 キャンペーン {campaign_id}: ACTIVEな広告セット {len(adsets)}件")
+            targets.append((campaign_id, adsets))
+
+    cache = load_insights_cache()
+
+    for object_id, adsets in targets:
+        if not adsets:
+            continue
+
+        impressions_by_id = get_ad_impressions(object_id, cache)
+        if impressions_by_id is None:
+            for adset in adsets:
+                plan["skipped"].append({
+                    "adset_id": adset["id"],
+                    "adset_name": adset.get("name", ""),
+                    "reason": "インサイトの一括取得に失敗"
+                })
+            continue
+
+        ads = fetch_ads_bulk(object_id)
+        if ads is not None:
+            ads_by_adset = {adset["id"]: [] for adset in adsets}
+            for ad in ads:
+                ads_by_adset.setdefault(ad.get("adset_id"), []).append(ad)
+        elif object_id in {adset["id"] for adset in adsets}:
+            ads_by_adset = {}
+        else:
+            # キャンペーン単位の一括取得に失敗した場合は広告セットごとに取得し直す
+            print(f"↪️  キャンペーン {object_id} の広告を広告セットごとに取得し直します")
+            ads_by_adset = {adset["id"]: fetch_ads_bulk(adset["id"]) for adset in adsets}
+
+        for adset in adsets:
+            adset_ads = ads_by_adset.get(adset["id"])
+            if adset_ads is None:
+                # 取得に失敗した広告セットを「広告数不足」と区別して記録する
+                plan["skipped"].append({
+                    "adset_id": adset["id"],
+                    "adset_name": adset.get("name", ""),
+                    "reason": "広告の一括取得に失敗"
+                })
+                continue
+
+            entry, skip_message = build_adset_plan(adset, adset_ads, impressions_by_id)
+            if entry:
+                plan["adsets"].append(entry)
+            else:
+                plan["skipped"].append({
+                    "adset_id": adset["id"],
+                    "adset_name": adset.get("name", ""),
+                    "reason": skip_message
+                })
+
+    save_insights_cache(cache)
+    return plan
+
+
+def save_copy_plan(plan):
+    """コピー計画を保存"""
+    try:
+        with file_lock(COPY_PLAN_FILE):
+            atomic_write_json(COPY_PLAN_FILE, plan)
+        print(f"✅ コピー計画を保存: {COPY_PLAN_FILE}")
+        return True
+    except Exception as e:
+        print(f"コピー計画保存エラー: {e}")
+        return False
+
+
+def load_copy_plan():
+    """コピー計画を読み込み"""
+    try:
+        plan = read_json(COPY_PLAN_FILE)
+        if plan is None:
+            print(f"❌ コピー計画が見つかりません: {COPY_PLAN_FILE}")
+        return plan
+    except Exception as e:
+        print(f"コピー計画読み込みエラー: {e}")
+        return None
+
+
+def validate_copy_plan(plan):
+    """コピー計画が有効期限内かを確認（ローカルのみで検証）"""
+    created_at = datetime.fromisoformat(plan["created_at"])
+    age = datetime.now() - created_at
+    if age > timedelta(hours=COPY_PLAN_MAX_AGE_HOURS):
+        print(f"❌ コピー計画が古すぎます（作成: {plan['created_at']}、上限: {COPY_PLAN_MAX_AGE_HOURS}時間）")
+        return False
+    return True
+
+
+def apply_copy_plan(plan):
+    """コピー計画に含まれる書き込みのみを実行"""
+    results = {"applied": 0, "skipped": 0, "errors": 0}
+
+    # 計画作成後に既にコピーされた広告セットは二重実行しない
+    history = load_copy_history()
+    copied_since_plan = {
+        record.get("original_adset_id")
+        for record in history
+        if record.get("timestamp", "") >= plan["created_at"]
+    }
+
+    for entry in plan.get("adsets", []):
+        print(f"\n🎯 広告セット: {entry['adset_name']} (ID: {entry['adset_id']})")
+        print(f"   コピー予定: {entry['expected_v2_size']}件 → {entry['v2_adset_name']}")
+
+        if entry["adset_id"] in copied_since_plan:
+            print("   ⚠️  計画作成後に既にコピー済みのためスキップ")
+            results["skipped"] += 1
+            continue
+
+        if not entry.get("account_id"):
+            print("   ❌ account_idが計画に含まれていません")
+            results["errors"] += 1
+            continue
+
+        copied_ads = apply_adset_plan(entry)
+        if copied_ads is None:
+            results["errors"] += 1
+        else:
+            results["applied"] += 1
+
+    return results
+
+
+def print_plan_summary(plan):
+    """コピー計画のサマリーを表示"""
+    print(f"\n{'='*60}")
+    print(f"コピー計画（作成: {plan['created_at']}）")
+    print(f"{'='*60}")
+    for entry in plan["adsets"]:
+        print(f"  ✅ {entry['adset_name']}: {entry['expected_v2_size']}件 / {entry['total_ads']}件 → {entry['v2_adset_name']}")
+    print(f"\nコピー対象の広告セット: {len(plan['adsets'])}件")
+    print(f"コピー予定の広告: {sum(entry['expected_v2_size'] for entry in plan['adsets'])}件")
+    print(f"スキップ: {len(plan['skipped'])}件")
+
+
 def main():
     """メイン処理"""
     if not ACCESS_TOKEN:
         print("❌ ACCESS_TOKENが未設定です")
         return
     
+    # 実行モード（引数なし: 即時実行 / plan: 計画作成のみ / apply: 計画の書き込みのみ）
+    mode = sys.argv[1] if len(sys.argv) > 1 else ""
+
     # 広告セットIDを指定（環境変数または引数から取得）
     adset_id = os.getenv("TARGET_ADSET_ID")
-    
+
+    if mode == "plan":
+        campaign_ids = [cid.strip() for cid in os.getenv("CAMPAIGN_IDS", "").split(",") if cid.strip()]
+        if not adset_id and not campaign_ids:
+            print("❌ TARGET_ADSET_IDまたはCAMPAIGN_IDSが未設定です")
+            print("使い方: CAMPAIGN_IDS=123,456 python3 ad_copy_low_impression.py plan")
+            return
+        plan = build_copy_plan(campaign_ids=campaign_ids, adset_id=adset_id)
+        save_copy_plan(plan)
+        print_plan_summary(plan)
+        return
+
+    if mode == "apply":
+        plan = load_copy_plan()
+        if not plan or not validate_copy_plan(plan):
+            sys.exit(1)
+        results = apply_copy_plan(plan)
+        print(f"\n適用: {results['applied']}件 / スキップ: {results['skipped']}件 / エラー: {results['errors']}件")
+        return
+
     if not adset_id:
         print("❌ TARGET_ADSET_IDが未設定です")
         print("使い方: TARGET_ADSET_ID=123456789 python3 ad_copy_low_impression.py")
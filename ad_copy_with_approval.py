@@ -8,9 +8,15 @@ Slack承認フロー付き広告コピースクリプト
 import os
 import sys
 import json
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from slack_reaction_helper import send_slack_message_with_bot
+import approval_store
+from state import load_copy_history_records
+from slack_client import get_client
+from slack_reaction_helper import post_digest, is_digest_enabled
 
 # 環境変数を読み込み
 load_dotenv()
@@ -20,23 +26,24 @@ CAMPAIGN_IDS = os.getenv("CAMPAIGN_IDS", "").split(",")
 SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
 SLACK_CHANNEL_ID = os.getenv("SLACK_CHANNEL_ID")
 
-APPROVAL_FILE = "pending_approvals.json"
-COPY_HISTORY_FILE = "ad_copy_history.json"
+# 並列スキャンのワーカー数（Meta APIのレート制限に合わせて調整）
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "4"))
+
+# 並列実行中のログ出力が混ざらないようにするロック
+print_lock = threading.Lock()
 
 def load_copy_history():
-    """コピー履歴を読み込み"""
-    if os.path.exists(COPY_HISTORY_FILE):
-        try:
-            with open(COPY_HISTORY_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"⚠️  コピー履歴読み込みエラー: {e}")
+    """コピー履歴を読み込み（アーカイブ済みの履歴を含む、CopyHistoryRecordのリスト）"""
+    try:
+        return load_copy_history_records(include_archived=True)
+    except Exception as e:
+        print(f"⚠️  コピー履歴読み込みエラー: {e}")
     return []
 
 def is_already_copied(adset_id, copy_history):
     """広告セットが既にコピー済みかチェック"""
     for record in copy_history:
-        if record.get("original_adset_id") == adset_id:
+        if record.original_adset_id == adset_id:
             return True
     return False
 
@@ -70,7 +77,7 @@ def fetch_adsets_from_campaign(campaign_id):
     
     url = f"https://graph.facebook.com/v19.0/{campaign_id}/adsets"
     params = {
-        "fields": "id,name,effective_status",
+        "fields": "id,name,effective_status,account_id",
         "access_token": ACCESS_TOKEN,
         "limit": 100
     }
@@ -87,61 +94,69 @@ def fetch_adsets_from_campaign(campaign_id):
     except Exception as e:
         return []
 
-def count_low_impression_ads(adset_id):
-    """インプレッション500以下の広告数をカウント"""
+def scan_low_impression_ads(adset_id):
+    """広告セットの広告を1回の一覧取得でスキャンし、低インプレッション数・広告総数・スナップショットを返す
+
+    広告一覧にインサイト（全期間のインプレッション）をネストし、広告総数はsummary=total_countで取得する
+
+    Returns:
+        (low_imp_count, total_ads, snapshot_ads): snapshot_adsは全広告のID・名前・ステータス・creative_id・インプレッション
+    """
     if not ACCESS_TOKEN:
-        return 0
+        return 0, 0, []
+    
+    # 全期間のデータを取得（過去2年間）
+    since = (datetime.now() - timedelta(days=730)).strftime("%Y-%m-%d")
+    until = datetime.now().strftime("%Y-%m-%d")
+    time_range = json.dumps({"since": since, "until": until}, separators=(",", ":"))
     
-    # 広告を取得
     url = f"https://graph.facebook.com/v19.0/{adset_id}/ads"
     params = {
-        "fields": "id,name,effective_status",
+        "fields": f"id,name,effective_status,creative{{id}},insights.time_range({time_range}){{impressions}}",
+        "summary": "total_count",
         "access_token": ACCESS_TOKEN,
         "limit": 100
     }
     
     try:
-        res = requests.get(url, params=params)
-        data = res.json()
-        
-        if "error" in data:
-            return 0
-        
-        ads = data.get("data", [])
-        active_ads = [ad for ad in ads if ad.get("effective_status") == "ACTIVE"]
+        ads = []
+        total_ads = None
+        while url:
+            res = requests.get(url, params=params)
+            data = res.json()
+            
+            if "error" in data:
+                return 0, 0, []
+            
+            ads.extend(data.get("data", []))
+            if total_ads is None:
+                total_ads = data.get("summary", {}).get("total_count")
+            url = data.get("paging", {}).get("next")
+            params = {}  # 次のページではparamsは不要
         
-        # インサイトを取得
         low_imp_count = 0
-        for ad in active_ads:
-            ad_id = ad["id"]
-            # 全期間のデータを取得（過去2年間）
-            from datetime import datetime, timedelta
-            import json as json_lib
-            since = (datetime.now() - timedelta(days=730)).strftime("%Y-%m-%d")
-            until = datetime.now().strftime("%Y-%m-%d")
+        snapshot_ads = []
+        for ad in ads:
+            # 配信実績のない広告にはinsightsが付かない。承認リクエストの件数には従来どおり数えず、
+            # スナップショットにはコピー実行時（ad_copy_low_impression.py）と同じく0 impとして記録する
+            insights = ad.get("insights", {}).get("data", [])
+            impressions = int(insights[0].get("impressions", 0)) if insights else 0
             
-            insights_url = f"https://graph.facebook.com/v19.0/{ad_id}/insights"
-            insights_params = {
-                "fields": "impressions",
-                "time_range": json_lib.dumps({"since": since, "until": until}),
-                "access_token": ACCESS_TOKEN
-            }
+            if insights and ad.get("effective_status") == "ACTIVE" and impressions <= 500:
+                low_imp_count += 1
             
-            try:
-                insights_res = requests.get(insights_url, params=insights_params)
-                insights_data = insights_res.json()
-                
-                if "data" in insights_data and len(insights_data["data"]) > 0:
-                    impressions = int(insights_data["data"][0].get("impressions", 0))
-                    if impressions <= 500:
-                        low_imp_count += 1
-            except:
-                pass
+            snapshot_ads.append({
+                "id": ad["id"],
+                "name": ad.get("name", ""),
+                "status": ad.get("effective_status"),
+                "creative_id": ad.get("creative", {}).get("id"),
+                "impressions": impressions
+            })
         
-        return low_imp_count
+        return low_imp_count, total_ads if total_ads is not None else len(ads), snapshot_ads
     
     except Exception as e:
-        return 0
+        return 0, 0, []
 
 def send_approval_request(campaign_name, adset_id, adset_name, low_imp_count, total_ads):
     """Slackに承認リクエストを送信"""
@@ -150,9 +165,6 @@ def send_approval_request(campaign_name, adset_id, adset_name, low_imp_count, to
         return None
     
     try:
-        from slack_sdk import WebClient
-        client = WebClient(token=SLACK_BOT_TOKEN)
-        
         # Block Kitメッセージを作成
         blocks = [
             {
@@ -200,12 +212,17 @@ def send_approval_request(campaign_name, adset_id, adset_name, low_imp_count, to
             }
         ]
         
-        response = client.chat_postMessage(
-            channel=SLACK_CHANNEL_ID,
-            blocks=blocks,
-            text=f"広告コピー承認リクエスト: {adset_name}"
+        # 共有クライアント経由で送信（並列スキャン中もレート制限内で順に送信される）
+        response = get_client().post_message(
+            SLACK_CHANNEL_ID,
+            f"広告コピー承認リクエスト: {adset_name}",
+            blocks=blocks
         )
         
+        if not response.get("ok") or not response.get("ts"):
+            print(f"❌ Slack承認リクエスト送信失敗: {response.get('error')}")
+            return None
+        
         message_ts = response['ts']
         print(f"✅ Slack承認リクエスト送信成功: {message_ts}")
         
@@ -215,14 +232,140 @@ def send_approval_request(campaign_name, adset_id, adset_name, low_imp_count, to
         print(f"❌ Slack承認リクエスト送信エラー: {e}")
         return None
 
-def save_approval_data(approvals):
-    """承認データを保存"""
+def send_approval_digest(approvals):
+    """承認リクエストをキャンペーンごとに1通にまとめて送信し、送信できたものを承認ストアに登録
+
+    メッセージへの✅/❌はそのメッセージに載っている全広告セットに適用される
+
+    Returns:
+        送信・登録した承認データのリスト
+    """
+    by_campaign = {}
+    for approval in approvals:
+        by_campaign.setdefault(approval["campaign_id"], []).append(approval)
+    
+    footer = "👍 このメッセージに絵文字でリアクション: ✅ = 全件のコピーを承認 | ❌ = 全件を却下"
+    sent = []
+    for campaign_approvals in by_campaign.values():
+        campaign_name = campaign_approvals[0]["campaign_name"]
+        item_blocks = [
+            {
+                "type": "section",
+                "text": {
+                    "type": "mrkdwn",
+                    "text": (
+                        f"*{approval['adset_name']}*\n"
+                        f"広告セットID: `{approval['adset_id']}`　"
+                        f"インプレッション500以下: {approval['low_imp_count']}件 / {approval['total_ads']}件"
+                    )
+                }
+            }
+            for approval in campaign_approvals
+        ]
+        message_ts_list = post_digest(
+            f"🔄 広告コピー承認リクエスト: {campaign_name}",
+            item_blocks,
+            f"広告コピー承認リクエスト: {campaign_name}",
+            footer
+        )
+        for approval, message_ts in zip(campaign_approvals, message_ts_list):
+            if message_ts:
+                approval.update(message_ts=message_ts, digest=True)
+                sent.append(approval)
+    
+    # 送信できた分を1回でまとめて登録
+    if sent:
+        approval_store.save_approvals(sent)
+    return sent
+
+def scan_campaign(campaign_id):
+    """キャンペーン情報と広告セット一覧を取得"""
+    campaign_info = fetch_campaign_info(campaign_id)
+    if not campaign_info:
+        return None
+    
+    return campaign_info.get("name", "不明"), fetch_adsets_from_campaign(campaign_id)
+
+def process_adset_for_approval(campaign_id, campaign_name, adset, copy_history):
+    """広告セットをスキャンし、条件を満たせばその場で承認リクエストを送信
+
+    まとめ通知モードでは送信せずに承認データだけを返し、スキャン後にまとめて送信する。
+    ログは並列実行中に混ざらないよう広告セット単位でまとめて出力する
+
+    Returns:
+        承認データ（承認リクエストの対象外の場合はNone）
+    """
+    adset_id = adset["id"]
+    adset_name = adset["name"]
+    adset_status = adset.get("effective_status", "不明")
+    logs = [
+        f"\n  🎯 広告セット: {adset_name} (キャンペーン: {campaign_name})",
+        f"     ID: {adset_id}",
+        f"     ステータス: {adset_status}",
+    ]
+    
     try:
-        with open(APPROVAL_FILE, "w", encoding="utf-8") as f:
-            json.dump(approvals, f, ensure_ascii=False, indent=2)
-        print(f"✅ 承認データを保存: {APPROVAL_FILE}")
-    except Exception as e:
-        print(f"❌ 承認データ保存エラー: {e}")
+        # インプレッション500以下の広告数と広告総数を同じ一覧取得から算出
+        scanned_at = datetime.now().isoformat()
+        low_imp_count, total_ads, snapshot_ads = scan_low_impression_ads(adset_id)
+        
+        logs.append(f"     インプレッション500以下: {low_imp_count}件 / {total_ads}件")
+        
+        # コピー済みかチェック
+        if is_already_copied(adset_id, copy_history):
+            logs.append(f"     ⚠️  既にコピー済みのためスキップ")
+            return None
+        
+        if low_imp_count == 0:
+            logs.append(f"     ⚠️  インプレッション500以下の広告がないためスキップ")
+            return None
+        
+        if low_imp_count <= 3:
+            logs.append(f"     ⚠️  インプレッション500以下の広告が3件以下のためスキップ")
+            return None
+        
+        approval = {
+            "campaign_id": campaign_id,
+            "campaign_name": campaign_name,
+            "adset_id": adset_id,
+            "adset_name": adset_name,
+            "low_imp_count": low_imp_count,
+            "total_ads": total_ads,
+            "status": "pending"
+        }
+        # コピー実行時に再スキャンせずに済むよう、スキャン結果を保存
+        if snapshot_ads:
+            approval["scan_snapshot"] = {
+                "scanned_at": scanned_at,
+                "account_id": adset.get("account_id"),
+                "ads": snapshot_ads
+            }
+        
+        if is_digest_enabled():
+            logs.append(f"     📝 承認リクエストはスキャン後にまとめて送信します")
+            return approval
+        
+        # Slackに承認リクエストを送信
+        message_ts = send_approval_request(
+            campaign_name,
+            adset_id,
+            adset_name,
+            low_imp_count,
+            total_ads
+        )
+        
+        if not message_ts:
+            return None
+        
+        approval["message_ts"] = message_ts
+        # 送信した時点で承認ストアに登録（後続の失敗で承認待ちが失われないように）
+        approval_store.add_approval(approval)
+        logs.append(f"     ✅ 承認リクエストを送信しました")
+        return approval
+    
+    finally:
+        with print_lock:
+            print("\n".join(logs))
 
 def main():
     """メイン処理"""
@@ -243,92 +386,55 @@ def main():
     # コピー履歴を読み込み
     copy_history = load_copy_history()
     print(f"\n📋 コピー履歴: {len(copy_history)}件")
+    print(f"🧵 並列スキャン: 最大{SCAN_WORKERS}ワーカー")
     
-    # 各キャンペーンを処理
-    for campaign_id in CAMPAIGN_IDS:
-        campaign_id = campaign_id.strip()
-        if not campaign_id:
-            continue
-        
-        # キャンペーン情報を取得
-        campaign_info = fetch_campaign_info(campaign_id)
-        if not campaign_info:
-            print(f"\n❌ キャンペーン {campaign_id} の情報取得に失敗")
-            continue
-        
-        campaign_name = campaign_info.get("name", "不明")
-        print(f"\n📣 キャンペーン: {campaign_name}")
-        print(f"   ID: {campaign_id}")
-        
-        # 広告セットを取得
-        adsets = fetch_adsets_from_campaign(campaign_id)
-        print(f"   広告セット数: {len(adsets)}")
+    campaign_ids = [cid.strip() for cid in CAMPAIGN_IDS if cid.strip()]
+    
+    # キャンペーンと広告セットを同じワーカープールでスキャン
+    # キャンペーンの広告セット一覧が取れ次第、広告セットのスキャンを投入する
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as executor:
+        pending = {
+            executor.submit(scan_campaign, campaign_id): ("campaign", campaign_id)
+            for campaign_id in campaign_ids
+        }
         
-        # 各広告セットの承認リクエストを送信
-        for adset in adsets:
-            adset_id = adset["id"]
-            adset_name = adset["name"]
-            adset_status = adset.get("effective_status", "不明")
-            
-            print(f"\n  🎯 広告セット: {adset_name}")
-            print(f"     ID: {adset_id}")
-            print(f"     ステータス: {adset_status}")
-            
-            # インプレッション500以下の広告数をカウント
-            print(f"     インプレッション500以下の広告を確認中...")
-            low_imp_count = count_low_impression_ads(adset_id)
-            
-            # 広告総数を取得（簡易版）
-            total_ads_url = f"https://graph.facebook.com/v19.0/{adset_id}/ads"
-            total_ads_params = {
-                "fields": "id",
-                "access_token": ACCESS_TOKEN,
-                "limit": 100
-            }
-            total_ads_res = requests.get(total_ads_url, params=total_ads_params)
-            total_ads_data = total_ads_res.json()
-            total_ads = len(total_ads_data.get("data", []))
-            
-            print(f"     インプレッション500以下: {low_imp_count}件 / {total_ads}件")
-            
-            # コピー済みかチェック
-            if is_already_copied(adset_id, copy_history):
-                print(f"     ⚠️  既にコピー済みのためスキップ")
-                continue
-            
-            if low_imp_count == 0:
-                print(f"     ⚠️  インプレッション500以下の広告がないためスキップ")
-                continue
-            
-            if low_imp_count <= 3:
-                print(f"     ⚠️  インプレッション500以下の広告が3件以下のためスキップ")
-                continue
-            
-            # Slackに承認リクエストを送信
-            message_ts = send_approval_request(
-                campaign_name,
-                adset_id,
-                adset_name,
-                low_imp_count,
-                total_ads
-            )
-            
-            if message_ts:
-                approvals.append({
-                    "campaign_id": campaign_id,
-                    "campaign_name": campaign_name,
-                    "adset_id": adset_id,
-                    "adset_name": adset_name,
-                    "low_imp_count": low_imp_count,
-                    "total_ads": total_ads,
-                    "message_ts": message_ts,
-                    "status": "pending"
-                })
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, target_id = pending.pop(future)
+                
+                try:
+                    result = future.result()
+                except Exception as e:
+                    with print_lock:
+                        print(f"\n❌ スキャンエラー ({target_id}): {e}")
+                    continue
+                
+                if kind == "adset":
+                    if result:
+                        approvals.append(result)
+                    continue
+                
+                if not result:
+                    with print_lock:
+                        print(f"\n❌ キャンペーン {target_id} の情報取得に失敗")
+                    continue
+                
+                campaign_name, adsets = result
+                with print_lock:
+                    print(f"\n📣 キャンペーン: {campaign_name}")
+                    print(f"   ID: {target_id}")
+                    print(f"   広告セット数: {len(adsets)}")
+                
+                for adset in adsets:
+                    future = executor.submit(process_adset_for_approval, target_id, campaign_name, adset, copy_history)
+                    pending[future] = ("adset", adset["id"])
+    
+    if approvals and is_digest_enabled():
+        approvals = send_approval_digest(approvals)
     
-    # 承認データを保存
     if approvals:
-        save_approval_data(approvals)
-        print(f"\n✅ {len(approvals)}件の承認リクエストを送信しました")
+        print(f"\n✅ {len(approvals)}件の承認リクエストを送信しました（保存先: {approval_store.store_path()}）")
         print(f"Slackで✅または❌でリアクションしてください")
     else:
         print(f"\n⚠️  承認リクエストを送信する広告セットがありませんでした")
@@ -0,0 +1,967 @@
+#!/usr/bin/env python3
+"""
+承認データストア
+
+停止承認（meta_abtest_runner.py）と広告コピー承認（ad_copy_with_approval.py）の
+レコードを1か所に保存し、全コンポーネントはこのモジュールのAPI経由で承認データを読み書きする。
+
+バックエンドは APPROVAL_STORE_BACKEND で選択する:
+    sqlite   （デフォルト）approvals.db。ad_id / status / (adset_id, message_ts) にインデックス
+    eventlog approvals.jsonl。状態変更を1行ずつ追記するイベントログ（event_log.py）
+
+既存のpending_approvals.jsonは初回接続時に自動で取り込まれる。
+手動で取り込む場合:
+    python3 approval_store.py import pending_approvals.json
+"""
+
+import os
+import sys
+import atexit
+import time
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime
+
+import serialization
+from event_log import EventLog
+from local_state import file_signature, read_json
+
+APPROVAL_STORE_BACKEND = os.getenv("APPROVAL_STORE_BACKEND", "sqlite")
+APPROVAL_DB_FILE = os.getenv("APPROVAL_DB_FILE", "approvals.db")
+APPROVAL_LOG_FILE = os.getenv("APPROVAL_LOG_FILE", "approvals.jsonl")
+LEGACY_APPROVAL_FILE = "pending_approvals.json"
+
+# 変更フィード（Web UIのライブ更新用）に残す直近の変更件数
+CHANGE_FEED_SIZE = int(os.getenv("APPROVAL_CHANGE_FEED_SIZE", "1000"))
+
+# 検索用に列として持つフィールド（レコード本体はdata列にJSONで保存）
+INDEXED_FIELDS = ("ad_id", "adset_id", "message_ts", "status", "created_at")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS approvals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ad_id TEXT,
+    adset_id TEXT,
+    message_ts TEXT,
+    status TEXT,
+    created_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_approvals_ad_id ON approvals(ad_id);
+CREATE INDEX IF NOT EXISTS idx_approvals_status ON approvals(status);
+CREATE INDEX IF NOT EXISTS idx_approvals_adset_message ON approvals(adset_id, message_ts);
+CREATE INDEX IF NOT EXISTS idx_approvals_message_ts ON approvals(message_ts);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS approval_counts (
+    status TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (status, kind)
+);
+CREATE TRIGGER IF NOT EXISTS approvals_count_insert AFTER INSERT ON approvals BEGIN
+    {increment_new}
+END;
+CREATE TRIGGER IF NOT EXISTS approvals_count_delete AFTER DELETE ON approvals BEGIN
+    {decrement_old}
+END;
+CREATE TRIGGER IF NOT EXISTS approvals_count_update AFTER UPDATE OF status, ad_id, adset_id, message_ts ON approvals BEGIN
+    {decrement_old}
+    {increment_new}
+END;
+CREATE TABLE IF NOT EXISTS approval_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    approval_id INTEGER NOT NULL,
+    ad_id TEXT,
+    status TEXT
+);
+CREATE TRIGGER IF NOT EXISTS approvals_change_insert AFTER INSERT ON approvals BEGIN
+    INSERT INTO approval_changes (approval_id, ad_id, status) VALUES (NEW.id, NEW.ad_id, NEW.status);
+END;
+CREATE TRIGGER IF NOT EXISTS approvals_change_update AFTER UPDATE ON approvals BEGIN
+    INSERT INTO approval_changes (approval_id, ad_id, status) VALUES (NEW.id, NEW.ad_id, NEW.status);
+END;
+CREATE TRIGGER IF NOT EXISTS approvals_change_delete AFTER DELETE ON approvals BEGIN
+    INSERT INTO approval_changes (approval_id, ad_id, status) VALUES (OLD.id, OLD.ad_id, NULL);
+END;
+CREATE TRIGGER IF NOT EXISTS approval_changes_trim AFTER INSERT ON approval_changes BEGIN
+    DELETE FROM approval_changes WHERE seq <= NEW.seq - {change_feed_size};
+END;
+"""
+
+
+# 件数の集計に使う承認の種類（matches_kindと同じ判定）
+def _kind_sql(row):
+    return (
+        f"CASE WHEN {row}.ad_id IS NOT NULL THEN 'stop' "
+        f"WHEN {row}.adset_id IS NOT NULL AND {row}.message_ts IS NOT NULL THEN 'copy' ELSE '' END"
+    )
+
+
+# ステータス・種類ごとの件数はトリガーで増減させ、集計のたびに全件を数えない
+SCHEMA = SCHEMA.format(
+    increment_new=(
+        "INSERT INTO approval_counts (status, kind, n) "
+        f"VALUES (COALESCE(NEW.status, ''), {_kind_sql('NEW')}, 1) "
+        "ON CONFLICT (status, kind) DO UPDATE SET n = n + 1;"
+    ),
+    decrement_old=(
+        "UPDATE approval_counts SET n = n - 1 "
+        f"WHERE status = COALESCE(OLD.status, '') AND kind = {_kind_sql('OLD')};"
+    ),
+    # 変更フィード（approval_changes）は直近CHANGE_FEED_SIZE件だけ残す
+    change_feed_size=CHANGE_FEED_SIZE,
+)
+
+
+def _str_or_none(value):
+    return None if value is None else str(value)
+
+
+def _pending_index(records):
+    """ad_id → 承認待ちレコード の辞書（同じad_idが複数ある場合は最後のものを使う）"""
+    return {str(record["ad_id"]): record for record in records if record.get("ad_id") is not None}
+
+
+def _upsert_fields(record):
+    """既存の承認待ちレコードに上書きするフィールド（登録日時と承認情報は残す）"""
+    return {
+        k: v for k, v in record.items()
+        if k not in ("id", "created_at", "approved_at", "approved_by")
+    }
+
+
+def approval_kind(record):
+    """承認の種類（"stop" / "copy" / どちらでもない場合は ""）"""
+    if record.get("ad_id") is not None:
+        return "stop"
+    if record.get("adset_id") is not None and record.get("message_ts") is not None:
+        return "copy"
+    return ""
+
+
+def _count_summary(counts, kind):
+    """{(status, kind): 件数} をステータスごとの件数にまとめる"""
+    summary = {}
+    for (status, record_kind), n in counts.items():
+        if n and (kind is None or record_kind == kind):
+            status = status if status else "(missing)"
+            summary[status] = summary.get(status, 0) + n
+    return summary
+
+
+def matches_kind(record, kind):
+    """kind: "stop"=停止承認（ad_idあり）/ "copy"=広告コピー承認（adset_id+message_tsあり）"""
+    if kind == "stop":
+        return record.get("ad_id") is not None
+    if kind == "copy":
+        return (
+            record.get("ad_id") is None
+            and record.get("adset_id") is not None
+            and record.get("message_ts") is not None
+        )
+    return True
+
+
+# --- SQLiteバックエンド ---
+class SQLiteBackend:
+    """approvals.db に保存するバックエンド"""
+
+    def __init__(self, path):
+        self.path = path
+        # 接続はスレッドごとに作る（Flaskのスレッドや並列スキャンから利用されるため）
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._checkpoint_registered = False
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def files(self):
+        """データの変更で更新されるファイル（コミット済みの書き込みはまずWALに入る）"""
+        return (self.path, self.path + "-wal")
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+
+        with self._init_lock:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            # WALモード: 読み込みは書き込みをブロックせず、書き込み中も直前のコミット時点を読める
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.executescript(SCHEMA)
+            self._init_counts(conn)
+            self._local.conn = conn
+            if not self._checkpoint_registered:
+                atexit.register(self.checkpoint)
+                self._checkpoint_registered = True
+        return conn
+
+    @staticmethod
+    def _init_counts(conn):
+        """件数テーブルを導入する前のDBは、最初に一度だけ全件から集計する"""
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'approval_counts'").fetchone():
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not conn.execute("SELECT 1 FROM meta WHERE key = 'approval_counts'").fetchone():
+                conn.execute("DELETE FROM approval_counts")
+                conn.execute(
+                    "INSERT INTO approval_counts (status, kind, n) "
+                    f"SELECT COALESCE(status, ''), {_kind_sql('approvals')}, COUNT(*) FROM approvals GROUP BY 1, 2"
+                )
+                conn.execute("INSERT INTO meta (key, value) VALUES ('approval_counts', '1')")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def checkpoint(self):
+        """WALの内容を本体に書き戻す（approvals.db単体をgitにコミットできるように）"""
+        try:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"承認データのチェックポイントエラー: {e}")
+
+    def transaction(self):
+        """書き込みトランザクション（BEGIN IMMEDIATEで他プロセスの書き込みと直列化）"""
+        backend = self
+
+        class _Transaction:
+            def __enter__(self):
+                self.conn = backend.connection()
+                self.conn.execute("BEGIN IMMEDIATE")
+                return self.conn
+
+            def __exit__(self, exc_type, exc, tb):
+                self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+                return False
+
+        return _Transaction()
+
+    @staticmethod
+    def _row_to_record(row):
+        record = serialization.loads_json(row["data"])
+        record["id"] = row["id"]
+        return record
+
+    @staticmethod
+    def _columns(record):
+        return tuple(_str_or_none(record.get(field)) for field in INDEXED_FIELDS)
+
+    @staticmethod
+    def _serialize(record):
+        return serialization.dumps_json({k: v for k, v in record.items() if k != "id"}).decode("utf-8")
+
+    @staticmethod
+    def _kind_clause(kind):
+        if kind == "stop":
+            return "ad_id IS NOT NULL"
+        if kind == "copy":
+            return "ad_id IS NULL AND adset_id IS NOT NULL AND message_ts IS NOT NULL"
+        return None
+
+    def load_approvals(self, status=None, kind=None):
+        return list(self.iter_approvals(status=status, kind=kind))
+
+    def iter_approvals(self, status=None, kind=None):
+        clauses, params = [], []
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        kind_clause = self._kind_clause(kind)
+        if kind_clause:
+            clauses.append(kind_clause)
+
+        sql = "SELECT id, data FROM approvals"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY id"
+
+        # 行は1件ずつ読み込む（大量件数でも全行を一度にメモリに載せない）
+        for row in self.connection().execute(sql, params):
+            yield self._row_to_record(row)
+
+    def get_by_ad_id(self, ad_id, status=None):
+        sql = "SELECT id, data FROM approvals WHERE ad_id = ?"
+        params = [str(ad_id)]
+        if status is not None:
+            sql += " AND status = ?"
+            params.append(status)
+        row = self.connection().execute(sql + " ORDER BY id LIMIT 1", params).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def get_approval(self, record_id):
+        row = self.connection().execute("SELECT id, data FROM approvals WHERE id = ?", (record_id,)).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def find_by_message(self, adset_id, message_ts):
+        row = self.connection().execute(
+            "SELECT id, data FROM approvals WHERE adset_id = ? AND message_ts = ? ORDER BY id LIMIT 1",
+            (str(adset_id), str(message_ts)),
+        ).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def find_by_message_ts(self, message_ts):
+        row = self.connection().execute(
+            "SELECT id, data FROM approvals WHERE message_ts = ? ORDER BY id LIMIT 1",
+            (str(message_ts),),
+        ).fetchone()
+        return self._row_to_record(row) if row else None
+
+    def find_all_by_message_ts(self, message_ts):
+        rows = self.connection().execute(
+            "SELECT id, data FROM approvals WHERE message_ts = ? ORDER BY id",
+            (str(message_ts),),
+        ).fetchall()
+        return [self._row_to_record(row) for row in rows]
+
+    def page_approvals(self, status, kind=None, offset=0, limit=50):
+        clauses, params = ["status = ?"], [status]
+        kind_clause = self._kind_clause(kind)
+        if kind_clause:
+            clauses.append(kind_clause)
+        rows = self.connection().execute(
+            "SELECT id, data FROM approvals WHERE " + " AND ".join(clauses) + " ORDER BY id DESC LIMIT ? OFFSET ?",
+            params + [limit, offset],
+        ).fetchall()
+        return [self._row_to_record(row) for row in rows]
+
+    def count_by_status(self, kind=None):
+        rows = self.connection().execute("SELECT status, kind, n FROM approval_counts").fetchall()
+        return _count_summary({(row["status"], row["kind"]): row["n"] for row in rows}, kind)
+
+    def changes_since(self, cursor):
+        conn = self.connection()
+        latest = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM approval_changes").fetchone()[0]
+        try:
+            seq = int(cursor)
+        except (TypeError, ValueError):
+            return None, str(latest)
+        if seq == latest:
+            return [], cursor
+        # 古い変更が削除済み、またはDBが作り直された場合は差分を返せない
+        if seq > latest or not conn.execute("SELECT 1 FROM approval_changes WHERE seq <= ? + 1 LIMIT 1", (seq,)).fetchone():
+            return None, str(latest)
+        rows = conn.execute(
+            "SELECT seq, approval_id, ad_id, status FROM approval_changes WHERE seq > ? AND seq <= ? ORDER BY seq",
+            (seq, latest),
+        ).fetchall()
+        changes = [{"id": row["approval_id"], "ad_id": row["ad_id"], "status": row["status"]} for row in rows]
+        return changes, str(latest)
+
+    def _insert(self, conn, record):
+        cur = conn.execute(
+            "INSERT INTO approvals (ad_id, adset_id, message_ts, status, created_at, data) VALUES (?, ?, ?, ?, ?, ?)",
+            self._columns(record) + (self._serialize(record),),
+        )
+        record["id"] = cur.lastrowid
+        return cur.lastrowid
+
+    def _update(self, conn, record_id, fields):
+        row = conn.execute("SELECT id, data FROM approvals WHERE id = ?", (record_id,)).fetchone()
+        if not row:
+            return False
+        record = self._row_to_record(row)
+        record.update(fields)
+        conn.execute(
+            "UPDATE approvals SET ad_id = ?, adset_id = ?, message_ts = ?, status = ?, created_at = ?, data = ? WHERE id = ?",
+            self._columns(record) + (self._serialize(record), record_id),
+        )
+        return True
+
+    def add_approval(self, record):
+        with self.transaction() as conn:
+            return self._insert(conn, record)
+
+    def update_approval(self, record_id, **fields):
+        with self.transaction() as conn:
+            return self._update(conn, record_id, fields)
+
+    def update_approval_if(self, record_id, expected, **fields):
+        with self.transaction() as conn:
+            row = conn.execute("SELECT id, data FROM approvals WHERE id = ?", (record_id,)).fetchone()
+            record = self._row_to_record(row) if row else None
+            if record is None or any(record.get(k) != v for k, v in expected.items()):
+                return False
+            return self._update(conn, record_id, fields)
+
+    def transition_status(self, ad_id, from_status, to_status, **fields):
+        return bool(self.transition_many([ad_id], from_status, to_status, **fields))
+
+    def transition_many(self, ad_ids, from_status, to_status, **fields):
+        updated = []
+        with self.transaction() as conn:
+            for ad_id in dict.fromkeys(ad_ids):
+                row = conn.execute(
+                    "SELECT id FROM approvals WHERE ad_id = ? AND status = ? ORDER BY id LIMIT 1",
+                    (str(ad_id), from_status),
+                ).fetchone()
+                if row and self._update(conn, row["id"], dict(fields, status=to_status)):
+                    updated.append(ad_id)
+        return updated
+
+    def save_approvals(self, records):
+        with self.transaction() as conn:
+            for record in records:
+                if record.get("id") is not None:
+                    fields = {k: v for k, v in record.items() if k != "id"}
+                    if self._update(conn, record["id"], fields):
+                        continue
+                self._insert(conn, record)
+        return True
+
+    def upsert_pending(self, records):
+        with self.transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, ad_id FROM approvals WHERE status = 'pending' AND ad_id IS NOT NULL ORDER BY id"
+            ).fetchall()
+            existing = {row["ad_id"]: row["id"] for row in rows}
+
+            added, updated = [], []
+            for ad_id, record in records.items():
+                if ad_id in existing:
+                    self._update(conn, existing[ad_id], _upsert_fields(record))
+                    record["id"] = existing[ad_id]
+                    updated.append(ad_id)
+                else:
+                    existing[ad_id] = self._insert(conn, record)
+                    added.append(ad_id)
+        return added, updated
+
+    def archive_records(self, statuses, select, archive):
+        with self.transaction() as conn:
+            placeholders = ", ".join("?" for _ in statuses)
+            rows = conn.execute(
+                f"SELECT id, data FROM approvals WHERE status IN ({placeholders}) ORDER BY id",
+                tuple(statuses),
+            ).fetchall()
+            records = [record for record in map(self._row_to_record, rows) if select(record)]
+            if not records:
+                return 0
+            # アーカイブへの書き込みが失敗した場合はロールバックされ、レコードは残る
+            archive(records)
+            conn.executemany("DELETE FROM approvals WHERE id = ?", [(record["id"],) for record in records])
+        return len(records)
+
+    def import_entries(self, entries, import_key):
+        with self.transaction() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = ?", (import_key,)).fetchone():
+                return 0
+            for entry in entries:
+                self._insert(conn, entry)
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?)",
+                (import_key, datetime.now().isoformat()),
+            )
+        return len(entries)
+
+
+# --- イベントログバックエンド ---
+class EventLogBackend:
+    """approvals.jsonl に状態変更を追記するバックエンド
+
+    メモリ上に ad_id / status / message_ts のインデックスを持ち、
+    ログの差分読み込みに合わせて更新する。
+    変更フィードもメモリ上に持つので、カーソルは発行したプロセスの中でだけ有効
+    """
+
+    META_PREFIX = "meta:"
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._last_id = 0
+        self._by_ad_id = {}
+        self._by_status = {}
+        self._by_message = {}
+        self._counts = {}
+        self._changes = deque(maxlen=CHANGE_FEED_SIZE)
+        self._change_seq = 0
+        # カーソルにプロセスごとの値を含め、別プロセスのカーソルを受け取った場合は差分を返さない
+        self._feed_id = time.time_ns()
+        self._loaded = False
+        self.log = EventLog(path, on_reset=self._rebuild_indexes, on_change=self._update_indexes)
+
+    def exists(self):
+        return any(os.path.exists(path) for path in self.files())
+
+    def files(self):
+        return (self.log.path, self.log.segment_path, self.log.snapshot_path)
+
+    # インデックスはキー（レコードID）の辞書を順序付き集合として使う
+    @staticmethod
+    def _index_keys(record):
+        return (
+            _str_or_none(record.get("ad_id")),
+            record.get("status"),
+            _str_or_none(record.get("message_ts")),
+        )
+
+    def _rebuild_indexes(self, records):
+        # ログを読み直す前の状態と比べ、読み直しで変わったレコードを変更フィードに載せる
+        previous = self._indexed_state() if self._loaded else None
+        self._by_ad_id, self._by_status, self._by_message = {}, {}, {}
+        self._counts = {}
+        for key, record in records.items():
+            if isinstance(key, int):
+                self._index(key, None, record)
+        if previous is not None:
+            current = self._indexed_state()
+            for key in previous.keys() | current.keys():
+                if previous.get(key) != current.get(key):
+                    ad_id, status = current.get(key) or (previous[key][0], None)
+                    self._add_change(key, ad_id, status)
+        self._loaded = True
+
+    def _indexed_state(self):
+        """レコードID → (ad_id, status)（インデックスから組み立てる）"""
+        state = {}
+        for status, keys in self._by_status.items():
+            for key in keys:
+                state[key] = (None, status)
+        for ad_id, keys in self._by_ad_id.items():
+            for key in keys:
+                state[key] = (ad_id, state[key][1])
+        return state
+
+    def _update_indexes(self, key, old, new):
+        if not isinstance(key, int) or (old is None and new is None):
+            return
+        self._index(key, old, new)
+        self._add_change(
+            key,
+            _str_or_none((new if new is not None else old).get("ad_id")),
+            new.get("status") if new is not None else None,
+        )
+
+    def _index(self, key, old, new):
+        if old is not None:
+            ad_id, status, message = self._index_keys(old)
+            self._by_ad_id.get(ad_id, {}).pop(key, None)
+            self._by_status.get(status, {}).pop(key, None)
+            self._by_message.get(message, {}).pop(key, None)
+            count_key = (status or "", approval_kind(old))
+            self._counts[count_key] = self._counts.get(count_key, 0) - 1
+        if new is not None:
+            ad_id, status, message = self._index_keys(new)
+            self._by_ad_id.setdefault(ad_id, {})[key] = True
+            self._by_status.setdefault(status, {})[key] = True
+            self._by_message.setdefault(message, {})[key] = True
+            count_key = (status or "", approval_kind(new))
+            self._counts[count_key] = self._counts.get(count_key, 0) + 1
+
+    def _add_change(self, key, ad_id, status):
+        self._change_seq += 1
+        self._changes.append((self._change_seq, {"id": key, "ad_id": ad_id, "status": status}))
+
+    def _records(self):
+        return self.log.records()
+
+    def _record(self, key):
+        record = dict(self._records()[key])
+        record["id"] = key
+        return record
+
+    def _new_id(self):
+        # プロセス間でも衝突しにくいよう時刻（マイクロ秒）ベースで採番
+        # JavaScriptで精度が落ちないよう2^53未満に収める
+        with self._lock:
+            self._last_id = max(time.time_ns() // 1000, self._last_id + 1)
+            return self._last_id
+
+    def load_approvals(self, status=None, kind=None):
+        return list(self.iter_approvals(status=status, kind=kind))
+
+    def iter_approvals(self, status=None, kind=None):
+        with self._lock:
+            records = self._records()
+            if status is not None:
+                keys = sorted(self._by_status.get(status, {}))
+            else:
+                keys = [key for key in records if isinstance(key, int)]
+        for key in keys:
+            record = records.get(key)
+            if record is not None and matches_kind(record, kind):
+                yield dict(record, id=key)
+
+    def get_by_ad_id(self, ad_id, status=None):
+        with self._lock:
+            records = self._records()
+            for key in sorted(self._by_ad_id.get(str(ad_id), {})):
+                if status is None or records[key].get("status") == status:
+                    return self._record(key)
+        return None
+
+    def get_approval(self, record_id):
+        with self._lock:
+            return self._record(record_id) if record_id in self._records() else None
+
+    def find_by_message(self, adset_id, message_ts):
+        with self._lock:
+            records = self._records()
+            for key in sorted(self._by_message.get(str(message_ts), {})):
+                if _str_or_none(records[key].get("adset_id")) == str(adset_id):
+                    return self._record(key)
+        return None
+
+    def find_by_message_ts(self, message_ts):
+        with self._lock:
+            self._records()
+            keys = sorted(self._by_message.get(str(message_ts), {}))
+            return self._record(keys[0]) if keys else None
+
+    def find_all_by_message_ts(self, message_ts):
+        with self._lock:
+            self._records()
+            return [self._record(key) for key in sorted(self._by_message.get(str(message_ts), {}))]
+
+    def page_approvals(self, status, kind=None, offset=0, limit=50):
+        with self._lock:
+            records = self._records()
+            keys = [
+                key for key in sorted(self._by_status.get(status, {}), reverse=True)
+                if matches_kind(records[key], kind)
+            ]
+            return [self._record(key) for key in keys[offset:offset + limit]]
+
+    def count_by_status(self, kind=None):
+        with self._lock:
+            self._records()
+            return _count_summary(self._counts, kind)
+
+    def changes_since(self, cursor):
+        with self._lock:
+            self._records()
+            latest = f"{self._feed_id}:{self._change_seq}"
+            try:
+                feed_id, seq = map(int, str(cursor).split(":"))
+            except ValueError:
+                return None, latest
+            if feed_id != self._feed_id or seq > self._change_seq:
+                return None, latest
+            if seq == self._change_seq:
+                return [], latest
+            if not self._changes or self._changes[0][0] > seq + 1:
+                return None, latest
+            return [dict(change) for change_seq, change in self._changes if change_seq > seq], latest
+
+    def _put_event(self, record):
+        record_id = self._new_id()
+        record["id"] = record_id
+        data = {k: v for k, v in record.items() if k != "id"}
+        return {"op": "put", "key": record_id, "record": data}
+
+    def add_approval(self, record):
+        with self._lock, self.log.exclusive():
+            self.log.append(self._put_event(record))
+            return record["id"]
+
+    def update_approval(self, record_id, **fields):
+        with self._lock, self.log.exclusive():
+            if record_id not in self._records():
+                return False
+            self.log.update(record_id, **fields)
+            return True
+
+    def update_approval_if(self, record_id, expected, **fields):
+        with self._lock, self.log.exclusive():
+            record = self._records().get(record_id)
+            if record is None or any(record.get(k) != v for k, v in expected.items()):
+                return False
+            self.log.update(record_id, **fields)
+            return True
+
+    def transition_status(self, ad_id, from_status, to_status, **fields):
+        return bool(self.transition_many([ad_id], from_status, to_status, **fields))
+
+    def transition_many(self, ad_ids, from_status, to_status, **fields):
+        updated = []
+        events = []
+        with self._lock, self.log.exclusive():
+            for ad_id in dict.fromkeys(ad_ids):
+                current = self.get_by_ad_id(ad_id, status=from_status)
+                if current:
+                    events.append({"op": "update", "key": current["id"], "fields": dict(fields, status=to_status)})
+                    updated.append(ad_id)
+            if events:
+                self.log.append(*events)
+        return updated
+
+    def save_approvals(self, records):
+        with self._lock, self.log.exclusive():
+            existing = self._records()
+            events = []
+            for record in records:
+                if record.get("id") in existing:
+                    fields = {k: v for k, v in record.items() if k != "id"}
+                    events.append({"op": "update", "key": record["id"], "fields": fields})
+                else:
+                    events.append(self._put_event(record))
+            self.log.append(*events)
+        return True
+
+    def upsert_pending(self, records):
+        with self._lock, self.log.exclusive():
+            existing = {}
+            for key in sorted(self._by_status.get("pending", {})):
+                ad_id = _str_or_none(self._records()[key].get("ad_id"))
+                if ad_id is not None:
+                    existing[ad_id] = key
+
+            added, updated, events = [], [], []
+            for ad_id, record in records.items():
+                if ad_id in existing:
+                    record["id"] = existing[ad_id]
+                    events.append({"op": "update", "key": existing[ad_id], "fields": _upsert_fields(record)})
+                    updated.append(ad_id)
+                else:
+                    events.append(self._put_event(record))
+                    added.append(ad_id)
+            self.log.append(*events)
+        return added, updated
+
+    def archive_records(self, statuses, select, archive):
+        with self._lock, self.log.exclusive():
+            self._records()
+            keys = sorted(key for status in statuses for key in self._by_status.get(status, {}))
+            records = [record for record in map(self._record, keys) if select(record)]
+            if not records:
+                return 0
+            archive(records)
+            self.log.append(*({"op": "delete", "key": record["id"]} for record in records))
+        return len(records)
+
+    def import_entries(self, entries, import_key):
+        with self._lock, self.log.exclusive():
+            meta_key = self.META_PREFIX + import_key
+            if meta_key in self._records():
+                return 0
+            events = [self._put_event(entry) for entry in entries]
+            events.append({"op": "put", "key": meta_key, "record": {"imported_at": datetime.now().isoformat()}})
+            self.log.append(*events)
+        return len(entries)
+
+
+# --- 公開API（選択中のバックエンドに委譲） ---
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """設定に応じたバックエンドを取得（初回は既存JSONを取り込む）"""
+    global _backend
+    with _backend_lock:
+        path = APPROVAL_LOG_FILE if APPROVAL_STORE_BACKEND == "eventlog" else APPROVAL_DB_FILE
+        if _backend is not None and _backend.path == path:
+            return _backend
+
+        if APPROVAL_STORE_BACKEND == "eventlog":
+            backend = EventLogBackend(path)
+        else:
+            backend = SQLiteBackend(path)
+
+        is_new = not backend.exists()
+        _backend = backend
+
+    if is_new and os.path.exists(LEGACY_APPROVAL_FILE):
+        imported = import_json(LEGACY_APPROVAL_FILE)
+        print(f"✅ {LEGACY_APPROVAL_FILE} から承認データを取り込みました: {imported}件")
+
+    return _backend
+
+
+def store_path():
+    """選択中のバックエンドの保存先ファイル（approvals.db または approvals.jsonl）"""
+    return get_backend().path
+
+
+def store_signature():
+    """承認データのファイルの識別子（変更されると値が変わる。キャッシュの検証用）"""
+    backend = get_backend()
+    return (backend.path,) + file_signature(*backend.files())
+
+
+def load_approvals(status=None, kind=None):
+    """承認データを取得（status/kindで絞り込み、登録順）
+
+    kind: "stop"=停止承認（ad_idあり）/ "copy"=広告コピー承認（adset_id+message_tsあり）
+    """
+    return get_backend().load_approvals(status=status, kind=kind)
+
+
+def iter_approvals(status=None, kind=None):
+    """load_approvalsと同じ条件で承認データを1件ずつ返す（大量件数の集計用）"""
+    return get_backend().iter_approvals(status=status, kind=kind)
+
+
+def get_by_ad_id(ad_id, status=None):
+    """広告IDで承認データを1件取得（複数ある場合は最も古いもの）"""
+    return get_backend().get_by_ad_id(ad_id, status=status)
+
+
+def get_approval(record_id):
+    """レコードIDで承認データを1件取得"""
+    return get_backend().get_approval(record_id)
+
+
+def find_by_message(adset_id, message_ts):
+    """(adset_id, message_ts) で広告コピー承認を1件取得"""
+    return get_backend().find_by_message(adset_id, message_ts)
+
+
+def find_by_message_ts(message_ts):
+    """Slackメッセージのtsで承認データを1件取得（Slackイベントからの逆引き用）"""
+    return get_backend().find_by_message_ts(message_ts)
+
+
+def find_all_by_message_ts(message_ts):
+    """Slackメッセージのtsで承認データを全件取得（まとめ通知は1メッセージに複数件）"""
+    return get_backend().find_all_by_message_ts(message_ts)
+
+
+def page_approvals(status, kind=None, offset=0, limit=50):
+    """ステータスの承認データを新しい順に1ページ分取得（Web UIの一覧用）"""
+    return get_backend().page_approvals(status, kind=kind, offset=offset, limit=limit)
+
+
+def count_by_status(kind=None):
+    """ステータスごとの件数を取得（件数は書き込みのたびに増減させて保持している）"""
+    return get_backend().count_by_status(kind=kind)
+
+
+def changes_since(cursor):
+    """cursor以降に追加・変更・削除された承認データ（Web UIのライブ更新用）
+
+    変更は {"id", "ad_id", "status"}（削除の場合statusはNone）で、同じレコードが複数回含まれることもある。
+    cursorがNone・不正・古すぎる（直近CHANGE_FEED_SIZE件より前）場合は変更の代わりにNoneを返すので、
+    その場合は必要なデータを読み直してから返されたカーソルで続ける。
+
+    Returns:
+        (変更のリスト または None, 最新のカーソル)
+    """
+    return get_backend().changes_since(cursor)
+
+
+def add_approval(record):
+    """承認データを1件追加し、採番したIDを返す"""
+    return get_backend().add_approval(record)
+
+
+def update_approval(record_id, **fields):
+    """承認データの指定フィールドを更新"""
+    return get_backend().update_approval(record_id, **fields)
+
+
+def update_approval_if(record_id, expected, **fields):
+    """承認データが expected（{フィールド: 値}）と一致する場合だけ更新（読み込みと更新は1回の書き込みロック内）
+
+    他のプロセスより先に処理を引き受ける場合などに使う
+
+    Returns:
+        更新した場合True / 一致しない・見つからない場合False
+    """
+    return get_backend().update_approval_if(record_id, expected, **fields)
+
+
+def transition_status(ad_id, from_status, to_status, **fields):
+    """from_statusの承認データ（ad_id指定）をto_statusに更新
+
+    Returns:
+        更新した場合True / 対象が見つからない場合False
+    """
+    return get_backend().transition_status(ad_id, from_status, to_status, **fields)
+
+
+def transition_many(ad_ids, from_status, to_status, **fields):
+    """複数の広告の承認データをまとめてfrom_status→to_statusに更新（1回の書き込み）
+
+    Returns:
+        更新したad_idのリスト（from_statusの承認データが見つからないものは含まない）
+    """
+    return get_backend().transition_many(ad_ids, from_status, to_status, **fields)
+
+
+def save_approvals(records):
+    """承認データをまとめて保存（idがあれば更新、なければ追加）"""
+    return get_backend().save_approvals(records)
+
+
+def upsert_pending_approvals(records):
+    """停止候補をまとめて承認待ちとして登録（1トランザクション）
+
+    同じad_idの承認待ちが既にある場合はCPA・画像URLなどを最新の値に更新し、
+    無い場合は新規に追加する。records内で同じad_idが重複した場合は後のものを使う。
+
+    Returns:
+        (追加したad_idのリスト, 更新したad_idのリスト)
+    """
+    index = _pending_index(records)
+    for record in index.values():
+        record["status"] = "pending"
+    if not index:
+        return [], []
+    return get_backend().upsert_pending(index)
+
+
+def archive_approvals(statuses, select, archive):
+    """statusesのうちselect(record)が真の承認データをarchive(records)に渡してから削除
+
+    Returns:
+        アーカイブした件数
+    """
+    return get_backend().archive_records(statuses, select, archive)
+
+
+# --- 既存JSONの取り込み ---
+def import_json(path):
+    """既存のpending_approvals.json形式のファイルを取り込む（同じファイルの再取り込みはスキップ）
+
+    Returns:
+        取り込んだ件数
+    """
+    entries = read_json(path, [])
+
+    entries = [
+        {k: v for k, v in entry.items() if k != "id"}
+        for entry in entries
+        if isinstance(entry, dict)
+    ]
+    import_key = f"imported:{os.path.abspath(path)}:{os.path.getmtime(path)}"
+    return get_backend().import_entries(entries, import_key)
+
+
+def main():
+    """コマンドライン: import <json> / stats"""
+    if len(sys.argv) >= 3 and sys.argv[1] == "import":
+        for path in sys.argv[2:]:
+            count = import_json(path)
+            print(f"✅ {path}: {count}件を取り込みました → {get_backend().path}")
+        return
+
+    if len(sys.argv) == 2 and sys.argv[1] == "stats":
+        for status, count in sorted(count_by_status().items()):
+            print(f"  - {status}: {count}")
+        return
+
+    if len(sys.argv) == 2 and sys.argv[1] == "compact" and APPROVAL_STORE_BACKEND == "eventlog":
+        get_backend().log.compact()
+        print(f"✅ コンパクション完了: {APPROVAL_LOG_FILE}")
+        return
+
+    print("使い方:")
+    print("  python3 approval_store.py import pending_approvals.json")
+    print("  python3 approval_store.py stats")
+    print("  APPROVAL_STORE_BACKEND=eventlog python3 approval_store.py compact")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,61 +1,330 @@
 import os
 import json
+import gzip
+import time
+import base64
+import hashlib
+import threading
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, Response, render_template, request, jsonify, url_for, send_file, stream_with_context
+
+import approval_store
+import state
+import thumbnail_cache
+from local_state import cached, file_signature
+from slack_events import blueprint as slack_events_blueprint, enqueue_web_stops
 
 app = Flask(__name__)
 
-APPROVAL_FILE = "pending_approvals.json"
+# /api/approvals の1ページの件数（デフォルトと上限）
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+# 承認済み・停止済み・却下済みの一覧の1ページの件数
+DASHBOARD_PAGE_SIZE = 50
+
+HISTORY_LABELS = {'approved': '承認済み', 'stopped': '停止済み', 'rejected': '却下済み'}
+
+# 承認・却下の操作（操作名 → 更新後のステータス）
+ACTIONS = {'approve': 'approved', 'reject': 'rejected'}
+# 一括操作で1リクエストに指定できる広告数
+BULK_MAX_ADS = 1000
+# 承認した広告をすぐに停止するか（0にすると従来どおり approved_stopper.py の定期実行で停止）
+STOP_ON_APPROVE = os.getenv("WEB_STOP_ON_APPROVE", "1") == "1"
+
+# 静的ファイル（CSS/JS）のキャッシュ期間（秒）。URLにファイルのハッシュを付けるので変更時は別URLになる
+STATIC_MAX_AGE = int(os.getenv("WEB_STATIC_MAX_AGE", str(60 * 60 * 24 * 365)))
+# この大きさ（バイト）以上のHTML/JSON/CSS/JSをgzip圧縮して返す
+GZIP_MIN_SIZE = 1024
+GZIP_MIMETYPES = ('text/html', 'text/css', 'application/javascript', 'text/javascript', 'application/json')
+
+# ライブ更新（Server-Sent Events）の設定
+# 承認ストアのファイルの変更を確認する間隔（秒）。Slack・approved_stopper・他のワーカーからの変更もこの間隔で届く
+EVENTS_POLL_INTERVAL = float(os.getenv("WEB_EVENTS_POLL_INTERVAL", "1"))
+# 1接続を保つ時間（秒）。過ぎたら切断し、ブラウザが続きのカーソルで自動的に再接続する
+EVENTS_STREAM_SECONDS = int(os.getenv("WEB_EVENTS_STREAM_SECONDS", "300"))
+# 変更がなくても接続を保つためにコメント行を送る間隔（秒）
+EVENTS_KEEPALIVE = 15
+# 切断後にブラウザが再接続するまでの時間（ミリ秒）
+EVENTS_RETRY_MS = 3000
+
+# 広告画像のサムネイルのキャッシュ期間（秒）。広告IDごとの画像は変わらないので長期間キャッシュさせる
+THUMBNAIL_MAX_AGE = int(os.getenv("WEB_THUMBNAIL_MAX_AGE", str(60 * 60 * 24 * 30)))
+
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = STATIC_MAX_AGE
+
+# このプロセスで承認データを書き込んだときに、ライブ更新の接続をすぐに起こす
+_store_changed = threading.Condition()
+
+# Slackリアクションのプッシュ受信（/slack/events）
+app.register_blueprint(slack_events_blueprint)
+
+def asset_url(filename):
+    """静的ファイルのURL（内容のハッシュ付き。変更されるまでブラウザのキャッシュを使わせる）"""
+    path = os.path.join(app.static_folder, filename)
+
+    def version():
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()[:12]
+
+    return url_for('static', filename=filename, v=cached(('asset', path), file_signature(path), version))
+
+@app.context_processor
+def template_helpers():
+    return {'asset_url': asset_url}
+
+@app.after_request
+def compress_response(response):
+    """対応しているクライアントにはテキスト系のレスポンスをgzip圧縮して返す"""
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in GZIP_MIMETYPES
+        or 'gzip' not in request.headers.get('Accept-Encoding', '')
+    ):
+        return response
+
+    data = response.get_data()
+    if len(data) < GZIP_MIN_SIZE:
+        return response
+
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    # 圧縮後は内容のバイト列が変わるので、ETagは弱いETagにする
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+@app.route('/healthz')
+def healthz():
+    """死活監視（プロセスが応答できれば200）"""
+    return jsonify({'status': 'ok'})
 
-def load_approvals():
-    """承認データを読み込む"""
-    if not os.path.exists(APPROVAL_FILE):
-        return []
+@app.route('/readyz')
+def readyz():
+    """リクエストを受け付けられるか（承認ストアとテンプレートを読めるか）を確認"""
     try:
-        with open(APPROVAL_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        approval_store.count_by_status()
+        app.jinja_env.get_template('index.html')
     except Exception as e:
-        print(f"承認データ読み込みエラー: {e}")
-        return []
+        return jsonify({'status': 'unavailable', 'error': str(e)}), 503
+    return jsonify({'status': 'ready'})
 
-def save_approvals(data):
-    """承認データを保存する"""
+def notify_store_changed():
+    with _store_changed:
+        _store_changed.notify_all()
+
+@app.route('/thumbs/<ad_id>')
+def thumbnail(ad_id):
+    """広告画像のサムネイル（初回だけ元の画像を取得して縮小し、以降はローカルのキャッシュから返す）"""
+    path = thumbnail_cache.lookup(ad_id)
+    if path is None and thumbnail_cache.is_valid_ad_id(ad_id):
+        # 承認データに無い広告の画像は取得しない（任意のIDでMeta APIを呼ばせない）
+        record = approval_store.get_by_ad_id(ad_id)
+        if record is None:
+            return '', 404, {'Cache-Control': 'no-store'}
+        path = thumbnail_cache.get_thumbnail(ad_id, record.get('image_url'))
+    if path is None:
+        # 取得できない画像をブラウザが何度も読み直さないよう、再取得までの間はキャッシュさせる
+        return '', 404, {'Cache-Control': f'public, max-age={thumbnail_cache.THUMBNAIL_RETRY_AFTER}'}
+
+    response = send_file(path, mimetype=thumbnail_cache.content_type(path), max_age=THUMBNAIL_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={THUMBNAIL_MAX_AGE}, immutable'
+    return response
+
+def clamp_page(status, page, counts=None):
+    """ページ番号を実際のページ数に収める（存在しないページ番号ごとにキャッシュが増えないように）"""
+    if counts is None:
+        counts = approval_store.count_by_status(kind='stop')
+    last_page = max(1, -(-counts.get(status, 0) // DASHBOARD_PAGE_SIZE))
+    return min(page, last_page)
+
+def render_section(status, page=1):
+    """ステータスごとの一覧部分を描画（承認データが変更されるまでキャッシュ）
+
+    承認済み・停止済み・却下済みは新しい順にDASHBOARD_PAGE_SIZE件ずつ表示する
+    """
+    if status != 'pending':
+        page = clamp_page(status, page)
+
+    def render():
+        if status == 'pending':
+            ads = approval_store.load_approvals(status='pending', kind='stop')
+            return render_template('_pending_section.html', ads=ads)
+        ads = approval_store.page_approvals(
+            status, kind='stop', offset=(page - 1) * DASHBOARD_PAGE_SIZE, limit=DASHBOARD_PAGE_SIZE
+        )
+        return render_template('_history_section.html', ads=ads, status=status, label=HISTORY_LABELS[status],
+                               page=page, page_size=DASHBOARD_PAGE_SIZE)
+
+    return cached(('dashboard', status, page), approval_store.store_signature(), render)
+
+def render_card(record):
+    """一覧の広告1件分を描画（一覧に表示しないステータスの場合はNone）"""
+    status = record.get('status')
+    if status == 'pending':
+        return render_template('_pending_card.html', ad=record)
+    if status in HISTORY_LABELS:
+        return render_template('_history_card.html', ad=record, status=status, label=HISTORY_LABELS[status])
+    return None
+
+def current_cursor():
+    """承認データの変更フィードの現在位置（ライブ更新の開始位置）"""
+    return approval_store.changes_since(None)[1]
+
+def page_arg(name):
     try:
-        with open(APPROVAL_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        return True
-    except Exception as e:
-        print(f"承認データ保存エラー: {e}")
-        return False
+        return max(int(request.args.get(name, 1)), 1)
+    except ValueError:
+        return 1
+
+def page_url(status, page):
+    """一覧のページ切り替え用URL（もう一方の一覧のページは維持する）"""
+    args = dict(request.args.items())
+    args[f'{status}_page'] = page
+    return url_for('index', **args) + f'#{status}'
 
 @app.route('/')
 def index():
     """承認待ちの広告一覧を表示"""
-    approvals = load_approvals()
-    pending = [a for a in approvals if a.get('status') == 'pending']
-    approved = [a for a in approvals if a.get('status') == 'approved']
-    rejected = [a for a in approvals if a.get('status') == 'rejected']
+    # 描画より前の位置からライブ更新を始め、描画中の変更も取りこぼさない
+    cursor = current_cursor()
+    # 件数は承認ストアが書き込みのたびに増減させているので全件を読まない
+    counts = approval_store.count_by_status(kind='stop')
+    approved_page = clamp_page('approved', page_arg('approved_page'), counts)
+    stopped_page = clamp_page('stopped', page_arg('stopped_page'), counts)
+    rejected_page = clamp_page('rejected', page_arg('rejected_page'), counts)
     
-    return render_template('index.html', 
-                         pending=pending, 
-                         approved=approved, 
-                         rejected=rejected)
+    return render_template('index.html',
+                         cursor=cursor,
+                         counts=counts,
+                         page_size=DASHBOARD_PAGE_SIZE,
+                         page_url=page_url,
+                         approved_page=approved_page,
+                         stopped_page=stopped_page,
+                         rejected_page=rejected_page,
+                         pending_html=render_section('pending'),
+                         approved_html=render_section('approved', approved_page),
+                         stopped_html=render_section('stopped', stopped_page),
+                         rejected_html=render_section('rejected', rejected_page))
+
+@app.route('/api/dashboard')
+def dashboard_sections():
+    """一覧部分だけを描画して返す（ページを再読み込みせずに一覧を最新にする）"""
+    cursor = current_cursor()
+    return jsonify({
+        'cursor': cursor,
+        'counts': approval_store.count_by_status(kind='stop'),
+        'sections': {
+            'pending': render_section('pending'),
+            'approved': render_section('approved', page_arg('approved_page')),
+            'stopped': render_section('stopped', page_arg('stopped_page')),
+            'rejected': render_section('rejected', page_arg('rejected_page')),
+        },
+    })
+
+def sse_event(event, data, event_id=None):
+    """Server-Sent Eventsの1イベント分のテキスト"""
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False))
+    return '\n'.join(lines) + '\n\n'
+
+def dashboard_changes(changes):
+    """変更フィードのうち一覧に関係する変更（停止承認）を、描画済みのカードにして返す"""
+    latest = {}
+    for change in changes:
+        if change['ad_id'] is not None:
+            latest.pop(change['id'], None)
+            latest[change['id']] = change
+
+    result = []
+    for record_id, change in latest.items():
+        record = approval_store.get_approval(record_id) if change['status'] is not None else None
+        result.append({
+            'id': record_id,
+            'ad_id': change['ad_id'],
+            'status': record.get('status') if record else None,
+            'html': render_card(record) if record else None,
+        })
+    return result
+
+@app.route('/api/approvals/stream')
+def approval_stream():
+    """承認データの変更をServer-Sent Eventsで送る
+
+    Web UI・Slackのリアクション・approved_stopper.py のどこからの変更も、承認ストアの変更フィードから送る。
+
+    イベント:
+        approvals  {"changes": [{"id", "ad_id", "status", "html"}], "counts": {...}}
+                   statusが一覧に表示しないステータス（削除など）の場合、htmlはnull
+        reset      差分を送れない（カーソルが古い）ので一覧を読み直す
+
+    イベントIDは変更フィードのカーソルで、再接続時はLast-Event-IDから続きを送る
+    """
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('cursor')
+
+    def generate(cursor):
+        yield f'retry: {EVENTS_RETRY_MS}\n\n'
+        deadline = time.monotonic() + EVENTS_STREAM_SECONDS
+        last_sent = time.monotonic()
+        signature = None
+        while time.monotonic() < deadline:
+            # ファイルが変わっていなければ変更フィードを読まない
+            current = approval_store.store_signature()
+            if current != signature:
+                signature = current
+                changes, cursor = approval_store.changes_since(cursor)
+                if changes is None:
+                    yield sse_event('reset', {}, cursor)
+                    last_sent = time.monotonic()
+                else:
+                    changes = dashboard_changes(changes)
+                    if changes:
+                        counts = approval_store.count_by_status(kind='stop')
+                        yield sse_event('approvals', {'changes': changes, 'counts': counts}, cursor)
+                        last_sent = time.monotonic()
+
+            if time.monotonic() - last_sent >= EVENTS_KEEPALIVE:
+                yield ': keepalive\n\n'
+                last_sent = time.monotonic()
+            with _store_changed:
+                _store_changed.wait(EVENTS_POLL_INTERVAL)
+
+    return Response(
+        stream_with_context(generate(cursor)),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            # ngrok・nginxなどのプロキシでバッファリングさせない
+            'X-Accel-Buffering': 'no',
+        },
+    )
+
+def apply_action(action, ad_ids):
+    """承認待ちの広告をまとめて承認・却下（承認ストアへの書き込みは1回）
+
+    Returns:
+        更新したad_idのリスト
+    """
+    updated = approval_store.transition_many(
+        ad_ids, 'pending', ACTIONS[action], approved_at=datetime.now().isoformat()
+    )
+    if updated:
+        notify_store_changed()
+        # 承認した広告は次の定期実行を待たずに停止ジョブを登録する（結果は承認ストアに記録される）
+        if action == 'approve' and STOP_ON_APPROVE:
+            enqueue_web_stops(updated)
+    return updated
 
 @app.route('/api/approve/<ad_id>', methods=['POST'])
 def approve_ad(ad_id):
     """広告を承認する"""
-    approvals = load_approvals()
-    updated = False
-    
-    for ad in approvals:
-        if ad.get('ad_id') == ad_id and ad.get('status') == 'pending':
-            ad['status'] = 'approved'
-            ad['approved_at'] = datetime.now().isoformat()
-            updated = True
-            break
+    updated = apply_action('approve', [ad_id])
     
     if updated:
-        save_approvals(approvals)
         return jsonify({'success': True, 'message': '承認しました'})
     else:
         return jsonify({'success': False, 'message': '広告が見つかりません'}), 404
@@ -63,31 +332,151 @@ def approve_ad(ad_id):
 @app.route('/api/reject/<ad_id>', methods=['POST'])
 def reject_ad(ad_id):
     """広告を却下する"""
-    approvals = load_approvals()
-    updated = False
-    
-    for ad in approvals:
-        if ad.get('ad_id') == ad_id and ad.get('status') == 'pending':
-            ad['status'] = 'rejected'
-            ad['approved_at'] = datetime.now().isoformat()
-            updated = True
-            break
+    updated = apply_action('reject', [ad_id])
     
     if updated:
-        save_approvals(approvals)
         return jsonify({'success': True, 'message': '却下しました'})
     else:
         return jsonify({'success': False, 'message': '広告が見つかりません'}), 404
 
+@app.route('/api/approvals/bulk', methods=['POST'])
+def bulk_action():
+    """複数の広告をまとめて承認・却下する
+
+    リクエスト: {"action": "approve" | "reject", "ad_ids": ["...", ...]}
+    レスポンス: 更新した広告ID・見つからなかった広告ID・更新後のステータスごとの件数
+    """
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    ad_ids = data.get('ad_ids')
+    
+    if action not in ACTIONS:
+        return jsonify({'success': False, 'message': 'actionは approve または reject を指定してください'}), 400
+    if not isinstance(ad_ids, list) or not ad_ids:
+        return jsonify({'success': False, 'message': 'ad_idsに広告IDのリストを指定してください'}), 400
+    if len(ad_ids) > BULK_MAX_ADS:
+        return jsonify({'success': False, 'message': f'一度に操作できるのは{BULK_MAX_ADS}件までです'}), 400
+    
+    ad_ids = [str(ad_id) for ad_id in ad_ids]
+    updated = apply_action(action, ad_ids)
+    updated_set = set(updated)
+    
+    if updated:
+        message = f"{len(updated)}件を{'承認' if action == 'approve' else '却下'}しました"
+    else:
+        message = '承認待ちの広告が見つかりません（処理済みの可能性があります）'
+    
+    return jsonify({
+        'success': bool(updated),
+        'message': message,
+        'updated': updated,
+        'not_found': [ad_id for ad_id in dict.fromkeys(ad_ids) if ad_id not in updated_set],
+        'counts': approval_store.count_by_status(kind='stop'),
+    })
+
+def encode_cursor(sort, key):
+    """次のページのカーソル（並べ替えのフィールドと最後のレコードのキー）"""
+    raw = json.dumps([sort, list(key)], ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _is_sort_key(key, sort):
+    """state.approval_sort_key と同じ形（値が無い印, 値, id）か（型が違うとページの検索で比較できない）"""
+    missing, value, record_id = key
+    if type(missing) is not int or missing not in (0, 1) or type(record_id) is not int:
+        return False
+    if missing:
+        return value == ""
+    if sort == "cpa":
+        return type(value) in (int, float)
+    if sort == "id":
+        return type(value) is int
+    return isinstance(value, str)
+
+def decode_cursor(cursor, sort):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, key = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if cursor_sort != sort or not isinstance(key, list) or len(key) != 3 or not _is_sort_key(key, sort):
+        return None
+    return tuple(key)
+
 @app.route('/api/approvals')
 def get_approvals():
-    """承認データをJSON形式で取得"""
-    approvals = load_approvals()
-    return jsonify(approvals)
+    """承認データをJSON形式で取得（ページ単位）
+
+    クエリパラメータ:
+        status    ステータス（カンマ区切りで複数指定可）
+        kind      stop / copy
+        campaign  キャンペーンIDまたはキャンペーン名
+        adset     広告セットIDまたは広告セット名
+        since / until  作成日時の範囲（例: 2024-01-01）
+        sort      並べ替えのフィールド（先頭に - で降順。デフォルト: created_at）
+        limit     1ページの件数（デフォルト100、最大1000）
+        cursor    前のレスポンスの next_cursor
+
+    limit・cursorのどちらかを指定した場合は {approvals, count, next_cursor} を1ページ分返す。
+    どちらも指定しない場合は従来どおり条件に合う承認データ全件のリストを返す。
+    ETagを返し、If-None-Matchが一致する場合（承認データに変更がない場合）は304を返す
+    """
+    args = request.args
+    sort = args.get('sort', 'created_at')
+    descending = sort.startswith('-')
+    sort = sort.lstrip('-')
+    if sort not in state.APPROVAL_SORT_FIELDS:
+        return jsonify({'error': f'sortは {", ".join(state.APPROVAL_SORT_FIELDS)} のいずれかを指定してください'}), 400
+
+    paginated = 'limit' in args or 'cursor' in args
+    try:
+        limit = min(max(int(args.get('limit', API_PAGE_SIZE)), 1), API_MAX_PAGE_SIZE) if paginated else None
+    except ValueError:
+        return jsonify({'error': 'limitは数値で指定してください'}), 400
+
+    after = None
+    if args.get('cursor'):
+        after = decode_cursor(args['cursor'], sort)
+        if after is None:
+            return jsonify({'error': 'cursorが不正です'}), 400
+
+    # 承認ストアのファイルが変わらない限り同じ結果になるので、データを読む前に判定できる
+    etag = hashlib.sha1(
+        repr((approval_store.store_signature(), sorted(args.items(multi=True)))).encode('utf-8')
+    ).hexdigest()
+    # gzip圧縮時は弱いETagで返すので、弱い比較で判定する
+    if request.if_none_match.contains_weak(etag):
+        return '', 304, {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+
+    statuses = [s for s in args.get('status', '').split(',') if s] or None
+    approvals, last_key = state.query_approvals(
+        statuses=statuses,
+        kind=args.get('kind'),
+        campaign=args.get('campaign'),
+        adset=args.get('adset'),
+        since=args.get('since'),
+        until=args.get('until'),
+        sort=sort,
+        descending=descending,
+        after=after,
+        limit=limit,
+    )
+
+    if paginated:
+        response = jsonify({
+            'approvals': approvals,
+            'count': len(approvals),
+            'next_cursor': encode_cursor(sort, last_key) if last_key is not None else None,
+        })
+    else:
+        # ページ指定のない従来の呼び出し元には、これまでと同じリストの形で返す
+        response = jsonify(approvals)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 if __name__ == '__main__':
     # テンプレートディレクトリが存在しない場合は作成
     os.makedirs('templates', exist_ok=True)
     
-    # 開発環境での実行
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # 開発環境での実行（本番は gunicorn -c gunicorn.conf.py approval_web:app）
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', '5000')), debug=os.getenv('WEB_DEBUG', '1') == '1')
@@ -4,7 +4,10 @@ from datetime import datetime
 
 import requests
 import gspread
-from slack_reaction_helper import get_approved_ads, mark_as_stopped
+import approval_store
+import slack_client
+import state
+from slack_reaction_helper import get_approved_ads, mark_many_as_stopped, is_digest_enabled
 
 try:
     from dotenv import load_dotenv
@@ -21,54 +24,24 @@ ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
 SPREADSHEET_URL = os.getenv("SPREADSHEET_URL")
 SLACK_WEBHOOK_URL = os.getenv("SLACK_WEBHOOK_URL")
 
-APPROVAL_FILE = "pending_approvals.json"
-
 # 🔍 トークンの確認ログ
 if ACCESS_TOKEN:
     print("トークンチェック（ACCESS_TOKENの先頭10文字）:", ACCESS_TOKEN[:10] + "***")
 else:
     print("[警告] ACCESS_TOKENが未設定です")
 
-# --- JSON Approval Management ---
-def load_approvals():
-    """承認データを読み込む"""
-    if not os.path.exists(APPROVAL_FILE):
-        print(f"[警告] {APPROVAL_FILE}が存在しません")
-        return []
-    try:
-        with open(APPROVAL_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"承認データ読み込みエラー: {e}")
-        return []
-
-def save_approvals(data):
-    """承認データを保存する"""
-    try:
-        with open(APPROVAL_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        return True
-    except Exception as e:
-        print(f"承認データ保存エラー: {e}")
-        return False
-
+# --- Approval Management ---
 def get_approved_ads_from_json():
-    """承認済みの広告リストをJSONから取得"""
-    approvals = load_approvals()
-    approved = [ad for ad in approvals if ad.get('status') == 'approved']
-    print(f"✅ JSONから承認済み広告: {len(approved)}件")
+    """承認済みの広告リストを承認ストアから取得"""
+    approved = state.load_approvals(status='approved', kind='stop')
+    print(f"✅ 承認ストアから承認済み広告: {len(approved)}件")
     return approved
 
 def mark_ad_as_stopped_json(ad_id):
-    """広告を停止済みとしてマーク（JSON）"""
-    approvals = load_approvals()
-    for ad in approvals:
-        if ad.get('ad_id') == ad_id and ad.get('status') == 'approved':
-            ad['status'] = 'stopped'
-            ad['stopped_at'] = datetime.now().isoformat()
-            save_approvals(approvals)
-            print(f"✅ 広告 {ad_id} を停止済みにマークしました")
-            return True
+    """広告を停止済みとしてマーク（承認ストア）"""
+    if approval_store.transition_status(ad_id, 'approved', 'stopped', stopped_at=datetime.now().isoformat()):
+        print(f"✅ 広告 {ad_id} を停止済みにマークしました")
+        return True
     return False
 
 # Google Sheets接続
@@ -121,6 +94,118 @@ def pause_ad(ad_id):
     print("APIレスポンス:", res.text)
     return res.status_code == 200
 
+# Graph APIのバッチリクエスト1回あたりの上限
+GRAPH_BATCH_SIZE = 50
+
+def graph_batch(batch):
+    """Graph APIのバッチリクエスト（最大GRAPH_BATCH_SIZE件を1回のHTTPリクエストで実行）
+
+    Returns:
+        リクエストごとの (ステータスコード, レスポンス本文のdict)。タイムアウトしたものは (None, {})
+    """
+    res = requests.post(
+        "https://graph.facebook.com/v19.0/",
+        data={"access_token": ACCESS_TOKEN, "batch": json.dumps(batch)},
+        timeout=60,
+    )
+    res.raise_for_status()
+    results = []
+    for item in res.json():
+        if item is None:
+            results.append((None, {}))
+            continue
+        try:
+            body = json.loads(item.get("body") or "{}")
+        except ValueError:
+            body = {}
+        results.append((item.get("code"), body))
+    return results
+
+def _graph_error(code, body):
+    return (body.get("error") or {}).get("message") or f"HTTP {code}"
+
+def pause_ads(ad_ids):
+    """複数の広告をGraph APIのバッチリクエストでまとめて停止（ステータス確認と停止で各1回）
+
+    Returns:
+        {ad_id: ("paused" | "already_paused" | None, エラーメッセージ)}  Noneは失敗
+    """
+    results = {}
+    for start in range(0, len(ad_ids), GRAPH_BATCH_SIZE):
+        chunk = ad_ids[start:start + GRAPH_BATCH_SIZE]
+        statuses = graph_batch([
+            {"method": "GET", "relative_url": f"{ad_id}?fields=status,effective_status"} for ad_id in chunk
+        ])
+        to_pause = []
+        for ad_id, (code, body) in zip(chunk, statuses):
+            if code != 200:
+                results[ad_id] = (None, _graph_error(code, body))
+            elif (body.get("effective_status") or body.get("status")) in ["PAUSED", "ARCHIVED"]:
+                print(f"スキップ: {ad_id} はすでに停止済み（ステータス: {body.get('effective_status')}）")
+                results[ad_id] = ("already_paused", None)
+            else:
+                to_pause.append(ad_id)
+
+        if to_pause:
+            paused = graph_batch([
+                {"method": "POST", "relative_url": str(ad_id), "body": "status=PAUSED"} for ad_id in to_pause
+            ])
+            for ad_id, (code, body) in zip(to_pause, paused):
+                print(f"Paused Ad: {ad_id} → {code}")
+                results[ad_id] = ("paused", None) if code == 200 else (None, _graph_error(code, body))
+    return results
+
+def stop_approved_ads(ad_ids, ad_names=None):
+    """承認済みの広告をまとめて停止し、結果を承認ストアに記録（承認直後の停止ジョブ用）
+
+    停止した広告（停止済みだった広告も含む）は stopped にし、失敗した広告は承認済みのまま
+    stop_error を記録する（次回の定期実行でも停止を試みる）
+
+    Args:
+        ad_names: {ad_id: 広告名}。Slackリアクションで承認された広告など、呼び出し側で承認済みを
+            確認した広告を渡すと、承認ストアに承認済みのレコードが無くても停止する
+    Returns:
+        {ad_id: エラーメッセージ（成功はNone）}
+    """
+    if not ACCESS_TOKEN:
+        raise RuntimeError("ACCESS_TOKENが未設定のため広告を停止できません")
+
+    ad_names = {str(ad_id): name for ad_id, name in (ad_names or {}).items()}
+    approvals = {}
+    for ad_id in dict.fromkeys(str(ad_id) for ad_id in ad_ids):
+        approval = approval_store.get_by_ad_id(ad_id, status='approved')
+        if approval is not None:
+            approvals[ad_id] = approval
+            ad_names.setdefault(ad_id, approval.get("ad_name", ""))
+    targets = [str(ad_id) for ad_id in dict.fromkeys(ad_ids) if str(ad_id) in ad_names]
+    if not targets:
+        return {str(ad_id): None for ad_id in ad_ids}
+
+    results = pause_ads(targets)
+    now = datetime.now().isoformat()
+    errors = {}
+    for stop_result in ("paused", "already_paused"):
+        stopped = [ad_id for ad_id, (result, _) in results.items() if result == stop_result]
+        approval_store.transition_many(stopped, 'approved', 'stopped', stopped_at=now, stop_result=stop_result)
+    for ad_id, (result, error) in results.items():
+        errors[ad_id] = error
+        if result is None and ad_id in approvals:
+            approval_store.update_approval(approvals[ad_id]["id"], stop_error=error, stop_attempted_at=now)
+
+    stopped_ids = [ad_id for ad_id, (result, _) in results.items() if result is not None]
+    # Slackで同じ広告の承認待ちメッセージも停止済みにし、定期実行で二重に処理しない
+    mark_many_as_stopped(stopped_ids)
+
+    paused = [(ad_id, ad_names[ad_id]) for ad_id, (result, _) in results.items() if result == "paused"]
+    if is_digest_enabled():
+        send_slack_confirmation_digest(paused)
+    else:
+        for ad_id, ad_name in paused:
+            send_slack_confirmation(ad_id, ad_name)
+
+    print(f"✅ {len(stopped_ids)}件の広告を停止済みにしました（失敗 {len(targets) - len(stopped_ids)}件）")
+    return {str(ad_id): errors.get(str(ad_id)) for ad_id in ad_ids}
+
 # Slack通知
 def send_slack_confirmation(ad_id, ad_name):
     if not SLACK_WEBHOOK_URL:
@@ -129,8 +214,22 @@ def send_slack_confirmation(ad_id, ad_name):
 
     message = f"✅ *広告停止実行済み通知*\n\n*広告名*: {ad_name}\n*広告ID*: `{ad_id}`\n⏸️ 停止が完了しました。"
     payload = {"text": message}
-    res = requests.post(SLACK_WEBHOOK_URL, json=payload)
-    print("Slack通知結果:", res.status_code)
+    result = slack_client.post_webhook(SLACK_WEBHOOK_URL, payload)
+    print("Slack通知結果:", "ok" if result.get("ok") else result.get("error"))
+
+def send_slack_confirmation_digest(stopped_ads):
+    """停止した広告をまとめて1件で通知"""
+    if not stopped_ads:
+        return
+    if not SLACK_WEBHOOK_URL:
+        print("[警告] SLACK_WEBHOOK_URLが未設定です")
+        return
+
+    lines = [f"✅ *広告停止実行済み通知*（{len(stopped_ads)}件）", ""]
+    lines.extend(f"• {ad_name} `{ad_id}`" for ad_id, ad_name in stopped_ads)
+    lines.extend(["", "⏸️ 停止が完了しました。"])
+    result = slack_client.post_webhook(SLACK_WEBHOOK_URL, {"text": "\n".join(lines)})
+    print("Slack通知結果:", "ok" if result.get("ok") else result.get("error"))
 
 # メイン処理
 def main():
@@ -147,12 +246,17 @@ def main():
         print(f"[警告] Slackリアクションの読み取りに失敗: {e}")
         approved_ads_from_slack = []
     
-    # JSONファイルからも承認済み広告を取得（Web UI互換性）
-    print("\n=== JSONファイルから承認済み広告を読み取り ===")
+    # 承認ストアからも承認済み広告を取得（Web UI互換性）
+    print("\n=== 承認ストアから承認済み広告を読み取り ===")
     approved_ads_from_json = get_approved_ads_from_json()
     
-    # 両方を統合
-    all_approved_ads = approved_ads_from_slack + approved_ads_from_json
+    # 両方を統合（Slackで承認した広告は承認ストアにも反映されているので、広告IDで重複を除く）
+    all_approved_ads = []
+    seen_ad_ids = set()
+    for ad in approved_ads_from_slack + approved_ads_from_json:
+        if str(ad.get('ad_id')) not in seen_ad_ids:
+            seen_ad_ids.add(str(ad.get('ad_id')))
+            all_approved_ads.append(ad)
     
     if not all_approved_ads:
         print("承認済みの広告がありません")
@@ -176,6 +280,8 @@ def main():
     
     # 承認済み広告を処理
     print(f"\n=== {len(all_approved_ads)}件の承認済み広告を処理 ===")
+    stopped_from_slack = []
+    stopped_ads = []
     for ad in all_approved_ads:
         ad_id = ad.get('ad_id')
         ad_name = ad.get('ad_name', '')
@@ -183,13 +289,22 @@ def main():
         print(f"承認済み広告検出: {ad_id} ({ad_name})")
         success = pause_ad(ad_id)
         if success:
-            send_slack_confirmation(ad_id, ad_name)
+            # まとめ通知モードでは停止完了もループ後に1件で通知
+            if is_digest_enabled():
+                stopped_ads.append((ad_id, ad_name))
+            else:
+                send_slack_confirmation(ad_id, ad_name)
             # Slackリアクション経由の場合
             if 'message_ts' in ad:
-                mark_as_stopped(ad_id)
-            # JSON経由の場合
+                stopped_from_slack.append(ad_id)
+            # Web UI（承認ストア）経由の場合
             else:
                 mark_ad_as_stopped_json(ad_id)
 
+    # Slackリアクション経由の停止済みマークはまとめて1回で記録
+    if stopped_from_slack:
+        mark_many_as_stopped(stopped_from_slack)
+    send_slack_confirmation_digest(stopped_ads)
+
 if __name__ == "__main__":
     main()
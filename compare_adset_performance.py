@@ -8,6 +8,9 @@ import json
 import requests
 from datetime import datetime, timedelta
 
+import slack_client
+from state import load_copy_history_records
+
 try:
     from dotenv import load_dotenv
 except ModuleNotFoundError:
@@ -21,18 +24,12 @@ ACCESS_TOKEN = os.getenv("ACCESS_TOKEN") or os.getenv("META_ACCESS_TOKEN")
 SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
 SLACK_CHANNEL_ID = os.getenv("SLACK_CHANNEL_ID")
 
-# コピー履歴ファイル
-COPY_HISTORY_FILE = "ad_copy_history.json"
-
-
 def load_copy_history():
-    """コピー履歴を読み込み"""
-    if os.path.exists(COPY_HISTORY_FILE):
-        try:
-            with open(COPY_HISTORY_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"コピー履歴読み込みエラー: {e}")
+    """コピー履歴を読み込み（CopyHistoryRecordのリスト）"""
+    try:
+        return load_copy_history_records()
+    except Exception as e:
+        print(f"コピー履歴読み込みエラー: {e}")
     return []
 
 
@@ -79,27 +76,8 @@ def calculate_cpa(insights):
 
 def send_slack_notification(blocks, text):
     """Slackに通知を送信（Block Kit対応）"""
-    if not SLACK_BOT_TOKEN or not SLACK_CHANNEL_ID:
-        print("[警告] Slack設定が未設定のため、通知をスキップします")
-        return
-    
-    url = "https://slack.com/api/chat.postMessage"
-    headers = {
-        "Authorization": f"Bearer {SLACK_BOT_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "channel": SLACK_CHANNEL_ID,
-        "blocks": blocks,
-        "text": text
-    }
-    
     try:
-        res = requests.post(url, headers=headers, json=payload)
-        if res.status_code == 200 and res.json().get("ok"):
-            print("✅ Slack通知送信成功")
-        else:
-            print(f"❌ Slack通知送信失敗: {res.text}")
+        slack_client.post_message(text, blocks=blocks)
     except Exception as e:
         print(f"❌ Slack通知送信エラー: {e}")
 
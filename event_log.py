@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+追記専用のJSON Linesイベントログ
+
+状態変更を1行1イベントとして追記するだけなので、書き込みコストは履歴の長さに依存しない。
+メモリ上の状態（キー → レコード）はスナップショットとログを再生して構築し、
+以降はログの末尾だけを差分で読み込んで最新に保つ。
+
+ログが一定件数を超えるとバックグラウンドでコンパクションを行い、
+その時点の状態をスナップショットに書き出してログを空にする。
+
+複数プロセスからの追記とローテーションはアドバイザリロックで直列化し、
+読み込みはロックを取らずに行う（読み込み中にローテーションされた場合は読み直す）。
+
+ファイル構成（path = "slack_reactions.jsonl" の場合）:
+    slack_reactions.jsonl             現在のログ
+    slack_reactions.jsonl.compacting  コンパクション中のログ（コンパクション完了で削除）
+    slack_reactions.jsonl.snapshot    スナップショット
+
+イベント形式:
+    {"op": "put", "key": キー, "record": {...}}       レコードの追加・置き換え
+    {"op": "update", "key": キー, "fields": {...}}    フィールドの部分更新
+    {"op": "delete", "key": キー}                     レコードの削除
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import serialization
+from local_state import file_lock, atomic_write_bytes, file_signature
+
+# ログにこの件数のイベントが溜まったらコンパクションする
+EVENT_LOG_COMPACT_EVERY = int(os.getenv("EVENT_LOG_COMPACT_EVERY", "1000"))
+
+
+def apply_event(records, event):
+    """イベントを1件レコード辞書に適用し、(キー, 変更前, 変更後) を返す"""
+    op = event.get("op")
+    key = event.get("key")
+    old = records.get(key)
+
+    if op == "put":
+        new = dict(event.get("record") or {})
+    elif op == "update":
+        if old is None:
+            return key, None, None
+        new = dict(old)
+        new.update(event.get("fields") or {})
+    elif op == "delete":
+        records.pop(key, None)
+        return key, old, None
+    else:
+        return key, old, old
+
+    records[key] = new
+    return key, old, new
+
+
+class EventLog:
+    """キー付きレコードを追記専用ログで管理する"""
+
+    def __init__(self, path, on_reset=None, on_change=None, compact_every=None):
+        self.path = path
+        self.segment_path = path + ".compacting"
+        self.snapshot_path = path + ".snapshot"
+        self.compact_every = compact_every or EVENT_LOG_COMPACT_EVERY
+        # インデックス維持用のコールバック
+        self.on_reset = on_reset
+        self.on_change = on_change
+
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._exclusive_depth = 0
+        self._records = None
+        self._log_inode = None
+        self._log_offset = 0
+        self._log_events = 0
+        self._generation = 0
+
+    # --- 読み込み ---
+    def _file_signature(self):
+        """スナップショット・コンパクション中ログ・現在ログの識別子
+
+        スナップショットは置き換えで書き込むので (inode, 更新日時, サイズ) で、
+        ログは追記中もサイズが変わるのでinodeだけで見分ける（中身は読まない）
+        """
+        def inode(path):
+            try:
+                return os.stat(path).st_ino
+            except FileNotFoundError:
+                return None
+
+        return file_signature(self.snapshot_path) + (inode(self.segment_path), inode(self.path))
+
+    def _read_snapshot(self):
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                snapshot = serialization.loads(f.read())
+        except FileNotFoundError:
+            return 0, {}
+        return snapshot.get("generation", 0), {key: record for key, record in snapshot.get("records", [])}
+
+    @staticmethod
+    def _read_events(path, offset=0):
+        """ログを読み込み (イベントのリスト, 読み込んだ末尾のオフセット) を返す
+
+        書き込み途中の最終行（改行なし）は読み込まない
+        """
+        try:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], offset
+
+        end = data.rfind(b"\n") + 1
+        events = []
+        for line in data[:end].splitlines():
+            if line.strip():
+                events.append(serialization.loads_json(line))
+        return events, offset + end
+
+    def _full_reload(self):
+        """スナップショット + コンパクション中ログ + 現在ログから状態を再構築"""
+        while True:
+            before = self._file_signature()
+            generation, records = self._read_snapshot()
+            segment_events, _ = self._read_events(self.segment_path)
+            log_events, log_offset = self._read_events(self.path)
+            if self._file_signature() == before:
+                break
+            # 読み込み中にコンパクションが進んだ場合は読み直す
+
+        for event in segment_events + log_events:
+            apply_event(records, event)
+
+        self._records = records
+        self._generation = generation
+        self._log_inode = before[2]
+        self._log_offset = log_offset
+        self._log_events = len(log_events)
+
+        if self.on_reset:
+            self.on_reset(records)
+
+    def _catch_up(self):
+        """他の書き込みを含め、ログ末尾の未読イベントを反映"""
+        if self._records is None:
+            self._full_reload()
+            return
+
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+
+        # ログがローテートされた（コンパクションされた）場合は全体を読み直す
+        if stat is None or stat.st_ino != self._log_inode or stat.st_size < self._log_offset:
+            if stat is None and self._log_inode is None:
+                return
+            self._full_reload()
+            return
+
+        if stat.st_size == self._log_offset:
+            return
+
+        events, self._log_offset = self._read_events(self.path, self._log_offset)
+        for event in events:
+            key, old, new = apply_event(self._records, event)
+            if self.on_change:
+                self.on_change(key, old, new)
+        self._log_events += len(events)
+
+    def records(self):
+        """最新の状態（キー → レコード、追加順）を返す"""
+        with self._lock:
+            self._catch_up()
+            return self._records
+
+    # --- 書き込み ---
+    @contextmanager
+    def exclusive(self):
+        """他プロセスを含めて書き込みを直列化する（入れ子で使用可）
+
+        ブロック内では他プロセスの追記も反映済みの最新状態を読めるので、
+        「確認してから更新」を競合なく行える
+        """
+        with self._lock:
+            if self._exclusive_depth:
+                self._exclusive_depth += 1
+                try:
+                    yield
+                finally:
+                    self._exclusive_depth -= 1
+                return
+
+            with file_lock(self.path):
+                self._exclusive_depth = 1
+                try:
+                    self._catch_up()
+                    yield
+                finally:
+                    self._exclusive_depth = 0
+
+    def append(self, *events):
+        """イベントを追記（複数イベントは1回の書き込みでまとめて追記）"""
+        if not events:
+            return
+        payload = b"".join(serialization.dumps_line(event) for event in events)
+
+        with self.exclusive():
+            with open(self.path, "ab") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            self._catch_up()
+            should_compact = self._log_events >= self.compact_every
+
+        if should_compact:
+            self.compact_in_background()
+
+    def put(self, key, record):
+        self.append({"op": "put", "key": key, "record": record})
+
+    def update(self, key, **fields):
+        self.append({"op": "update", "key": key, "fields": fields})
+
+    def delete(self, key):
+        self.append({"op": "delete", "key": key})
+
+    # --- コンパクション ---
+    def compact_in_background(self):
+        """コンパクションを別スレッドで実行"""
+        thread = threading.Thread(target=self.compact, name=f"compact:{os.path.basename(self.path)}")
+        thread.start()
+        return thread
+
+    def compact(self):
+        """現在の状態をスナップショットに書き出し、ログを空にする"""
+        if not self._compact_lock.acquire(blocking=False):
+            return False  # このプロセスで既にコンパクション中
+
+        try:
+            # 他プロセスがコンパクション中なら何もしない
+            with file_lock(self.snapshot_path, blocking=False) as acquired:
+                if not acquired:
+                    return False
+                return self._compact_locked()
+        finally:
+            self._compact_lock.release()
+
+    def _compact_locked(self):
+        with self.exclusive():
+            # 前回のコンパクションが途中で止まっていた場合はそのログを先に片付ける
+            if not os.path.exists(self.segment_path):
+                if not os.path.exists(self.path):
+                    return False
+                os.replace(self.path, self.segment_path)
+
+        # ローテーション後は追記を止めずにスナップショットを作る
+        generation, records = self._read_snapshot()
+        segment_events, _ = self._read_events(self.segment_path)
+        for event in segment_events:
+            apply_event(records, event)
+
+        snapshot = {
+            "generation": generation + 1,
+            "compacted_at": datetime.now().isoformat(),
+            "records": [[key, record] for key, record in records.items()],
+        }
+        atomic_write_bytes(self.snapshot_path, serialization.dumps(snapshot, indent=None))
+        os.remove(self.segment_path)
+        return True
+
+    def import_records(self, items):
+        """既存データ（[(キー, レコード), ...]）を初期スナップショットとして取り込む"""
+        with self._lock:
+            self.append(*({"op": "put", "key": key, "record": record} for key, record in items))
+        return self.compact()
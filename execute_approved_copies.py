@@ -7,89 +7,88 @@ Slackで承認された広告セットのみをコピーする
 
 import os
 import sys
-import json
 import subprocess
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from slack_reaction_helper import get_message_reactions
+import approval_store
+import state
+from slack_reaction_helper import get_message_reactions, get_reactions_for_messages
 
 # 環境変数を読み込み
 load_dotenv()
 
 SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
 SLACK_CHANNEL_ID = os.getenv("SLACK_CHANNEL_ID")
-APPROVAL_FILE = "pending_approvals.json"
+
+# 承認リクエスト作成時のスキャン結果を再利用できる最大経過時間（時間）
+SNAPSHOT_MAX_AGE_HOURS = float(os.getenv("SNAPSHOT_MAX_AGE_HOURS", "24"))
 
 def load_approval_data():
     """承認データを読み込み（ad_copy用のみ抽出）"""
-    if not os.path.exists(APPROVAL_FILE):
-        print(f"⚠️  承認データファイルが見つかりません: {APPROVAL_FILE}")
-        return []
-
     try:
-        with open(APPROVAL_FILE, "r", encoding="utf-8") as f:
-            all_entries = json.load(f)
-        print(f"✅ 承認データを読み込み: {len(all_entries)}件")
-
         # ad_copy_with_approval.py が書き込んだレコードのみ処理
-        approvals = [
-            entry
-            for entry in all_entries
-            if isinstance(entry, dict)
-            and entry.get("adset_id")
-            and entry.get("message_ts")
-        ]
-
+        approvals = state.load_approvals(kind="copy")
         print(f"   ↪️  広告コピー用の承認データ: {len(approvals)}件")
         return approvals
     except Exception as e:
         print(f"❌ 承認データ読み込みエラー: {e}")
         return []
 
-def save_approval_data(approvals):
-    """承認データを保存"""
+# 処理済み（これ以上リアクションを確認しない）ステータス
+DONE_STATUSES = ["approved_executed", "rejected"]
+# コピー実行中のステータス（定期実行とSlackイベントのジョブのどちらかが引き受けたもの）
+RUNNING_STATUS = "approved_running"
+# 実行中のままこの時間（秒）を超えた承認は、実行したプロセスが落ちたとみなして引き受け直す
+COPY_STALE_SECONDS = int(os.getenv("COPY_STALE_SECONDS", "900"))
+
+def is_copy_running(approval):
+    """他の処理がコピーを実行中か（実行中のまま古くなったものは含まない）"""
+    if approval.get("status") != RUNNING_STATUS:
+        return False
     try:
-        with open(APPROVAL_FILE, "r", encoding="utf-8") as f:
-            existing = json.load(f)
-    except FileNotFoundError:
-        existing = []
-    except Exception as e:
-        print(f"❌ 承認データ読み込みエラー（保存時）: {e}")
-        return
-
-    # 既存レコードを更新（adset_id + message_ts をキーにマージ）
-    updated = []
-    for entry in existing:
-        if not isinstance(entry, dict):
-            updated.append(entry)
-            continue
+        started_at = datetime.fromisoformat(approval["copy_started_at"])
+    except (KeyError, TypeError, ValueError):
+        return False
+    return datetime.now() - started_at < timedelta(seconds=COPY_STALE_SECONDS)
 
-        key = (entry.get("adset_id"), entry.get("message_ts"))
-        override = next(
-            (a for a in approvals if (a.get("adset_id"), a.get("message_ts")) == key),
-            None,
-        )
-        updated.append(override if override else entry)
+def claim_copy(approval, **fields):
+    """コピーの実行を引き受ける（承認データを読み込んだときから変わっていない場合だけ approved_running にする）
 
-    # 既存に無かった新規レコードを追加
-    existing_keys = {(e.get("adset_id"), e.get("message_ts")) for e in existing if isinstance(e, dict)}
-    for approval in approvals:
-        key = (approval.get("adset_id"), approval.get("message_ts"))
-        if key not in existing_keys:
-            updated.append(approval)
+    定期実行とSlackイベントのジョブが同じ広告セットを二重にコピーしないよう、
+    先に引き受けた方だけがコピーを実行する
 
-    try:
-        with open(APPROVAL_FILE, "w", encoding="utf-8") as f:
-            json.dump(updated, f, ensure_ascii=False, indent=2)
-        print(f"✅ 承認データを保存: {APPROVAL_FILE}")
-    except Exception as e:
-        print(f"❌ 承認データ保存エラー: {e}")
+    Returns:
+        引き受けた場合True
+    """
+    if approval.get("status") in DONE_STATUSES or is_copy_running(approval):
+        return False
+    fields = dict(fields, status=RUNNING_STATUS, copy_started_at=datetime.now().isoformat())
+    expected = {"status": approval.get("status"), "copy_started_at": approval.get("copy_started_at")}
+    if not approval_store.update_approval_if(approval["id"], expected, **fields):
+        return False
+    approval.update(fields)
+    return True
+
+def finish_copy(approval, copied):
+    """引き受けたコピーの結果を記録"""
+    fields = {
+        "status": "approved_executed" if copied else "approved_error",
+        "executed_at": datetime.now().isoformat(),
+    }
+    # 実行中に古くなって他に引き受け直された場合は、後から引き受けた方の結果を残す
+    expected = {"status": RUNNING_STATUS, "copy_started_at": approval.get("copy_started_at")}
+    if approval_store.update_approval_if(approval["id"], expected, **fields):
+        approval.update(fields)
 
-def check_approval_status(message_ts):
-    """Slackリアクションで承認状態を確認"""
+def check_approval_status(message_ts, reactions_by_ts=None):
+    """Slackリアクションで承認状態を確認（reactions_by_tsがあればそこから判定）"""
     if not SLACK_BOT_TOKEN or not SLACK_CHANNEL_ID:
         return None
     
-    reactions = get_message_reactions(message_ts)
+    if reactions_by_ts is not None and message_ts in reactions_by_ts:
+        reactions = reactions_by_ts[message_ts]
+    else:
+        reactions = get_message_reactions(message_ts)
     
     if not reactions:
         return "pending"
@@ -107,6 +106,86 @@ def check_approval_status(message_ts):
     
     return "pending"
 
+def is_snapshot_fresh(snapshot):
+    """スキャン結果のスナップショットが再利用可能な新しさかを確認"""
+    if not snapshot or not snapshot.get("ads") or not snapshot.get("account_id"):
+        return False
+    try:
+        scanned_at = datetime.fromisoformat(snapshot["scanned_at"])
+    except (KeyError, TypeError, ValueError):
+        return False
+    return datetime.now() - scanned_at <= timedelta(hours=SNAPSHOT_MAX_AGE_HOURS)
+
+def copy_from_snapshot(approval):
+    """スナップショットからコピー計画を組み立て、書き込みのみを実行
+
+    Returns:
+        True: コピー成功またはスキップ条件に該当 / False: コピー失敗
+    """
+    from ad_copy_low_impression import build_adset_plan, apply_adset_plan, send_slack_notification
+    
+    snapshot = approval["scan_snapshot"]
+    adset = {
+        "id": approval["adset_id"],
+        "name": approval["adset_name"],
+        "campaign_id": approval.get("campaign_id"),
+        "account_id": snapshot["account_id"]
+    }
+    ads = snapshot["ads"]
+    impressions_by_id = {ad["id"]: ad.get("impressions", 0) for ad in ads}
+    
+    entry, skip_message = build_adset_plan(adset, ads, impressions_by_id)
+    if not entry:
+        print(f"   {skip_message}")
+        send_slack_notification(skip_message)
+        return True
+    
+    return apply_adset_plan(entry) is not None
+
+def execute_copy(approval):
+    """承認された広告セットのコピーを実行
+
+    Returns:
+        True: コピー成功（またはスキップ条件に該当） / False: 失敗
+    """
+    # 承認リクエスト時のスキャン結果が新しければ再取得せずにコピー
+    snapshot = approval.get("scan_snapshot")
+    if is_snapshot_fresh(snapshot):
+        print(f"   📦 スキャン結果を再利用（スキャン日時: {snapshot['scanned_at']}）")
+        try:
+            copied = copy_from_snapshot(approval)
+        except Exception as e:
+            print(f"   ❌ エラー: {e}")
+            copied = False
+        if not copied:
+            print(f"   ❌ コピー失敗")
+        return copied
+    
+    # ad_copy_low_impression.pyを実行
+    env = os.environ.copy()
+    env["TARGET_ADSET_ID"] = approval["adset_id"]
+    
+    try:
+        result = subprocess.run(
+            ["python3", "ad_copy_low_impression.py"],
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=300
+        )
+    except subprocess.TimeoutExpired:
+        print(f"   ❌ タイムアウト")
+        return False
+    except Exception as e:
+        print(f"   ❌ エラー: {e}")
+        return False
+    
+    if result.returncode != 0:
+        print(f"   ❌ コピー失敗")
+        print(f"   出力: {result.stdout}")
+        return False
+    return True
+
 def main():
     """メイン処理"""
     print("=" * 60)
@@ -127,6 +206,13 @@ def main():
     success_count = 0
     error_count = 0
     
+    # 未処理の承認リクエストのリアクションをチャンネル履歴からまとめて取得
+    reactions_by_ts = None
+    if SLACK_BOT_TOKEN and SLACK_CHANNEL_ID:
+        reactions_by_ts = get_reactions_for_messages(
+            [a["message_ts"] for a in approvals if a.get("status", "pending") not in DONE_STATUSES]
+        )
+    
     # 各承認リクエストを処理
     for approval in approvals:
         adset_id = approval["adset_id"]
@@ -138,62 +224,47 @@ def main():
         print(f"   ID: {adset_id}")
         print(f"   現在のステータス: {current_status}")
         
-        # 既に処理済みの場合はスキップ
-        if current_status in ["approved_executed", "rejected"]:
+        # 既に処理済み・実行中の場合はスキップ
+        if current_status in DONE_STATUSES:
             print(f"   ⚠️  既に処理済みのためスキップ")
             continue
+        if is_copy_running(approval):
+            print(f"   ⚠️  他の処理でコピーを実行中のためスキップ")
+            continue
         
         # Slackリアクションを確認
-        status = check_approval_status(message_ts)
+        status = check_approval_status(message_ts, reactions_by_ts)
         print(f"   Slackリアクション: {status}")
         
         if status == "approved":
+            # Slackイベントのジョブが先に引き受けた場合は実行しない
+            if not claim_copy(approval):
+                print(f"   ⚠️  他の処理が先にコピーを引き受けたためスキップ")
+                continue
             approved_count += 1
             print(f"   ✅ 承認されました - コピーを実行します")
             
-            # ad_copy_low_impression.pyを実行
-            env = os.environ.copy()
-            env["TARGET_ADSET_ID"] = adset_id
-            
-            try:
-                result = subprocess.run(
-                    ["python3", "ad_copy_low_impression.py"],
-                    env=env,
-                    capture_output=True,
-                    text=True,
-                    timeout=300
-                )
-                
-                if result.returncode == 0:
-                    print(f"   ✅ コピー成功")
-                    approval["status"] = "approved_executed"
-                    success_count += 1
-                else:
-                    print(f"   ❌ コピー失敗")
-                    print(f"   出力: {result.stdout}")
-                    approval["status"] = "approved_error"
-                    error_count += 1
-            
-            except subprocess.TimeoutExpired:
-                print(f"   ❌ タイムアウト")
-                approval["status"] = "approved_error"
-                error_count += 1
-            except Exception as e:
-                print(f"   ❌ エラー: {e}")
-                approval["status"] = "approved_error"
+            copied = execute_copy(approval)
+            finish_copy(approval, copied)
+            if copied:
+                print(f"   ✅ コピー成功")
+                success_count += 1
+            else:
                 error_count += 1
         
         elif status == "rejected":
             rejected_count += 1
             print(f"   ❌ 却下されました")
-            approval["status"] = "rejected"
+            fields = {"status": "rejected", "rejected_at": datetime.now().isoformat()}
+            if approval_store.update_approval_if(approval["id"], {"status": approval.get("status")}, **fields):
+                approval.update(fields)
         
         else:
             pending_count += 1
             print(f"   ⏳ まだ承認されていません")
     
-    # 承認データを保存
-    save_approval_data(approvals)
+    # 承認データは1件ずつ処理した時点で保存済み（まとめて書き戻すとジョブの結果を上書きしてしまう）
+    print(f"\n✅ 承認データの保存先: {approval_store.store_path()}")
     
     # サマリーを表示
     print("\n" + "=" * 60)
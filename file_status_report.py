@@ -1,13 +1,25 @@
 import argparse
+import gzip
 import json
 import os
 from datetime import datetime
 from typing import Any, Dict, List
 
+from local_state import read_json
+
+# 各スクリプトと同じ環境変数・デフォルト値で現在の保存先を決める
+if os.getenv("APPROVAL_STORE_BACKEND", "sqlite") == "eventlog":
+    APPROVAL_FILE = os.getenv("APPROVAL_LOG_FILE", "approvals.jsonl")
+else:
+    APPROVAL_FILE = os.getenv("APPROVAL_DB_FILE", "approvals.db")
+
 DEFAULT_FILES = [
-    "pending_approvals.json",
-    "slack_reactions.json",
+    APPROVAL_FILE,
+    os.getenv("REACTION_LOG_FILE", "slack_reactions.jsonl"),
+    os.getenv("JOB_LOG_FILE", "job_queue.jsonl"),
     "ad_copy_history.json",
+    os.getenv("COPY_PLAN_FILE", "ad_copy_plan.json"),
+    os.getenv("ARCHIVE_DIR", "archive"),
 ]
 
 
@@ -26,9 +38,84 @@ def summarize_statuses(entries: List[Dict[str, Any]]) -> Dict[str, int]:
     return summary
 
 
+def inspect_approval_db(path: str) -> None:
+    import approval_store
+
+    approval_store.APPROVAL_DB_FILE = path
+    status_summary = approval_store.count_by_status()
+    print(f"レコード数: {sum(status_summary.values())}")
+    if status_summary:
+        print("ステータス内訳:")
+        for status, count in sorted(status_summary.items()):
+            print(f"  - {status}: {count}")
+
+
+def print_status_summary(entries: List[Dict[str, Any]]) -> None:
+    status_summary = summarize_statuses(entries)
+    if status_summary:
+        print("ステータス内訳:")
+        for status, count in sorted(status_summary.items()):
+            print(f"  - {status}: {count}")
+
+
+def inspect_event_log(path: str) -> None:
+    """イベントログ（.jsonl）をスナップショット・コンパクション中ログと合わせて確認"""
+    from event_log import EventLog
+
+    log = EventLog(path)
+    for label, file_path in (("スナップショット", log.snapshot_path), ("コンパクション中", log.segment_path)):
+        if os.path.exists(file_path):
+            print(f"{label}: {file_path} ({os.path.getsize(file_path)} bytes, {format_ts(os.path.getmtime(file_path))})")
+
+    try:
+        events, _ = EventLog._read_events(path)
+        records = list(log.records().values())
+    except Exception as exc:
+        print(f"[エラー] 読み込みに失敗しました: {exc}")
+        return
+
+    print(f"未コンパクションのイベント数: {len(events)}")
+    print(f"スナップショット世代: {log._generation}")
+    print(f"レコード数: {len(records)}")
+    print_status_summary(records)
+
+
+def inspect_archive(path: str) -> None:
+    """アーカイブディレクトリ（データセットごとの月別 .jsonl.gz）を確認"""
+    total = 0
+    for root, _dirs, files in sorted(os.walk(path)):
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            size = os.path.getsize(file_path)
+            total += size
+            line = f"  - {os.path.relpath(file_path, path)}: {size} bytes"
+            if name.endswith(".jsonl.gz"):
+                try:
+                    with gzip.open(file_path, "rb") as f:
+                        line += f", {sum(1 for row in f if row.strip())}件"
+                except Exception as exc:
+                    line += f" [エラー] {exc}"
+            print(line)
+    print(f"合計サイズ: {total} bytes")
+
+
 def inspect_file(path: str) -> None:
     print(f"\n=== {path} ===")
 
+    if os.path.isdir(path):
+        print(f"パス: {os.path.abspath(path)}")
+        inspect_archive(path)
+        return
+
+    # イベントログはスナップショットだけでも状態を持っている
+    if path.endswith(".jsonl") and (os.path.exists(path) or os.path.exists(path + ".snapshot")):
+        if os.path.exists(path):
+            print(f"パス: {os.path.abspath(path)}")
+            print(f"サイズ: {os.path.getsize(path)} bytes")
+            print(f"最終更新: {format_ts(os.path.getmtime(path))}")
+        inspect_event_log(path)
+        return
+
     if not os.path.exists(path):
         print("[警告] ファイルが存在しません")
         return
@@ -39,20 +126,27 @@ def inspect_file(path: str) -> None:
     print(f"サイズ: {size} bytes")
     print(f"最終更新: {mtime}")
 
+    if path.endswith(".db"):
+        inspect_approval_db(path)
+        return
+
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = read_json(path)
     except Exception as exc:
-        print(f"[エラー] JSON読み込みに失敗しました: {exc}")
+        print(f"[エラー] 読み込みに失敗しました: {exc}")
+        return
+
+    if isinstance(data, dict) and path.endswith(".snapshot"):
+        records = [record for _key, record in data.get("records", [])]
+        print(f"スナップショット世代: {data.get('generation', 0)}")
+        print(f"コンパクション日時: {data.get('compacted_at')}")
+        print(f"レコード数: {len(records)}")
+        print_status_summary(records)
         return
 
     if isinstance(data, list):
         print(f"レコード数: {len(data)}")
-        status_summary = summarize_statuses(data)
-        if status_summary:
-            print("ステータス内訳:")
-            for status, count in sorted(status_summary.items()):
-                print(f"  - {status}: {count}")
+        print_status_summary(data)
         preview = data[:3]
         if preview:
             print("サンプル(最大3件):")
@@ -66,7 +160,7 @@ def inspect_file(path: str) -> None:
 
 def main() -> None:
     parser = argparse.ArgumentParser(
-        description="approval/slackリアクションファイルの状態を確認する簡易ツール"
+        description="承認・Slackリアクション・ジョブ・コピー履歴ファイルの状態を確認する簡易ツール"
     )
     parser.add_argument(
         "files",
@@ -0,0 +1,41 @@
+"""
+approval_web.py の本番用Gunicorn設定
+
+    gunicorn -c gunicorn.conf.py approval_web:app
+
+複数のワーカープロセス（それぞれ複数スレッド）でリクエストを処理する。
+承認ストアはSQLite（WAL）またはファイルロック付きのイベントログなので、
+ワーカープロセス間で同時に読み書きしても壊れない。
+Web UIのキャッシュはファイルの更新を見て読み直すので、他のワーカーの書き込みもすぐ反映される。
+
+環境変数:
+    PORT                 待ち受けポート（デフォルト5000）
+    WEB_WORKERS          ワーカープロセス数（デフォルト2）
+    WEB_THREADS          ワーカーごとのスレッド数（デフォルト8）。開いている画面ごとに
+                         ライブ更新の接続が1スレッドを使うので、同時に開く画面数より多くする
+    WEB_TIMEOUT          1リクエストの処理時間の上限（秒、デフォルト60）
+    WEB_GRACEFUL_TIMEOUT 停止・再起動時に処理中のリクエストを待つ時間（秒、デフォルト30）
+
+設定やコードを更新したときは、処理中のリクエストを止めずに再起動できる:
+    kill -HUP <gunicornのマスタープロセスのPID>
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = "gthread"
+workers = int(os.getenv("WEB_WORKERS", "2"))
+threads = int(os.getenv("WEB_THREADS", "8"))
+timeout = int(os.getenv("WEB_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+# ワーカーごとに承認ストアの接続・ジョブワーカーを持つため、アプリはフォーク後に読み込む
+preload_app = False
+
+# 長時間動かしてもメモリが膨らまないよう、一定数のリクエストごとにワーカーを入れ替える
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = "-"
+errorlog = "-"
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+承認後の処理（広告停止・広告コピー）のジョブキュー
+
+Slackイベント・Web UIなどから登録されたジョブをバックグラウンドのワーカー（JOB_WORKERSスレッド）で実行する。
+ジョブはイベントログ（job_queue.jsonl）に記録するので、プロセスが再起動しても
+未実行のジョブは失われず、次に起動したワーカーが続きから実行する。
+
+まとめて実行する種類のジョブ（register_handlerでbatch_windowを指定）は、最初のジョブの登録から
+batch_window秒の間に登録された同じ種類のジョブを、最大JOB_BATCH_SIZE件まとめて1回で処理する。
+
+ジョブの状態:
+    queued     実行待ち
+    running    実行中
+    done       完了
+    failed     失敗（JOB_MAX_ATTEMPTS回まで再試行）
+    cancelled  取り消し（承認リアクションが外された場合など）
+
+使い方（ワーカーを起動せずに溜まったジョブだけ実行する場合）:
+    python3 job_queue.py run
+"""
+
+import os
+import sys
+import time
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from event_log import EventLog
+
+JOB_LOG_FILE = os.getenv("JOB_LOG_FILE", "job_queue.jsonl")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# 他プロセスが登録したジョブを拾うための確認間隔（秒）
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "5"))
+# プロセスごとのワーカースレッド数
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# まとめて実行するジョブの1回あたりの最大件数
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "50"))
+
+# 実行中のジョブがこの時間（秒）を超えて残っている場合は、ワーカーが落ちたとみなして再実行する
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "900"))
+# 失敗したジョブの再試行までの待ち時間（秒、試行回数に比例）
+JOB_RETRY_DELAY = int(os.getenv("JOB_RETRY_DELAY", "60"))
+# 完了・失敗・取り消しのジョブを残す日数
+JOB_KEEP_DAYS = int(os.getenv("JOB_KEEP_DAYS", "7"))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_handlers = {}
+# まとめて実行するジョブの種類 → 待つ時間（秒）
+_batch_windows = {}
+_log = None
+_log_lock = threading.Lock()
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def get_job_log():
+    global _log
+    with _log_lock:
+        if _log is None:
+            _log = EventLog(JOB_LOG_FILE)
+        return _log
+
+
+def register_handler(kind, handler, batch_window=None):
+    """ジョブの種類ごとの処理を登録
+
+    通常は handler(payload) が例外を出さなければ完了。
+    batch_windowを指定した場合は handler(payloads) でまとめて処理し、
+    ペイロードごとのエラー（成功はNone）のリストを返す
+    """
+    _handlers[kind] = handler
+    if batch_window is not None:
+        _batch_windows[kind] = batch_window
+    else:
+        _batch_windows.pop(kind, None)
+
+
+def enqueue(kind, payload, dedupe_key=None):
+    """ジョブを登録し、ジョブIDを返す
+
+    同じdedupe_keyのジョブが実行待ち・実行中の場合は登録せずにそのIDを返す
+    （Slackイベントの再送や、同じメッセージへの重複リアクション対策）
+    """
+    return enqueue_many(kind, [(payload, dedupe_key)])[0]
+
+
+def enqueue_many(kind, items):
+    """複数のジョブをまとめて登録（ログへの追記は1回）
+
+    Args:
+        items: [(payload, dedupe_key), ...]
+    Returns:
+        ジョブIDのリスト
+    """
+    log = get_job_log()
+    job_ids, events = [], []
+    with log.exclusive():
+        active = {
+            job.get("dedupe_key"): job_id for job_id, job in log.records().items()
+            if job.get("dedupe_key") is not None and job.get("status") in ACTIVE_STATUSES
+        }
+        now = datetime.now().isoformat()
+        for payload, dedupe_key in items:
+            if dedupe_key is not None and dedupe_key in active:
+                job_ids.append(active[dedupe_key])
+                continue
+
+            job_id = f"{time.time_ns() // 1000}-{os.getpid()}-{len(events)}"
+            events.append({"op": "put", "key": job_id, "record": {
+                "kind": kind,
+                "payload": payload,
+                "dedupe_key": dedupe_key,
+                "status": "queued",
+                "attempts": 0,
+                "created_at": now,
+            }})
+            job_ids.append(job_id)
+            if dedupe_key is not None:
+                active[dedupe_key] = job_id
+        if events:
+            log.append(*events)
+
+    if events:
+        _wakeup.set()
+        print(f"📥 ジョブを登録: {kind} {len(events)}件")
+    return job_ids
+
+
+def cancel(dedupe_key):
+    """実行待ちのジョブを取り消す（実行中・完了済みのジョブは取り消せない）"""
+    log = get_job_log()
+    cancelled = 0
+    with log.exclusive():
+        for job_id, job in list(log.records().items()):
+            if job.get("dedupe_key") == dedupe_key and job.get("status") == "queued":
+                log.update(job_id, status="cancelled", finished_at=datetime.now().isoformat())
+                cancelled += 1
+    return cancelled
+
+
+def _is_stale(job):
+    started_at = job.get("started_at")
+    if not started_at:
+        return True
+    return (datetime.now() - datetime.fromisoformat(started_at)).total_seconds() > JOB_STALE_SECONDS
+
+
+def _is_runnable(job, now):
+    status = job.get("status")
+    if status == "queued":
+        return job.get("retry_at", "") <= now
+    return status == "running" and _is_stale(job)
+
+
+def claim_next(flush=False):
+    """実行待ちのジョブを取り出して実行中にする（他のワーカーと同じジョブを取らない）
+
+    まとめて実行する種類のジョブは、最も古いジョブの登録からbatch_window秒経つか
+    JOB_BATCH_SIZE件溜まってから、同じ種類のジョブをまとめて取り出す（flush=Trueなら待たない）
+
+    Returns:
+        ([(job_id, job), ...], まとめて実行できるようになるまでの秒数（待っているジョブが無ければNone）)
+    """
+    log = get_job_log()
+    now = datetime.now()
+    wait = None
+    with log.exclusive():
+        runnable = [
+            (job_id, job) for job_id, job in log.records().items()
+            if _is_runnable(job, now.isoformat())
+        ]
+        waiting_kinds = set()
+        for job_id, job in runnable:
+            kind = job.get("kind")
+            if kind not in _batch_windows:
+                claimed = [(job_id, job)]
+                break
+            if kind in waiting_kinds:
+                continue
+
+            group = [(i, j) for i, j in runnable if j.get("kind") == kind][:JOB_BATCH_SIZE]
+            age = (now - datetime.fromisoformat(job["created_at"])).total_seconds()
+            remaining = _batch_windows[kind] - age
+            if flush or remaining <= 0 or len(group) >= JOB_BATCH_SIZE:
+                claimed = group
+                break
+            waiting_kinds.add(kind)
+            wait = remaining if wait is None else min(wait, remaining)
+        else:
+            return [], wait
+
+        started_at = datetime.now().isoformat()
+        result = []
+        for job_id, job in claimed:
+            attempts = job.get("attempts", 0) + 1
+            result.append((job_id, dict(job, attempts=attempts)))
+        log.append(*(
+            {"op": "update", "key": job_id, "fields": {
+                "status": "running", "attempts": job["attempts"], "started_at": started_at,
+            }}
+            for job_id, job in result
+        ))
+    return result, None
+
+
+def _finish(job_id, job, error):
+    """ジョブの結果を記録（失敗した場合はJOB_MAX_ATTEMPTS回まで再試行）"""
+    log = get_job_log()
+    if error is None:
+        log.update(job_id, status="done", finished_at=datetime.now().isoformat())
+        print(f"✅ ジョブ完了: {job['kind']} {job_id}")
+        return True
+
+    attempts = job.get("attempts", 1)
+    retry = attempts < JOB_MAX_ATTEMPTS
+    retry_at = datetime.now() + timedelta(seconds=JOB_RETRY_DELAY * attempts)
+    log.update(job_id, status="queued" if retry else "failed", error=str(error),
+               retry_at=retry_at.isoformat(), finished_at=datetime.now().isoformat())
+    print(f"❌ ジョブ失敗: {job['kind']} {job_id}（{'再試行します' if retry else '再試行上限'}）")
+    return False
+
+
+def run_job(job_id, job):
+    """ジョブを1件実行し、結果を記録"""
+    handler = _handlers.get(job["kind"])
+    if handler is None:
+        get_job_log().update(job_id, status="failed", error=f"未登録のジョブ: {job['kind']}",
+                             finished_at=datetime.now().isoformat())
+        return False
+
+    try:
+        handler(job.get("payload") or {})
+    except Exception as e:
+        traceback.print_exc()
+        return _finish(job_id, job, e)
+    return _finish(job_id, job, None)
+
+
+def run_batch(jobs):
+    """同じ種類のジョブをまとめて実行し、ジョブごとの結果を記録"""
+    kind = jobs[0][1]["kind"]
+    try:
+        errors = _handlers[kind]([job.get("payload") or {} for _, job in jobs])
+    except Exception as e:
+        traceback.print_exc()
+        errors = [e] * len(jobs)
+    print(f"📦 まとめて実行: {kind} {len(jobs)}件")
+    return [_finish(job_id, job, error) for (job_id, job), error in zip(jobs, errors)]
+
+
+def _run_until_idle(flush=False):
+    """実行できるジョブがなくなるまで実行し、(実行した件数, 次にまとめて実行できるまでの秒数) を返す"""
+    count = 0
+    while True:
+        jobs, wait = claim_next(flush)
+        if not jobs:
+            return count, wait
+        if jobs[0][1]["kind"] in _batch_windows:
+            run_batch(jobs)
+        else:
+            run_job(*jobs[0])
+        count += len(jobs)
+
+
+def run_pending():
+    """実行待ちのジョブがなくなるまで実行し、実行した件数を返す（まとめて実行するジョブも待たずに実行）"""
+    return _run_until_idle(flush=True)[0]
+
+
+def purge_finished():
+    """JOB_KEEP_DAYSを過ぎた完了・失敗・取り消しのジョブを削除"""
+    log = get_job_log()
+    cutoff = (datetime.now() - timedelta(days=JOB_KEEP_DAYS)).isoformat()
+    with log.exclusive():
+        expired = [
+            job_id for job_id, job in log.records().items()
+            if job.get("status") not in ACTIVE_STATUSES and job.get("finished_at", "") < cutoff
+        ]
+        if expired:
+            log.append(*({"op": "delete", "key": job_id} for job_id in expired))
+    return len(expired)
+
+
+def _worker_loop(purge=False):
+    if purge:
+        try:
+            purge_finished()
+        except Exception as e:
+            print(f"ジョブ削除エラー: {e}")
+    while True:
+        _wakeup.clear()
+        wait = None
+        try:
+            wait = _run_until_idle()[1]
+        except Exception as e:
+            print(f"ジョブワーカーエラー: {e}")
+        # まとめて実行するジョブを待っている場合は、その時間になったら起きる
+        _wakeup.wait(JOB_POLL_INTERVAL if wait is None else min(wait, JOB_POLL_INTERVAL))
+
+
+def start_worker():
+    """バックグラウンドのワーカースレッド（JOB_WORKERS個）を起動（起動済みなら何もしない）"""
+    with _workers_lock:
+        first_start = not _workers
+        _workers[:] = [worker for worker in _workers if worker.is_alive()]
+        while len(_workers) < JOB_WORKERS:
+            # 完了済みジョブの削除は最初に起動したワーカーだけが行う
+            worker = threading.Thread(
+                target=_worker_loop, kwargs={"purge": first_start and not _workers},
+                name=f"job-worker-{len(_workers) + 1}", daemon=True,
+            )
+            worker.start()
+            _workers.append(worker)
+        return list(_workers)
+
+
+def main():
+    if len(sys.argv) == 2 and sys.argv[1] == "run":
+        import slack_events
+
+        slack_events.register_handlers()
+
+        purge_finished()
+        count = run_pending()
+        print(f"✅ {count}件のジョブを実行しました")
+        return
+
+    print("使い方:")
+    print("  python3 job_queue.py run")
+
+
+if __name__ == "__main__":
+    main()
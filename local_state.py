@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+ローカル状態ファイルの安全な読み書き
+
+Web UIとGitHub Actionsの各スクリプトが同じファイルを同時に読み書きしても
+更新が失われないようにするためのユーティリティ。
+
+- 書き込みは一時ファイルに書いてからos.replaceで置き換える（読み手は常に完全なファイルを読む）
+- 読み込み→変更→書き込みはアドバイザリロック（<path>.lock）で直列化する
+- 読み込みはロックを取らない（書き込みを待たせない）
+- 形式はserialization.pyで選択（orjson / msgpack、読み込み時は自動判定）
+- 読み込んだ内容はプロセス内にキャッシュし、ファイルの更新日時・サイズが変わった時だけ読み直せる
+"""
+
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import serialization
+
+try:
+    import fcntl
+except ModuleNotFoundError:
+    # Windowsなどfcntlが無い環境ではプロセス間ロックを行わない
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path, shared=False, blocking=True):
+    """<path>.lock に対するアドバイザリロック
+
+    blocking=Falseで取得できなかった場合はFalseを返す（withの値）
+    """
+    lock_path = path + ".lock"
+    directory = os.path.dirname(os.path.abspath(lock_path))
+    os.makedirs(directory, exist_ok=True)
+
+    with open(lock_path, "a") as lock_file:
+        if fcntl is None:
+            yield True
+            return
+
+        flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(lock_file.fileno(), flags)
+        except BlockingIOError:
+            yield False
+            return
+
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def atomic_write_bytes(path, data):
+    """一時ファイルに書き込んでから置き換える（途中で落ちても元のファイルは壊れない）"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_json(path, data, indent=2):
+    """状態データをアトミックに書き込む（STATE_FORMAT=msgpackの場合はmsgpack）"""
+    atomic_write_bytes(path, serialization.dumps(data, indent=indent))
+
+
+def read_json(path, default=None):
+    """状態データを読み込む（ロックなし。書き込みは置き換えなので常に完全な内容が読める）
+
+    JSON / msgpack のどちらで保存されていても読める
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return default
+    return serialization.loads(data)
+
+
+def file_signature(*paths):
+    """ファイルの (inode, 更新日時, サイズ) の組。存在しないファイルはNone
+
+    書き込みは置き換えなのでinodeも変わり、同じサイズ・同じ時刻の更新も見分けられる
+    """
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            signature.append(None)
+            continue
+        signature.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def cached(key, signature, load):
+    """signatureが前回と同じならキャッシュを返し、変わっていればload()で読み直す
+
+    返す値はキャッシュそのものなので、呼び出し側で変更しないこと
+    """
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+
+    value = load()
+    with _cache_lock:
+        _cache[key] = (signature, value)
+    return value
+
+
+def read_json_cached(path, default=None):
+    """read_jsonの結果をファイルが変わるまでキャッシュする（返す値は変更しないこと）"""
+    signature = file_signature(path)
+    if signature == (None,):
+        return default
+    return cached(("json", os.path.abspath(path)), signature, lambda: read_json(path, default))
+
+
+def update_json(path, default, update):
+    """ロックを取って読み込み→update(data)→書き込みを行う
+
+    update は data を直接変更するか、新しい値を返す
+    """
+    with file_lock(path):
+        data = read_json(path, default)
+        result = update(data)
+        if result is not None:
+            data = result
+        atomic_write_json(path, data)
+    return data
@@ -1,10 +1,17 @@
 import os
-import json
 from datetime import datetime
 
 import requests
 import gspread
-from slack_reaction_helper import send_slack_message_with_bot, send_slack_message_with_blocks
+import approval_store
+import slack_client
+import thumbnail_cache
+from sink_pipeline import Sink, BufferedSink, SinkPipeline
+from slack_reaction_helper import (
+    send_slack_message_with_blocks,
+    send_slack_digest_with_blocks,
+    is_digest_enabled,
+)
 
 try:
     from dotenv import load_dotenv
@@ -25,8 +32,8 @@ CAMPAIGN_IDS = "120231962646350484,120230617419590484"  # ← 固定のキャン
 SLACK_WEBHOOK_URL = os.getenv("SLACK_WEBHOOK_URL")
 SPREADSHEET_URL = os.getenv("SPREADSHEET_URL")
 APPROVAL_WEB_URL = os.getenv("APPROVAL_WEB_URL", "http://localhost:5000")  # 承認用WebページのURL
-
-APPROVAL_FILE = "pending_approvals.json"
+# まとめ通知の単位: account=アカウントごとに1通 / campaign=キャンペーンごとに1通
+SLACK_DIGEST_GROUP = os.getenv("SLACK_DIGEST_GROUP", "account")
 
 if not ACCESS_TOKEN:
     print("[警告] ACCESS_TOKENが未設定のため、Meta APIへのアクセスはスキップされます")
@@ -47,39 +54,10 @@ def get_campaign_ids():
         return [cid.strip() for cid in CAMPAIGN_IDS.split(',') if cid.strip()]
     return []
 
-# --- JSON Approval Management ---
-def load_approvals():
-    """承認データを読み込む"""
-    if not os.path.exists(APPROVAL_FILE):
-        return []
-    try:
-        with open(APPROVAL_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"承認データ読み込みエラー: {e}")
-        return []
-
-def save_approvals(data):
-    """承認データを保存する"""
-    try:
-        with open(APPROVAL_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        return True
-    except Exception as e:
-        print(f"承認データ保存エラー: {e}")
-        return False
-
-def add_pending_approval(ad_id, ad_name, campaign_name, adset_name, cpa, image_url):
-    """停止候補を承認待ちリストに追加"""
-    approvals = load_approvals()
-    
-    # 既に同じ広告IDが存在するかチェック
-    existing = next((a for a in approvals if a.get('ad_id') == ad_id), None)
-    if existing and existing.get('status') == 'pending':
-        print(f"ℹ️ 広告 {ad_id} は既に承認待ちリストに存在します")
-        return False
-    
-    new_approval = {
+# --- Approval Management ---
+def build_pending_approval(ad_id, ad_name, campaign_name, adset_name, cpa, image_url):
+    """承認待ちレコードを作成"""
+    return {
         "ad_id": ad_id,
         "ad_name": ad_name,
         "campaign_name": campaign_name,
@@ -91,11 +69,25 @@ def add_pending_approval(ad_id, ad_name, campaign_name, adset_name, cpa, image_u
         "approved_at": None,
         "approved_by": None
     }
-    
-    approvals.append(new_approval)
-    save_approvals(approvals)
-    print(f"✅ 広告 {ad_id} を承認待ちリストに追加しました")
-    return True
+
+def add_pending_approvals(approvals):
+    """停止候補をまとめて承認待ちリストに追加（既に承認待ちの広告は最新の値に更新）"""
+    if not approvals:
+        return [], []
+
+    added, updated = approval_store.upsert_pending_approvals(approvals)
+    if added:
+        print(f"✅ {len(added)}件の広告を承認待ちリストに追加しました")
+    if updated:
+        print(f"ℹ️ {len(updated)}件の広告は既に承認待ちのため、CPA・画像URLを更新しました")
+    return added, updated
+
+def add_pending_approval(ad_id, ad_name, campaign_name, adset_name, cpa, image_url):
+    """停止候補を1件承認待ちリストに追加"""
+    added, _ = add_pending_approvals([
+        build_pending_approval(ad_id, ad_name, campaign_name, adset_name, cpa, image_url)
+    ])
+    return bool(added)
 
 # --- Google Sheets ---
 def get_sheet():
@@ -117,11 +109,12 @@ def get_sheet():
 def write_rows_to_sheet(rows):
     sheet = get_sheet()
     if not sheet:
-        return
+        return False
 
     if not sheet.row_values(1):
         sheet.append_row(["広告キャンペーン", "広告グループ", "広告ID", "広告名", "CPA", "画像URL"])
     sheet.append_rows(rows, value_input_option='USER_ENTERED')
+    return True
 
 # --- Meta API Fetch Functions ---
 def fetch_ad_ids(account_id, campaign_ids=None):
@@ -132,8 +125,9 @@ def fetch_ad_ids(account_id, campaign_ids=None):
     if campaign_ids and len(campaign_ids) > 0:
         for cid in campaign_ids:
             url = f"https://graph.facebook.com/v19.0/{cid}/ads"
+            # 停止候補の通知に使う画像・キャンペーン名・広告セット名も一緒に取得する
             params = [
-                ("fields", "id,name,effective_status"),
+                ("fields", "id,name,effective_status,campaign{name},adset{name},creative{thumbnail_url}"),
                 ("limit", 50),
                 ("access_token", ACCESS_TOKEN),
                 ("effective_status", "['ACTIVE']")  # 元のまま使用
@@ -204,14 +198,6 @@ def has_lifetime_conversions(ad_id):
         print(f"❌ 全期間CV確認エラー ({ad_id}):", e)
         return False
 
-def fetch_creative_image_url(ad_id):
-    if not ACCESS_TOKEN:
-        return "画像なし"
-
-    url = f"https://graph.facebook.com/v19.0/{ad_id}?fields=creative{{thumbnail_url}}&access_token={ACCESS_TOKEN}"
-    res = requests.get(url)
-    return res.json().get("creative", {}).get("thumbnail_url", "画像なし")
-
 def fetch_ad_details(ad_id):
     if not ACCESS_TOKEN:
         return {}
@@ -264,21 +250,23 @@ def post_slack_message(text):
         return False
 
     payload = {"text": text}
-    res = requests.post(SLACK_WEBHOOK_URL, json=payload)
-    print("Slack通知結果:", res.status_code)
-    return res.status_code == 200
+    result = slack_client.post_webhook(SLACK_WEBHOOK_URL, payload)
+    print("Slack通知結果:", "ok" if result.get("ok") else result.get("error"))
+    return bool(result.get("ok"))
 
 
-def send_slack_notice(ad, cpa, image_url, label):
+def send_slack_notice(ad, cpa, image_url, label, campaign_name=None, adset_name=None):
     if not ACCESS_TOKEN:
         print("[警告] ACCESS_TOKENが未設定のため、広告詳細を取得できず、Slack通知をスキップします")
         return
 
     ad_id = ad['id']
     ad_name = ad['name']
-    ad_details = fetch_ad_details(ad_id)
-    campaign_name = fetch_campaign_name(ad_details.get("campaign_id", ""))
-    adset_name = fetch_adset_name(ad_details.get("adset_id", ""))
+    # キャンペーン名・広告セット名が渡されていなければ取得
+    if campaign_name is None or adset_name is None:
+        ad_details = fetch_ad_details(ad_id)
+        campaign_name = fetch_campaign_name(ad_details.get("campaign_id", ""))
+        adset_name = fetch_adset_name(ad_details.get("adset_id", ""))
 
     # Slack Block Kitでリッチなメッセージを作成
     blocks = [
@@ -319,8 +307,9 @@ def send_slack_notice(ad, cpa, image_url, label):
         }
     ]
     
-    # 画像があれば追加
-    if image_url and image_url != "N/A":
+    # 画像があれば追加（THUMBNAIL_PUBLIC_URL設定時は期限切れにならないサムネイルのURL）
+    image_url = thumbnail_cache.slack_image_url(ad_id, image_url)
+    if image_url:
         blocks.append({
             "type": "image",
             "image_url": image_url,
@@ -350,14 +339,130 @@ def send_slack_notice(ad, cpa, image_url, label):
         post_slack_message(fallback_text)
 
 
+def build_notice_item(ad, cpa, image_url, campaign_name, adset_name):
+    """まとめ通知に載せる停止候補1件分のブロック"""
+    block = {
+        "type": "section",
+        "text": {
+            "type": "mrkdwn",
+            "text": (
+                f"*{ad['name']}*\n"
+                f"CPA: ¥{cpa if cpa is not None else 'N/A'}　広告ID: `{ad['id']}`\n"
+                f"{campaign_name} / {adset_name}"
+            )
+        }
+    }
+    image_url = thumbnail_cache.slack_image_url(ad["id"], image_url)
+    if image_url:
+        block["accessory"] = {
+            "type": "image",
+            "image_url": image_url,
+            "alt_text": f"広告画像: {ad['name']}"
+        }
+    return {"ad_id": ad["id"], "ad_name": ad["name"], "block": block}
+
+
+def send_slack_digest(account_id, candidates, label):
+    """停止候補をアカウント（またはキャンペーン）ごとに1通にまとめて通知
+
+    Args:
+        candidates: [(campaign_name, build_notice_itemの戻り値), ...]
+    """
+    groups = {}
+    for campaign_name, item in candidates:
+        key = campaign_name if SLACK_DIGEST_GROUP == "campaign" else account_id
+        groups.setdefault(key, []).append(item)
+
+    footer = (
+        "👍 このメッセージに絵文字でリアクション: ✅ = 全件の停止を承認 | ❌ = 全件を却下\n"
+        f"1件ずつ承認する場合は Web UI: {APPROVAL_WEB_URL}"
+    )
+    for name, items in groups.items():
+        title = f"📣 Meta広告通知 [{label}] {name}"
+        sent = send_slack_digest_with_blocks(title, items, title, footer)
+
+        unsent = [item for item in items if item["ad_id"] not in sent]
+        if unsent:
+            # Bot Tokenで送れなかった候補はWebhookでまとめて送信
+            print("⚠️  Bot Tokenで送信できなかった候補をWebhookで送信します")
+            lines = [f"*{title}*", ""]
+            lines.extend(f"• {item['block']['text']['text']}" for item in unsent)
+            post_slack_message("\n".join(lines))
+
+
 def notify_no_stop_candidates(account_id, reason=None):
     message = ["*📣 Meta広告通知 [停止対象なし]*", "", f"*アカウントID*: {account_id}", "指定された条件で停止対象の広告は見つかりませんでした。"]
     if reason:
         message.extend(["", f"補足: {reason}"])
     post_slack_message("\n".join(message))
 
+# --- 書き出し先（シンク） ---
+class ApprovalSink(BufferedSink):
+    """停止候補を承認待ちとして承認ストアに登録（アカウントごとに1回のトランザクション）"""
+
+    name = "承認ストア"
+
+    def write_all(self, events):
+        add_pending_approvals([event["approval"] for event in events])
+
+
+class SheetSink(BufferedSink):
+    """停止候補をGoogle Sheetsに追記（アカウントごとに1回の書き込み）"""
+
+    name = "Google Sheets"
+
+    def accepts(self, event):
+        return bool(SPREADSHEET_URL)
+
+    def write_all(self, events):
+        if not write_rows_to_sheet([event["row"] for event in events]):
+            raise RuntimeError("スプレッドシートに書き込めませんでした")
+
+
+class SlackSink(Sink):
+    """停止候補をSlackに通知（まとめ通知モードではアカウントの区切りでまとめて送信）"""
+
+    name = "Slack"
+    # 再送はslack_client側で行うので、ここで再試行すると二重投稿になる
+    max_retries = 0
+
+    def __init__(self):
+        self._digest = {}
+
+    def write(self, events):
+        for event in events:
+            if is_digest_enabled():
+                self._digest.setdefault(event["account_id"], []).append((event["campaign_name"], event["item"]))
+            else:
+                send_slack_notice(
+                    event["ad"], event["cpa"], event["image_url"], label="STOP候補",
+                    campaign_name=event["campaign_name"], adset_name=event["adset_name"]
+                )
+
+    def flush(self):
+        digest, self._digest = self._digest, {}
+        for account_id, candidates in digest.items():
+            send_slack_digest(account_id, candidates, label="STOP候補")
+
+
+def create_pipeline():
+    """停止候補の書き出しパイプライン（承認ストア・Slack・Google Sheets）"""
+    return SinkPipeline([ApprovalSink(), SlackSink(), SheetSink()])
+
+
 # --- 広告評価ロジック ---
-def evaluate_account(account_id):
+def evaluate_account(account_id, pipeline=None):
+    """アカウントの広告を評価し、停止候補をパイプラインに流す
+
+    pipelineを渡さない場合はこのアカウント用に作り、書き出しが終わるまで待つ
+    """
+    if pipeline is None:
+        pipeline = create_pipeline()
+        try:
+            return evaluate_account(account_id, pipeline)
+        finally:
+            pipeline.close()
+
     print(f"=== {account_id} の広告を評価中 ===")
     campaign_ids = get_campaign_ids()
     if not campaign_ids:
@@ -399,42 +504,47 @@ def evaluate_account(account_id):
         if ad not in winners:
             winners.append(ad)
 
-    rows_to_write = []
+    candidate_count = 0
     for ad, cpa, ctr in ads_with_metrics:
         if ad not in winners:
-            image_url = fetch_creative_image_url(ad["id"])
+            # 画像・名前は広告一覧の取得時にまとめて取得済み（候補ごとにMeta APIを呼ばない）
+            image_url = ad.get("creative", {}).get("thumbnail_url", "画像なし")
+            campaign_name = ad.get("campaign", {}).get("name", "不明なキャンペーン")
+            adset_name = ad.get("adset", {}).get("name", "不明な広告セット")
             print(f"[通知] {ad['name']} - CPA: {cpa} CTR: {ctr}")
-            
-            ad_details = fetch_ad_details(ad['id'])
-            campaign_name = fetch_campaign_name(ad_details.get("campaign_id", ""))
-            adset_name = fetch_adset_name(ad_details.get("adset_id", ""))
-            
-            # JSONに承認待ちとして追加
-            add_pending_approval(
-                ad_id=ad['id'],
-                ad_name=ad['name'],
-                campaign_name=campaign_name,
-                adset_name=adset_name,
-                cpa=cpa,
-                image_url=image_url
-            )
-            
-            # Slack通知
-            send_slack_notice(ad, cpa, image_url, label="STOP候補")
-
-            # Google Sheetsへの追加（互換性のため保持）
-            rows_to_write.append([
-                campaign_name,
-                adset_name,
-                ad['id'],
-                ad['name'],
-                cpa if cpa is not None else "N/A",
-                image_url
-            ])
-
-    if rows_to_write:
-        write_rows_to_sheet(rows_to_write)
-    else:
+
+            # 承認ストア・Slack・Google Sheets（互換性のため保持）への書き出しはパイプラインに任せて次の広告へ
+            pipeline.emit({
+                "account_id": account_id,
+                "ad": ad,
+                "cpa": cpa,
+                "image_url": image_url,
+                "campaign_name": campaign_name,
+                "adset_name": adset_name,
+                "approval": build_pending_approval(
+                    ad_id=ad['id'],
+                    ad_name=ad['name'],
+                    campaign_name=campaign_name,
+                    adset_name=adset_name,
+                    cpa=cpa,
+                    image_url=image_url
+                ),
+                "item": build_notice_item(ad, cpa, image_url, campaign_name, adset_name),
+                "row": [
+                    campaign_name,
+                    adset_name,
+                    ad['id'],
+                    ad['name'],
+                    cpa if cpa is not None else "N/A",
+                    image_url
+                ],
+            })
+            candidate_count += 1
+
+    # アカウントの区切り（まとめ通知はここで送信される）
+    pipeline.flush()
+
+    if not candidate_count:
         notify_no_stop_candidates(account_id)
 
 # --- Main Entry Point ---
@@ -443,8 +553,17 @@ def main():
         print("[警告] ACCESS_TOKENが未設定のため、評価処理を終了します")
         return
 
-    for aid in get_account_ids():
-        evaluate_account(aid)
+    pipeline = create_pipeline()
+    try:
+        for aid in get_account_ids():
+            evaluate_account(aid, pipeline)
+    finally:
+        # 残りの書き出しが終わるまで待つ
+        failed = pipeline.close()
+
+    for name, count in failed.items():
+        if count:
+            print(f"❌ {name}: {count}件の書き出しに失敗しました")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+承認データ・リアクション・コピー履歴のレコード型
+
+10万件規模の履歴を集計や突き合わせのために読み込むと、汎用のdictでは
+キー・キャンペーン名・広告セット名・画像URLなどの同じ文字列がレコードごとに重複して
+メモリとGCの負荷が大きくなる。ここでは__slots__のレコード型を使い、
+繰り返し現れる文字列はsys.internで1つにまとめる。
+
+レコードは record["ad_id"] / record.get("ad_id") でも読めるので、
+dictを受け取っていた集計処理はそのまま使える。
+定義されていないフィールドは extra に保持し、to_dict() でdictに戻せる（値がNoneのフィールドは省略）。
+"""
+
+import sys
+
+from local_state import read_json
+
+
+class SlottedRecord:
+    """__slots__で定義したフィールドを持つレコードの基底クラス"""
+
+    FIELDS = ()
+    # 値が繰り返し現れるためinternするフィールド
+    INTERNED = frozenset()
+    # ネストしたレコード型（フィールド名 → 型）。値はレコードのリストとして読み込む
+    NESTED = {}
+
+    __slots__ = ("extra",)
+
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            setattr(self, name, fields.pop(name, None))
+        self.extra = fields or None
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls.__new__(cls)
+        extra = None
+        for name, value in data.items():
+            if name in cls.NESTED and isinstance(value, list):
+                nested = cls.NESTED[name]
+                value = [nested.from_dict(item) if isinstance(item, dict) else item for item in value]
+            elif name in cls.INTERNED and isinstance(value, str):
+                value = sys.intern(value)
+            if name in cls._field_set:
+                setattr(record, name, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[sys.intern(name)] = value
+        for name in cls.FIELDS:
+            if name not in data:
+                setattr(record, name, None)
+        record.extra = extra
+        return record
+
+    def to_dict(self):
+        data = {}
+        for name in self.FIELDS:
+            value = getattr(self, name)
+            if value is None:
+                continue
+            if name in self.NESTED and isinstance(value, list):
+                value = [item.to_dict() if isinstance(item, SlottedRecord) else item for item in value]
+            data[name] = value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    # dictと同じ読み方ができるようにする
+    def get(self, name, default=None):
+        if name in self._field_set:
+            value = getattr(self, name)
+            return default if value is None else value
+        if self.extra:
+            return self.extra.get(name, default)
+        return default
+
+    def __getitem__(self, name):
+        value = self.get(name, _MISSING)
+        if value is _MISSING:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name):
+        return self.get(name, _MISSING) is not _MISSING
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_set = frozenset(cls.FIELDS)
+
+
+_MISSING = object()
+
+
+class ApprovalRecord(SlottedRecord):
+    """停止承認・広告コピー承認のレコード"""
+
+    FIELDS = (
+        "id", "ad_id", "ad_name", "campaign_id", "campaign_name", "adset_id", "adset_name",
+        "cpa", "image_url", "low_imp_count", "total_ads", "message_ts", "status",
+        "created_at", "approved_at", "approved_by", "stopped_at", "scan_snapshot",
+    )
+    INTERNED = frozenset({"campaign_id", "campaign_name", "adset_id", "adset_name", "image_url", "status", "approved_by"})
+    __slots__ = FIELDS
+
+
+class ReactionRecord(SlottedRecord):
+    """Slackリアクション管理のレコード"""
+
+    FIELDS = ("ad_id", "ad_name", "message_ts", "channel_id", "status", "created_at", "approved_at", "stopped_at")
+    INTERNED = frozenset({"channel_id", "status"})
+    __slots__ = FIELDS
+
+
+class CopiedAd(SlottedRecord):
+    """コピー履歴内の1広告"""
+
+    FIELDS = ("original_id", "new_id", "name", "impressions")
+    INTERNED = frozenset({"name"})
+    __slots__ = FIELDS
+
+
+class CopyHistoryRecord(SlottedRecord):
+    """広告コピー履歴のレコード"""
+
+    FIELDS = ("timestamp", "original_adset_id", "original_adset_name", "v2_adset_id", "v2_adset_name", "copied_ads")
+    INTERNED = frozenset({"original_adset_id", "original_adset_name", "v2_adset_name"})
+    NESTED = {"copied_ads": CopiedAd}
+    __slots__ = FIELDS
+
+
+# --- ローダー ---
+def load_approval_records(status=None, kind=None):
+    """承認ストアから承認データをApprovalRecordのリストとして読み込む"""
+    import approval_store
+
+    return [ApprovalRecord.from_dict(record) for record in approval_store.iter_approvals(status=status, kind=kind)]
+
+
+def load_reaction_records():
+    """リアクション管理レコードをReactionRecordのリストとして読み込む"""
+    from slack_reaction_helper import get_reaction_log
+
+    return [ReactionRecord.from_dict(record) for record in get_reaction_log().records().values()]
+
+
+def load_copy_history_records(path="ad_copy_history.json", include_archived=False):
+    """コピー履歴をCopyHistoryRecordのリストとして読み込む（古い順）"""
+    records = []
+    if include_archived:
+        from retention import iter_archive
+
+        records.extend(CopyHistoryRecord.from_dict(record) for record in iter_archive("copy_history"))
+    records.extend(CopyHistoryRecord.from_dict(record) for record in read_json(path, []))
+    return records
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+承認・リアクション・コピー履歴の保持期間管理とアーカイブ
+
+処理が終わったレコード（停止済み・却下・コピー実行済みなど）を保持期間の経過後に
+作業用ファイルから取り除き、月ごとのgzip圧縮アーカイブに移す。
+作業用ファイルを小さく保ち、各スクリプトやWeb UIの読み込みを軽くするため。
+
+アーカイブの構成:
+    archive/approvals/2025-01.jsonl.gz
+    archive/reactions/2025-01.jsonl.gz
+    archive/copy_history/2025-01.jsonl.gz
+    （月はレコードが終了状態になった日時。無い場合は作成日時）
+
+使い方:
+    python3 retention.py                  # 保持期間を過ぎたレコードをアーカイブ
+    python3 retention.py --dry-run        # 対象件数だけ表示
+    python3 retention.py query copy_history --since 2025-01-01 original_adset_id=123
+"""
+
+import os
+import sys
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import serialization
+from local_state import file_lock, read_json, update_json
+from state import COPY_HISTORY_FILE, load_approvals
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+
+# 保持期間（日）。終了状態になってからこの日数を過ぎたレコードをアーカイブする
+APPROVAL_RETENTION_DAYS = int(os.getenv("APPROVAL_RETENTION_DAYS", "30"))
+REACTION_RETENTION_DAYS = int(os.getenv("REACTION_RETENTION_DAYS", "30"))
+COPY_HISTORY_RETENTION_DAYS = int(os.getenv("COPY_HISTORY_RETENTION_DAYS", "90"))
+
+# 終了状態（これ以上ステータスが変わらない）
+APPROVAL_TERMINAL_STATUSES = ("stopped", "rejected", "approved_executed")
+REACTION_TERMINAL_STATUSES = ("stopped", "rejected")
+
+DATASETS = ("approvals", "reactions", "copy_history")
+
+# 終了日時として使うフィールド（先にあるものを優先）
+TIMESTAMP_FIELDS = ("stopped_at", "executed_at", "approved_at", "created_at", "timestamp")
+
+
+def record_timestamp(record):
+    """レコードが終了状態になった日時（ISO形式の文字列）"""
+    for field in TIMESTAMP_FIELDS:
+        if record.get(field):
+            return str(record[field])
+    return None
+
+
+def is_expired(record, cutoff):
+    """保持期間を過ぎているか（日時が無いレコードは残す）"""
+    timestamp = record_timestamp(record)
+    return timestamp is not None and timestamp < cutoff
+
+
+def _cutoff(days):
+    return (datetime.now() - timedelta(days=days)).isoformat()
+
+
+# --- アーカイブの書き込み ---
+def shard_path(dataset, month):
+    return os.path.join(ARCHIVE_DIR, dataset, f"{month}.jsonl.gz")
+
+
+def write_archive(dataset, records):
+    """レコードを月ごとのアーカイブに追記
+
+    gzipは追記するとメンバーが連結されるが、読み込み時はまとめて1つのストリームとして読める
+    """
+    archived_at = datetime.now().isoformat()
+    by_month = {}
+    for record in records:
+        month = record_timestamp(record)[:7]
+        by_month.setdefault(month, []).append(dict(record, archived_at=archived_at))
+
+    for month, items in sorted(by_month.items()):
+        path = shard_path(dataset, month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = b"".join(serialization.dumps_line(item) for item in items)
+        with file_lock(path):
+            with gzip.open(path, "ab") as f:
+                f.write(payload)
+    return len(records)
+
+
+# --- アーカイブの読み込み ---
+def list_shards(dataset, since=None, until=None):
+    """期間に重なる月のアーカイブファイルを古い順に返す（since/untilは YYYY-MM-DD）"""
+    directory = os.path.join(ARCHIVE_DIR, dataset)
+    if not os.path.isdir(directory):
+        return []
+
+    shards = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".jsonl.gz"):
+            continue
+        month = name[:-len(".jsonl.gz")]
+        if since and month < since[:7]:
+            continue
+        if until and month > until[:7]:
+            continue
+        shards.append(os.path.join(directory, name))
+    return shards
+
+
+def iter_archive(dataset, since=None, until=None):
+    """アーカイブ済みレコードを古い順に返す"""
+    for path in list_shards(dataset, since, until):
+        with gzip.open(path, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = serialization.loads_json(line)
+                timestamp = record_timestamp(record) or ""
+                if since and timestamp < since:
+                    continue
+                if until and timestamp[:len(until)] > until:
+                    continue
+                yield record
+
+
+def query_archive(dataset, since=None, until=None, **filters):
+    """アーカイブ済みレコードを検索（filtersはフィールドの完全一致、値は文字列で比較）"""
+    return [
+        record for record in iter_archive(dataset, since, until)
+        if all(str(record.get(field)) == str(value) for field, value in filters.items())
+    ]
+
+
+# --- 保持期間の適用 ---
+def archive_approvals(dry_run=False):
+    """終了状態の承認データを承認ストアからアーカイブへ移す"""
+    import approval_store
+
+    cutoff = _cutoff(APPROVAL_RETENTION_DAYS)
+    if dry_run:
+        return sum(
+            1 for status in APPROVAL_TERMINAL_STATUSES
+            for record in load_approvals(status=status)
+            if is_expired(record, cutoff)
+        )
+    return approval_store.archive_approvals(
+        APPROVAL_TERMINAL_STATUSES,
+        lambda record: is_expired(record, cutoff),
+        lambda records: write_archive("approvals", records),
+    )
+
+
+def archive_reactions(dry_run=False):
+    """停止済みのリアクション管理レコードをイベントログからアーカイブへ移す"""
+    from slack_reaction_helper import get_reaction_index
+
+    cutoff = _cutoff(REACTION_RETENTION_DAYS)
+    index = get_reaction_index()
+    if dry_run:
+        return sum(
+            1 for status in REACTION_TERMINAL_STATUSES
+            for record in index.find_by_status(status)
+            if is_expired(record, cutoff)
+        )
+    return index.archive_records(
+        REACTION_TERMINAL_STATUSES,
+        lambda record: is_expired(record, cutoff),
+        lambda records: write_archive("reactions", records),
+    )
+
+
+def archive_copy_history(dry_run=False):
+    """保持期間を過ぎたコピー履歴をアーカイブへ移す"""
+    cutoff = _cutoff(COPY_HISTORY_RETENTION_DAYS)
+    if not os.path.exists(COPY_HISTORY_FILE):
+        return 0
+
+    archived = []
+
+    def move_expired(history):
+        expired = [record for record in history if is_expired(record, cutoff)]
+        if dry_run or not expired:
+            archived.extend(expired)
+            return None
+        # アーカイブへの書き込みが成功してから作業用ファイルから取り除く
+        write_archive("copy_history", expired)
+        archived.extend(expired)
+        return [record for record in history if not is_expired(record, cutoff)]
+
+    if dry_run:
+        move_expired(read_json(COPY_HISTORY_FILE, []))
+    else:
+        update_json(COPY_HISTORY_FILE, [], move_expired)
+    return len(archived)
+
+
+def apply_retention(dry_run=False):
+    """全データに保持期間を適用し、データごとのアーカイブ件数を返す"""
+    results = {}
+    for dataset, archive in (
+        ("approvals", archive_approvals),
+        ("reactions", archive_reactions),
+        ("copy_history", archive_copy_history),
+    ):
+        try:
+            results[dataset] = archive(dry_run=dry_run)
+        except Exception as e:
+            print(f"❌ {dataset} のアーカイブ中にエラー: {e}")
+            results[dataset] = None
+    return results
+
+
+def main():
+    args = sys.argv[1:]
+
+    if args and args[0] == "query":
+        if len(args) < 2 or args[1] not in DATASETS:
+            print(f"データ名を指定してください: {', '.join(DATASETS)}")
+            return
+        dataset, since, until, filters = args[1], None, None, {}
+        rest = iter(args[2:])
+        for arg in rest:
+            if arg == "--since":
+                since = next(rest, None)
+            elif arg == "--until":
+                until = next(rest, None)
+            elif "=" in arg:
+                field, value = arg.split("=", 1)
+                filters[field] = value
+        for record in query_archive(dataset, since, until, **filters):
+            print(json.dumps(record, ensure_ascii=False))
+        return
+
+    dry_run = "--dry-run" in args
+    print("=" * 60)
+    print("保持期間の適用" + ("（ドライラン）" if dry_run else ""))
+    print("=" * 60)
+    print(f"承認データ: {APPROVAL_RETENTION_DAYS}日 / リアクション: {REACTION_RETENTION_DAYS}日 / コピー履歴: {COPY_HISTORY_RETENTION_DAYS}日")
+
+    for dataset, count in apply_retention(dry_run=dry_run).items():
+        if count is None:
+            continue
+        label = "対象" if dry_run else "アーカイブ"
+        print(f"  - {dataset}: {count}件を{label}")
+
+
+if __name__ == "__main__":
+    main()
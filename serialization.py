@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+ローカル状態ファイルのシリアライズ
+
+JSONはorjsonがあればorjsonで、無ければ標準のjsonで読み書きする。
+STATE_FORMAT=msgpack の場合はmsgpack（バイナリ）で書き込む（ファイル名はそのまま）。
+読み込み時は先頭バイトで形式を判定するので、形式を切り替えても既存ファイルはそのまま読める。
+
+    STATE_FORMAT=json     （デフォルト）インデント付きJSON。gitの差分が読める
+    STATE_FORMAT=msgpack  msgpack。読み書きが最も速くファイルも小さい（要 pip install msgpack）
+"""
+
+import os
+import json
+
+try:
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
+
+try:
+    import msgpack
+except ModuleNotFoundError:
+    msgpack = None
+
+STATE_FORMAT = os.getenv("STATE_FORMAT", "json")
+
+# JSONの先頭に来うるバイト（これ以外で始まる場合はmsgpackとみなす）
+_JSON_START = frozenset(b' \t\r\n[{"-0123456789tfn')
+
+if orjson is not None:
+    # dictのキーが文字列以外（数値のIDなど）でも標準のjsonと同じく文字列にして書き込む
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def state_format():
+    """書き込みに使う形式（msgpackが未インストールの場合はjson）"""
+    if STATE_FORMAT == "msgpack" and msgpack is None:
+        print("[警告] msgpackが未インストールのため、JSONで保存します")
+        return "json"
+    return STATE_FORMAT
+
+
+def dumps_json(data, indent=None):
+    """JSONをUTF-8のバイト列にする（indentを指定すると2スペースでインデント）"""
+    if orjson is not None:
+        options = _ORJSON_OPTIONS | (orjson.OPT_INDENT_2 if indent else 0)
+        try:
+            return orjson.dumps(data, option=options)
+        except TypeError:
+            # orjsonで扱えない値（64bitを超える整数など）は標準のjsonに任せる
+            pass
+    separators = None if indent else (",", ":")
+    return json.dumps(data, ensure_ascii=False, indent=indent, separators=separators).encode("utf-8")
+
+
+def dumps_line(data):
+    """JSON Lines用に1行（改行付き）のバイト列にする"""
+    return dumps_json(data) + b"\n"
+
+
+def loads_json(data):
+    """JSON（バイト列または文字列）を読み込む"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def detect_format(data):
+    """バイト列の形式を判定（"json" / "msgpack"）"""
+    for byte in data[:1]:
+        if byte not in _JSON_START:
+            return "msgpack"
+    return "json"
+
+
+def dumps(data, indent=2):
+    """設定された形式でバイト列にする"""
+    if state_format() == "msgpack":
+        return msgpack.packb(data, use_bin_type=True)
+    return dumps_json(data, indent=indent)
+
+
+def loads(data):
+    """形式を判定して読み込む"""
+    if detect_format(data) == "msgpack":
+        if msgpack is None:
+            raise ValueError("msgpack形式のファイルを読むには pip install msgpack が必要です")
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    return loads_json(data)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+通知・書き出し先（シンク）のバックグラウンドパイプライン
+
+評価処理は停止候補などのイベントを emit() でキューに入れるだけで次の広告に進み、
+Slack通知・承認ストアへの登録・Google Sheetsへの書き込みは
+シンクごとのワーカースレッドが非同期にまとめて処理する。
+
+- キューはシンクごとに上限付き（SINK_QUEUE_SIZE）。書き出しが追いつかない場合は
+  emit() が空きを待つので、メモリを使い切らずに評価側の速度が抑えられる（バックプレッシャー）
+- 書き込みが例外で失敗した場合はシンクごとの回数まで間隔を空けて再試行する
+- flush() でそれまでのイベントの書き出しを区切り（まとめ通知の送信など）、
+  close() で残りをすべて書き出してからワーカーを終了する。close() は終了時にも自動で呼ばれる
+
+シンクは Sink を継承し、write(events) と必要に応じて flush() を実装する。
+区切りごとに1回でまとめて書き込みたいシンク（トランザクションや外部APIの呼び出しが重いもの）は
+BufferedSink を継承し、write_all(events) を実装する。
+"""
+
+import os
+import time
+import queue
+import atexit
+import threading
+import traceback
+
+# シンクごとのキューの上限（これを超えるとemit()が空きを待つ）
+SINK_QUEUE_SIZE = int(os.getenv("SINK_QUEUE_SIZE", "100"))
+# 1回の書き込みでまとめて渡すイベント数
+SINK_BATCH_SIZE = int(os.getenv("SINK_BATCH_SIZE", "50"))
+# 失敗時の再試行回数と待ち時間（秒、試行回数に比例）
+SINK_MAX_RETRIES = int(os.getenv("SINK_MAX_RETRIES", "3"))
+SINK_RETRY_DELAY = float(os.getenv("SINK_RETRY_DELAY", "2"))
+
+_FLUSH = object()
+_STOP = object()
+
+
+class Sink:
+    """書き出し先の基底クラス"""
+
+    name = "sink"
+    # 書き込み失敗時の再試行回数（書き込み先のクライアント側で再送する場合は0にする）
+    max_retries = SINK_MAX_RETRIES
+
+    def accepts(self, event):
+        """このシンクで処理するイベントか"""
+        return True
+
+    def write(self, events):
+        """イベントをまとめて書き込む（失敗時は例外を送出すると再試行される）"""
+        raise NotImplementedError
+
+    def flush(self):
+        """区切りごとの処理（溜めたイベントのまとめ送信など）"""
+
+    def discard(self):
+        """区切りの処理に失敗したときに、溜めていたイベントを捨てる
+
+        Returns:
+            捨てたイベント数
+        """
+        return 0
+
+
+class BufferedSink(Sink):
+    """write()で受け取ったイベントを溜めておき、flush()で1回にまとめて書き込むシンク
+
+    キューが空になるたびに書き込むと評価側の速度次第で1件ずつの書き込みになるため、
+    区切り（アカウントごと）まで溜めてから書き込む。失敗した場合は溜めたイベントを残すので、
+    再試行では同じイベントをまとめて書き込み直す。
+    """
+
+    def __init__(self):
+        self._buffer = []
+
+    def write(self, events):
+        self._buffer.extend(events)
+
+    def write_all(self, events):
+        """溜めたイベントをまとめて書き込む（失敗時は例外を送出すると再試行される）"""
+        raise NotImplementedError
+
+    def flush(self):
+        if self._buffer:
+            self.write_all(self._buffer)
+            self._buffer = []
+
+    def discard(self):
+        count = len(self._buffer)
+        self._buffer = []
+        return count
+
+
+class _SinkWorker:
+    """1シンク分の上限付きキューとワーカースレッド"""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.queue = queue.Queue(maxsize=SINK_QUEUE_SIZE)
+        self.failed = 0
+        self.thread = threading.Thread(target=self._run, name=f"sink:{sink.name}", daemon=True)
+        self.thread.start()
+
+    def _call(self, action, description):
+        for attempt in range(self.sink.max_retries + 1):
+            try:
+                action()
+                return True
+            except Exception as e:
+                if attempt < self.sink.max_retries:
+                    print(f"⚠️  {self.sink.name}: {description}に失敗、再試行します（{e}）")
+                    time.sleep(SINK_RETRY_DELAY * (attempt + 1))
+                else:
+                    traceback.print_exc()
+                    print(f"❌ {self.sink.name}: {description}に失敗しました（{e}）")
+        return False
+
+    def _write(self, events):
+        if events and not self._call(lambda: self.sink.write(events), f"{len(events)}件の書き込み"):
+            self.failed += len(events)
+
+    def _run(self):
+        batch = []
+        while True:
+            item = self.queue.get()
+            # 溜まっているイベントはまとめて取り出す
+            while item is not _FLUSH and item is not _STOP:
+                batch.append(item)
+                if len(batch) >= SINK_BATCH_SIZE:
+                    self._write(batch)
+                    batch = []
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    item = None
+                    break
+
+            if item is None:
+                self._write(batch)
+                batch = []
+                continue
+
+            self._write(batch)
+            batch = []
+            if not self._call(self.sink.flush, "区切りの処理"):
+                self.failed += self.sink.discard()
+            if item is _STOP:
+                return
+
+
+class SinkPipeline:
+    """イベントを複数のシンクに配るパイプライン"""
+
+    def __init__(self, sinks):
+        self._workers = [_SinkWorker(sink) for sink in sinks]
+        self._closed = False
+        atexit.register(self.close)
+
+    def emit(self, event):
+        """イベントを各シンクのキューに入れる（キューが一杯なら空くまで待つ）"""
+        for worker in self._workers:
+            if worker.sink.accepts(event):
+                worker.queue.put(event)
+
+    def flush(self):
+        """それまでのイベントを書き出したあと、各シンクの区切り処理を行う（完了は待たない）"""
+        for worker in self._workers:
+            worker.queue.put(_FLUSH)
+
+    def close(self):
+        """残りのイベントをすべて書き出してワーカーを終了
+
+        Returns:
+            {シンク名: 書き込みに失敗したイベント数}
+        """
+        if not self._closed:
+            self._closed = True
+            for worker in self._workers:
+                worker.queue.put(_STOP)
+        for worker in self._workers:
+            worker.thread.join()
+        return {worker.sink.name: worker.failed for worker in self._workers}
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Slack Web APIの共有クライアント
+
+全スクリプトのSlack API呼び出し（メッセージ送信・リアクション取得・Webhook通知）をここに集約する。
+
+- HTTP接続はセッションで使い回す（コネクションプール）
+- メソッドごとにSlackのレート制限（Tier）に合わせた間隔で送信する
+- 429（Too Many Requests）や ratelimited エラーは Retry-After 秒待ってから再送する
+- メソッドごとに別々のキューとワーカーで送信するので、1つのメソッドが待たされても
+  他のメソッドの呼び出しは止まらない
+- chat.postMessage は ok と ts が返るまで確認し、失敗した場合は結果として返す（黙って捨てない）
+"""
+
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from dotenv import load_dotenv
+except ModuleNotFoundError:
+    def load_dotenv(*args, **kwargs):
+        return False
+
+load_dotenv()
+
+SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
+SLACK_CHANNEL_ID = os.getenv("SLACK_CHANNEL_ID")
+
+SLACK_API_URL = "https://slack.com/api/"
+# 429・ネットワークエラー時の最大再送回数
+SLACK_MAX_RETRIES = int(os.getenv("SLACK_MAX_RETRIES", "5"))
+SLACK_TIMEOUT = 30
+
+# メソッドごとの最小送信間隔（秒）。Slackのレート制限の目安:
+#   chat.postMessage   チャンネルごとに1秒1件（special）
+#   Tier 2             20回/分
+#   Tier 3             50回/分
+#   Tier 4             100回/分
+#   Incoming Webhook   1秒1件
+METHOD_INTERVALS = {
+    "chat.postMessage": 1.0,
+    "reactions.get": 60 / 50,
+    "conversations.history": 60 / 50,
+    "auth.test": 60 / 100,
+    "webhook": 1.0,
+}
+DEFAULT_INTERVAL = 60 / 50
+
+# 参照系のメソッドはGET、それ以外はJSONのPOSTで呼ぶ
+GET_METHODS = {"reactions.get", "conversations.history", "auth.test"}
+
+
+class _MethodLane:
+    """1メソッド分の送信キューとワーカー（送信間隔とRetry-Afterをこのメソッドだけに適用）"""
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.interval = METHOD_INTERVALS.get(name, DEFAULT_INTERVAL)
+        self.next_at = 0.0
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=f"slack:{name}", daemon=True)
+        self.thread.start()
+
+    def _wait_turn(self):
+        delay = self.next_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_at = time.monotonic() + self.interval
+
+    def _run(self):
+        while True:
+            send, future = self.queue.get()
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(self._send_with_retry(send))
+                except Exception as e:
+                    future.set_exception(e)
+            self.queue.task_done()
+
+    def _send_with_retry(self, send):
+        error = None
+        for attempt in range(SLACK_MAX_RETRIES + 1):
+            self._wait_turn()
+            try:
+                res = send()
+            except requests.RequestException as e:
+                error = str(e)
+                # ネットワークエラーは指数バックオフで再送
+                self.next_at = time.monotonic() + min(2 ** attempt, 30)
+                continue
+
+            if res.status_code == 429:
+                retry_after = float(res.headers.get("Retry-After", "1"))
+                print(f"⏳ Slackのレート制限（{self.name}）: {retry_after:.0f}秒待って再送します")
+                self.next_at = time.monotonic() + retry_after
+                error = "ratelimited"
+                continue
+
+            result = self.client._parse(res)
+            if result.get("error") == "ratelimited":
+                self.next_at = time.monotonic() + float(res.headers.get("Retry-After", "1"))
+                error = "ratelimited"
+                continue
+            return result
+
+        return {"ok": False, "error": error or "unknown_error"}
+
+
+class SlackClient:
+    """レート制限を守ってSlack APIを呼ぶクライアント"""
+
+    def __init__(self, token=None):
+        self.token = token
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+        self._lanes = {}
+        self._lanes_lock = threading.Lock()
+
+    def _lane(self, name):
+        with self._lanes_lock:
+            lane = self._lanes.get(name)
+            if lane is None:
+                lane = self._lanes[name] = _MethodLane(self, name)
+            return lane
+
+    @staticmethod
+    def _parse(res):
+        try:
+            return res.json()
+        except ValueError:
+            # Incoming Webhookは成功時に "ok" というテキストを返す
+            if res.status_code == 200:
+                return {"ok": True}
+            return {"ok": False, "error": f"http_{res.status_code}", "body": res.text}
+
+    def submit(self, method, **params):
+        """API呼び出しをメソッドのキューに入れ、結果（レスポンスのdict）のFutureを返す"""
+        url = SLACK_API_URL + method
+        headers = {"Authorization": f"Bearer {self.token}"}
+
+        if method in GET_METHODS:
+            send = lambda: self.session.get(url, headers=headers, params=params, timeout=SLACK_TIMEOUT)
+        else:
+            send = lambda: self.session.post(url, headers=headers, json=params, timeout=SLACK_TIMEOUT)
+        return self._enqueue(method, send)
+
+    def submit_webhook(self, webhook_url, payload):
+        """Incoming Webhookへの送信をキューに入れる"""
+        send = lambda: self.session.post(webhook_url, json=payload, timeout=SLACK_TIMEOUT)
+        return self._enqueue("webhook", send)
+
+    def _enqueue(self, lane_name, send):
+        future = Future()
+        self._lane(lane_name).queue.put((send, future))
+        return future
+
+    def call(self, method, **params):
+        """API呼び出し（レート制限待ち・再送を含めて結果が返るまで待つ）"""
+        return self.submit(method, **params).result()
+
+    def post_message(self, channel, text, blocks=None):
+        """メッセージを送信し、Slackが受け付けた場合はts付きの結果を返す"""
+        return self.submit_message(channel, text, blocks).result()
+
+    def submit_message(self, channel, text, blocks=None):
+        """メッセージ送信をキューに入れる（まとめて送る場合はFutureの結果で送信確認する）"""
+        params = {"channel": channel, "text": text}
+        if blocks:
+            params["blocks"] = blocks
+        return self.submit("chat.postMessage", **params)
+
+    def post_webhook(self, webhook_url, payload):
+        return self.submit_webhook(webhook_url, payload).result()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """SLACK_BOT_TOKENの共有クライアントを取得"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = SlackClient(SLACK_BOT_TOKEN)
+        return _client
+
+
+def post_message(text, blocks=None, channel=None):
+    """SLACK_CHANNEL_IDにメッセージを送信
+
+    Returns:
+        Slackのレスポンス（送信できた場合は ok=True と ts を含む）/ 設定不足の場合はNone
+    """
+    channel = channel or SLACK_CHANNEL_ID
+    if not SLACK_BOT_TOKEN or not channel:
+        print("[警告] Slack設定が未設定のため、通知をスキップします")
+        return None
+
+    result = get_client().post_message(channel, text, blocks)
+    if result.get("ok") and result.get("ts"):
+        print(f"✅ Slack通知送信成功: {result['ts']}")
+    else:
+        print(f"❌ Slack通知送信失敗: {result.get('error')}")
+        if result.get("response_metadata"):
+            print(f"   詳細: {result['response_metadata']}")
+    return result
+
+
+def post_webhook(webhook_url, payload):
+    """Incoming Webhookに送信（レート制限と再送はBot APIと同じ扱い）"""
+    result = get_client().post_webhook(webhook_url, payload)
+    if not result.get("ok"):
+        print(f"❌ Slack Webhook送信失敗: {result.get('error')}")
+    return result
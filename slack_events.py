@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Slack Events API の受信エンドポイント
+
+承認メッセージへのリアクション（reaction_added / reaction_removed）をSlackからプッシュで受け取り、
+message_tsから承認データを引いて、広告停止・広告コピーをすぐにジョブキューへ登録する。
+定期実行でリアクションを確認するのを待たずに、承認から数秒で処理が始まる。
+
+approval_web.py にBlueprintとして組み込まれ、/slack/events で受信する。
+Slack Appの「Event Subscriptions」でRequest URLに https://<ホスト>/slack/events を設定し、
+Bot Eventsに reaction_added / reaction_removed を追加する。
+
+環境変数:
+    SLACK_SIGNING_SECRET  リクエスト署名の検証に使うSigning Secret（必須）
+    SLACK_CHANNEL_ID      このチャンネルのリアクションだけを処理する
+"""
+
+import os
+import json
+import hmac
+import time
+import hashlib
+from datetime import datetime
+
+from flask import Blueprint, request, jsonify
+
+import approval_store
+import job_queue
+from slack_reaction_helper import (
+    APPROVE_EMOJI,
+    REJECT_EMOJI,
+    entry_key,
+    get_reaction_index,
+    update_reaction_entries,
+    sync_approval_store,
+)
+
+SLACK_SIGNING_SECRET = os.getenv("SLACK_SIGNING_SECRET")
+SLACK_CHANNEL_ID = os.getenv("SLACK_CHANNEL_ID")
+
+# 署名のタイムスタンプがこれより古いリクエストは再送攻撃とみなして拒否する（秒）
+SIGNATURE_MAX_AGE = 60 * 5
+
+# Web UIで承認された広告の停止ジョブを、まとめて実行するまでに待つ時間（秒）
+# この間に続けて承認された広告は1回のGraph APIバッチリクエストで停止する
+STOP_BATCH_WINDOW = float(os.getenv("STOP_BATCH_WINDOW", "3"))
+
+# 処理済み（これ以上リアクションで状態を変えない）広告コピー承認のステータス
+COPY_DONE_STATUSES = ("approved_executed", "rejected")
+# コピー実行中の広告コピー承認のステータス（execute_approved_copies.RUNNING_STATUS）
+COPY_RUNNING_STATUS = "approved_running"
+
+blueprint = Blueprint("slack_events", __name__)
+
+
+def verify_signature(body, timestamp, signature):
+    """Slackのリクエスト署名（v0=HMAC-SHA256）を検証"""
+    if not SLACK_SIGNING_SECRET or not timestamp or not signature:
+        return False
+    try:
+        if abs(time.time() - int(timestamp)) > SIGNATURE_MAX_AGE:
+            return False
+    except ValueError:
+        return False
+
+    base = b"v0:" + timestamp.encode("utf-8") + b":" + body
+    expected = "v0=" + hmac.new(SLACK_SIGNING_SECRET.encode("utf-8"), base, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+@blueprint.before_app_request
+def _start_job_worker():
+    # 再起動前に登録されたジョブも拾えるよう、最初のリクエストでワーカーを起動
+    job_queue.start_worker()
+
+
+@blueprint.route("/slack/events", methods=["POST"])
+def slack_events():
+    """Slack Events APIのリクエストを受信"""
+    if not SLACK_SIGNING_SECRET:
+        print("[警告] SLACK_SIGNING_SECRETが未設定のため、Slackイベントを受け付けません")
+        return "", 503
+
+    body = request.get_data()
+    if not verify_signature(
+        body,
+        request.headers.get("X-Slack-Request-Timestamp"),
+        request.headers.get("X-Slack-Signature"),
+    ):
+        return "", 401
+
+    payload = json.loads(body)
+
+    # Request URL登録時の確認
+    if payload.get("type") == "url_verification":
+        return jsonify({"challenge": payload.get("challenge")})
+
+    if payload.get("type") == "event_callback":
+        try:
+            handle_event(payload.get("event", {}))
+        except Exception as e:
+            # Slackは3秒以内に200を返さないと再送するので、処理の失敗はログに残して200を返す
+            print(f"❌ Slackイベント処理エラー: {e}")
+
+    return "", 200
+
+
+def handle_event(event):
+    """reaction_added / reaction_removed を承認データに反映"""
+    event_type = event.get("type")
+    if event_type not in ("reaction_added", "reaction_removed"):
+        return
+
+    item = event.get("item", {})
+    if item.get("type") != "message":
+        return
+    if SLACK_CHANNEL_ID and item.get("channel") != SLACK_CHANNEL_ID:
+        return
+
+    # スキントーン付きの絵文字（xxx::skin-tone-2）も同じ絵文字として扱う
+    reaction = (event.get("reaction") or "").split("::")[0]
+    if reaction not in (APPROVE_EMOJI, REJECT_EMOJI):
+        return
+
+    message_ts = item.get("ts")
+    user = event.get("user")
+
+    # 停止承認（slack_reactions.jsonl）→ 広告コピー承認（承認ストア）の順にmessage_tsで逆引き
+    # まとめ通知の場合はメッセージに載っている全件にリアクションを適用する
+    entries = get_reaction_index().find_by_message(message_ts)
+    if entries:
+        handle_stop_reaction(event_type, reaction, entries, user)
+        return
+
+    approvals = [
+        approval for approval in approval_store.find_all_by_message_ts(message_ts)
+        if approval.get("ad_id") is None
+    ]
+    if approvals:
+        handle_copy_reaction(event_type, reaction, approvals, user)
+
+
+def handle_stop_reaction(event_type, reaction, entries, user):
+    now = datetime.now().isoformat()
+    updates = []
+    jobs = []
+    # Web UIに反映する広告（ステータスの変更ごと）
+    approved, rejected, reverted = [], [], []
+
+    for entry in entries:
+        key = entry_key(entry)
+        dedupe_key = f"stop:{key}"
+        status = entry.get("status")
+
+        if event_type == "reaction_added":
+            if status != "pending":
+                continue
+            if reaction == APPROVE_EMOJI:
+                updates.append((key, {"status": "approved", "approved_at": now, "approved_by": user}))
+                approved.append(entry.get("ad_id"))
+                jobs.append(({
+                    "ad_id": entry.get("ad_id"),
+                    "ad_name": entry.get("ad_name", ""),
+                    "message_ts": entry["message_ts"],
+                    "key": key,
+                }, dedupe_key))
+            else:
+                updates.append((key, {"status": "rejected", "rejected_at": now, "rejected_by": user}))
+                rejected.append(entry.get("ad_id"))
+
+        # ✅が外された場合、まだ実行されていなければ取り消して承認待ちに戻す
+        elif reaction == APPROVE_EMOJI and status == "approved" and job_queue.cancel(dedupe_key):
+            updates.append((key, {"status": "pending", "approved_at": None, "approved_by": None}))
+            reverted.append(entry.get("ad_id"))
+            print(f"↩️  広告 {entry.get('ad_id')} の停止を取り消しました")
+
+    # ステータス変更はまとめて1回で追記し、Web UIにも反映してからジョブを登録
+    if update_reaction_entries(updates):
+        sync_approval_store(approved, "pending", "approved", approved_at=now, approved_by=user)
+        sync_approval_store(rejected, "pending", "rejected", approved_at=now, rejected_by=user)
+        sync_approval_store(reverted, "approved", "pending", approved_at=None, approved_by=None)
+    for payload, dedupe_key in jobs:
+        job_queue.enqueue("stop", payload, dedupe_key)
+
+
+def copy_dedupe_key(approval):
+    if approval.get("digest"):
+        return f"copy:{approval['message_ts']}:{approval['adset_id']}"
+    return f"copy:{approval['message_ts']}"
+
+
+def handle_copy_reaction(event_type, reaction, approvals, user):
+    for approval in approvals:
+        if approval.get("status") in COPY_DONE_STATUSES or approval.get("status") == COPY_RUNNING_STATUS:
+            continue
+        dedupe_key = copy_dedupe_key(approval)
+
+        if event_type == "reaction_added":
+            if reaction == APPROVE_EMOJI:
+                job_queue.enqueue("copy", {
+                    "message_ts": approval["message_ts"],
+                    "adset_id": approval.get("adset_id"),
+                    "approved_by": user,
+                }, dedupe_key)
+            else:
+                # 読み込んだ後にコピーが引き受けられていた場合は却下しない
+                approval_store.update_approval_if(
+                    approval["id"], {"status": approval.get("status")},
+                    status="rejected", rejected_at=datetime.now().isoformat(),
+                )
+            continue
+
+        if reaction == APPROVE_EMOJI and job_queue.cancel(dedupe_key):
+            print(f"↩️  広告セット {approval.get('adset_name')} のコピーを取り消しました")
+
+
+# --- ジョブの処理 ---
+def run_stop_job(payload):
+    """承認された広告を停止（停止済みだった広告も停止済みにし、失敗した場合は例外で再試行する）"""
+    from approved_stopper import stop_approved_ads
+
+    ad_id = str(payload["ad_id"])
+    key = payload.get("key", payload["message_ts"])
+    entry = get_reaction_index().get(key)
+    if entry is None or entry.get("status") != "approved":
+        print(f"スキップ: 広告 {ad_id} は承認済みではありません")
+        return
+
+    error = stop_approved_ads([ad_id], ad_names={ad_id: payload.get("ad_name", "")}).get(ad_id)
+    if error:
+        update_reaction_entries([(key, {"stop_error": error, "stop_attempted_at": datetime.now().isoformat()})])
+        raise RuntimeError(f"広告 {ad_id} を停止できませんでした: {error}")
+
+
+def enqueue_web_stops(ad_ids):
+    """Web UIで承認された広告の停止ジョブを登録（STOP_BATCH_WINDOW秒分をまとめて停止する）"""
+    return job_queue.enqueue_many("web_stop", [({"ad_id": ad_id}, f"web_stop:{ad_id}") for ad_id in ad_ids])
+
+
+def run_web_stop_batch(payloads):
+    """Web UIで承認された広告をまとめて停止し、結果を承認ストアに記録"""
+    from approved_stopper import stop_approved_ads
+
+    errors = stop_approved_ads([payload["ad_id"] for payload in payloads])
+    return [errors.get(str(payload["ad_id"])) for payload in payloads]
+
+
+def run_copy_job(payload):
+    """承認された広告セットのコピーを実行"""
+    from execute_approved_copies import execute_copy, claim_copy, finish_copy
+
+    if payload.get("adset_id"):
+        approval = approval_store.find_by_message(payload["adset_id"], payload["message_ts"])
+    else:
+        approval = approval_store.find_by_message_ts(payload["message_ts"])
+    if approval is None:
+        return
+
+    # 定期実行（execute_approved_copies.py）が先に引き受けた場合は実行しない
+    if not claim_copy(approval, approved_by=payload.get("approved_by")):
+        print(f"スキップ: 広告セット {approval.get('adset_name')} は処理済みか実行中です")
+        return
+
+    print(f"🎯 広告セット: {approval.get('adset_name')} のコピーを実行します")
+    finish_copy(approval, execute_copy(approval))
+
+
+def register_handlers():
+    """このモジュールのジョブの処理をjob_queueに登録（何度呼んでもよい）"""
+    job_queue.register_handler("stop", run_stop_job)
+    job_queue.register_handler("copy", run_copy_job)
+    job_queue.register_handler("web_stop", run_web_stop_batch, batch_window=STOP_BATCH_WINDOW)
+
+
+register_handlers()
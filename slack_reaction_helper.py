@@ -1,8 +1,12 @@
 import os
 import json
-import requests
+import time
 from datetime import datetime
 
+import approval_store
+from event_log import EventLog
+from slack_client import get_client
+
 try:
     from dotenv import load_dotenv
 except ModuleNotFoundError:
@@ -14,37 +18,202 @@ load_dotenv()
 
 SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
 SLACK_CHANNEL_ID = os.getenv("SLACK_CHANNEL_ID")
-REACTION_DATA_FILE = "slack_reactions.json"
+REACTION_DATA_FILE = "slack_reactions.json"  # 旧形式（初回にイベントログへ取り込む）
+REACTION_LOG_FILE = os.getenv("REACTION_LOG_FILE", "slack_reactions.jsonl")
+
+# リアクションの取得方法: bulk=conversations.historyでまとめて取得 / per_message=reactions.getで1件ずつ
+REACTION_SCAN_MODE = os.getenv("REACTION_SCAN_MODE", "bulk")
+# conversations.historyの1回あたりの取得件数（上限200）
+HISTORY_PAGE_SIZE = 200
+# まとめて取得する履歴の範囲（日数）。これより古い承認待ちメッセージはreactions.getで1件ずつ取得する
+REACTION_MAX_LOOKBACK_DAYS = float(os.getenv("REACTION_MAX_LOOKBACK_DAYS", "7"))
+
+# 通知方法: per_item=候補ごとに1メッセージ / digest=アカウント・キャンペーンごとに1メッセージにまとめる
+# digestでは1つの✅で載っている候補を全件承認するので、明示的に指定した場合だけ使う
+SLACK_NOTIFY_MODE = os.getenv("SLACK_NOTIFY_MODE", "per_item")
+# まとめ通知1メッセージあたりの候補数（Block Kitは1メッセージ50ブロックまで）
+DIGEST_MAX_ITEMS = int(os.getenv("DIGEST_MAX_ITEMS", "40"))
 
 # リアクションの絵文字
 APPROVE_EMOJI = "white_check_mark"  # ✅
 REJECT_EMOJI = "x"  # ❌
 
+def reaction_key(message_ts, ad_id=None):
+    """リアクション管理レコードのキー
+
+    候補ごとのメッセージはmessage_tsそのもの、まとめ通知は1メッセージに複数の広告が
+    載るので "message_ts:ad_id" にする
+    """
+    return f"{message_ts}:{ad_id}" if ad_id is not None else message_ts
+
+def entry_key(entry):
+    """レコードのキー"""
+    return reaction_key(entry["message_ts"], entry["ad_id"] if entry.get("digest") else None)
+
+def is_digest_enabled():
+    return SLACK_NOTIFY_MODE == "digest"
+
+class ReactionIndex:
+    """リアクション管理レコードのイベントログと ad_id / status / message_ts のインデックス
+
+    レコードはentry_key（通常はmessage_ts）をキーに保持し、ad_id・status・message_tsからは
+    インデックスで引く。インデックスはイベントログの差分読み込みに合わせて更新する
+    """
+
+    def __init__(self, path):
+        self._by_ad_id = {}
+        self._by_status = {}
+        self._by_message = {}
+        self.log = EventLog(path, on_reset=self._rebuild, on_change=self._update)
+
+    def exists(self):
+        return any(
+            os.path.exists(path) for path in (self.log.path, self.log.segment_path, self.log.snapshot_path)
+        )
+
+    # インデックスはキーの辞書を順序付き集合として使う
+    def _rebuild(self, records):
+        self._by_ad_id, self._by_status, self._by_message = {}, {}, {}
+        for key, record in records.items():
+            self._update(key, None, record)
+
+    def _update(self, key, old, new):
+        if old is not None:
+            self._by_ad_id.get(old.get("ad_id"), {}).pop(key, None)
+            self._by_status.get(old.get("status"), {}).pop(key, None)
+            self._by_message.get(old.get("message_ts"), {}).pop(key, None)
+        if new is not None:
+            self._by_ad_id.setdefault(new.get("ad_id"), {})[key] = True
+            self._by_status.setdefault(new.get("status"), {})[key] = True
+            self._by_message.setdefault(new.get("message_ts"), {})[key] = True
+
+    def get(self, key):
+        """キー（entry_key）でレコードを取得"""
+        record = self.log.records().get(key)
+        return dict(record) if record is not None else None
+
+    def find_by_message(self, message_ts):
+        """Slackメッセージに載っている広告のレコードを取得（まとめ通知は複数件）"""
+        records = self.log.records()
+        return [dict(records[key]) for key in list(self._by_message.get(message_ts, {}))]
+
+    def find_by_ad_id(self, ad_id, status=None):
+        """広告IDのレコードを送信順に取得（statusで絞り込み）"""
+        records = self.log.records()
+        return [
+            dict(records[key]) for key in list(self._by_ad_id.get(ad_id, {}))
+            if status is None or records[key].get("status") == status
+        ]
+
+    def find_by_status(self, status):
+        """ステータスのレコードを送信順に取得"""
+        records = self.log.records()
+        return [dict(records[key]) for key in list(self._by_status.get(status, {}))]
+
+    def all(self):
+        return [dict(record) for record in self.log.records().values()]
+
+    def update_many(self, updates):
+        """[(キー, {フィールド}), ...] を1回の書き込みでまとめて追記"""
+        self.log.append(*(
+            {"op": "update", "key": key, "fields": fields}
+            for key, fields in updates
+        ))
+
+    def archive_records(self, statuses, select, archive):
+        """statusesのうちselect(record)が真のレコードをarchive(records)に渡してから削除"""
+        with self.log.exclusive():
+            records = [
+                record for status in statuses
+                for record in self.find_by_status(status)
+                if select(record)
+            ]
+            if not records:
+                return 0
+            archive(records)
+            self.log.append(*({"op": "delete", "key": entry_key(record)} for record in records))
+        return len(records)
+
+
+_reaction_index = None
+
+def get_reaction_index():
+    """リアクション状態のインデックスを取得（初回は旧JSONを取り込む）"""
+    global _reaction_index
+    if _reaction_index is None:
+        index = ReactionIndex(REACTION_LOG_FILE)
+        if not index.exists() and os.path.exists(REACTION_DATA_FILE):
+            try:
+                with open(REACTION_DATA_FILE, 'r', encoding='utf-8') as f:
+                    legacy = json.load(f)
+                index.log.import_records((entry.get("message_ts"), entry) for entry in legacy)
+                print(f"✅ {REACTION_DATA_FILE} からリアクションデータを取り込みました: {len(legacy)}件")
+            except Exception as e:
+                print(f"リアクションデータ取り込みエラー: {e}")
+        _reaction_index = index
+    return _reaction_index
+
+def get_reaction_log():
+    """リアクション状態のイベントログを取得"""
+    return get_reaction_index().log
+
 def load_reaction_data():
     """リアクションデータを読み込む"""
-    if not os.path.exists(REACTION_DATA_FILE):
-        return []
     try:
-        with open(REACTION_DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return get_reaction_index().all()
     except Exception as e:
         print(f"リアクションデータ読み込みエラー: {e}")
         return []
 
-def save_reaction_data(data):
-    """リアクションデータを保存する"""
+def add_reaction_entry(entry):
+    """送信したメッセージのリアクション管理レコードを追記"""
+    return add_reaction_entries([entry])
+
+def add_reaction_entries(entries):
+    """リアクション管理レコードをまとめて追記"""
     try:
-        with open(REACTION_DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        get_reaction_log().append(*(
+            {"op": "put", "key": entry_key(entry), "record": entry} for entry in entries
+        ))
         return True
     except Exception as e:
         print(f"リアクションデータ保存エラー: {e}")
         return False
 
-def send_slack_message_with_bot(text, ad_id):
+def update_reaction_entry(key, **fields):
+    """リアクション管理レコードのステータス変更を追記"""
+    return update_reaction_entries([(key, fields)])
+
+def update_reaction_entries(updates):
+    """複数レコードのステータス変更をまとめて追記
+
+    Args:
+        updates: [(キー（entry_key）, {フィールド}), ...]
     """
-    Slack Bot Tokenを使ってメッセージを送信し、メッセージIDを記録
+    if not updates:
+        return True
+    try:
+        get_reaction_index().update_many(updates)
+        return True
+    except Exception as e:
+        print(f"リアクションデータ保存エラー: {e}")
+        return False
+
+def sync_approval_store(ad_ids, from_status, to_status, **fields):
+    """Slackでの承認・却下・停止をWeb UI（承認ストアの停止承認）にも反映
+
+    Web UIの一覧から処理済みの広告が消え、同じ広告を二重に承認・停止しないようにする
     """
+    if not ad_ids:
+        return []
+    try:
+        return approval_store.transition_many([str(ad_id) for ad_id in ad_ids], from_status, to_status, **fields)
+    except Exception as e:
+        print(f"承認ストアへの反映エラー: {e}")
+        return []
+
+def _post_and_record(text, ad_id, blocks=None, **extra):
+    """メッセージを送信し、送信できた場合はメッセージIDと広告IDを記録"""
     if not SLACK_BOT_TOKEN:
         print("[警告] SLACK_BOT_TOKENが未設定です")
         return None
@@ -53,101 +222,131 @@ def send_slack_message_with_bot(text, ad_id):
         print("[警告] SLACK_CHANNEL_IDが未設定です")
         return None
     
-    url = "https://slack.com/api/chat.postMessage"
-    headers = {
-        "Authorization": f"Bearer {SLACK_BOT_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "channel": SLACK_CHANNEL_ID,
-        "text": text
-    }
-    
     try:
-        res = requests.post(url, headers=headers, json=payload)
-        result = res.json()
-        
-        if result.get("ok"):
-            message_ts = result.get("ts")
-            print(f"✅ Slackメッセージ送信成功: {message_ts}")
-            
-            # メッセージIDと広告IDを記録
-            reaction_data = load_reaction_data()
-            reaction_data.append({
-                "ad_id": ad_id,
-                "message_ts": message_ts,
-                "channel_id": SLACK_CHANNEL_ID,
-                "created_at": datetime.now().isoformat(),
-                "status": "pending"
-            })
-            save_reaction_data(reaction_data)
-            
-            return message_ts
-        else:
-            error_msg = result.get('error')
-            error_detail = result.get('response_metadata', {})
-            print(f"❌ Slackメッセージ送信失敗: {error_msg}")
-            if error_detail:
-                print(f"   詳細: {error_detail}")
-            return None
+        result = get_client().post_message(SLACK_CHANNEL_ID, text, blocks)
     except Exception as e:
         print(f"❌ Slackメッセージ送信エラー: {e}")
         return None
+    
+    if result.get("ok") and result.get("ts"):
+        message_ts = result.get("ts")
+        print(f"✅ Slackメッセージ送信成功: {message_ts}")
+        
+        # メッセージIDと広告IDを記録
+        add_reaction_entry(dict({
+            "ad_id": ad_id,
+            "message_ts": message_ts,
+            "channel_id": SLACK_CHANNEL_ID,
+            "created_at": datetime.now().isoformat(),
+            "status": "pending"
+        }, **extra))
+        
+        return message_ts
+    
+    error_msg = result.get('error')
+    error_detail = result.get('response_metadata', {})
+    print(f"❌ Slackメッセージ送信失敗: {error_msg}")
+    if error_detail:
+        print(f"   詳細: {error_detail}")
+    return None
+
+def send_slack_message_with_bot(text, ad_id):
+    """
+    Slack Bot Tokenを使ってメッセージを送信し、メッセージIDを記録
+    """
+    return _post_and_record(text, ad_id)
 
 def send_slack_message_with_blocks(blocks, text, ad_id, ad_name=""):
     """
     Slack Block Kitを使ってリッチなメッセージを送信
     """
-    if not SLACK_BOT_TOKEN:
-        print("[警告] SLACK_BOT_TOKENが未設定です")
-        return None
+    return _post_and_record(text, ad_id, blocks=blocks, ad_name=ad_name)
+
+def post_digest(title, item_blocks, text, footer):
+    """
+    候補をまとめたメッセージを送信
+
+    候補ごとのブロックをDIGEST_MAX_ITEMS件ずつ1メッセージにまとめ、見出しと
+    リアクションの説明（footer）を付けて送信する。複数メッセージになる場合も
+    送信はまとめてキューに入れ、最後に送信結果を確認する
+
+    Args:
+        item_blocks: 候補ごとのブロック（1候補1ブロック）
+
+    Returns:
+        item_blocksと同じ順のmessage_tsのリスト（送信できなかった候補はNone）
+    """
+    message_ts_list = [None] * len(item_blocks)
+    if not item_blocks:
+        return message_ts_list
     
-    if not SLACK_CHANNEL_ID:
-        print("[警告] SLACK_CHANNEL_IDが未設定です")
-        return None
+    if not SLACK_BOT_TOKEN or not SLACK_CHANNEL_ID:
+        print("[警告] SLACK_BOT_TOKENまたはSLACK_CHANNEL_IDが未設定です")
+        return message_ts_list
     
-    url = "https://slack.com/api/chat.postMessage"
-    headers = {
-        "Authorization": f"Bearer {SLACK_BOT_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "channel": SLACK_CHANNEL_ID,
-        "blocks": blocks,
-        "text": text  # フォールバック用
-    }
+    chunks = [
+        range(start, min(start + DIGEST_MAX_ITEMS, len(item_blocks)))
+        for start in range(0, len(item_blocks), DIGEST_MAX_ITEMS)
+    ]
     
-    try:
-        res = requests.post(url, headers=headers, json=payload)
-        result = res.json()
+    futures = []
+    for page, chunk in enumerate(chunks, 1):
+        heading = title if len(chunks) == 1 else f"{title}（{page}/{len(chunks)}）"
+        blocks = [
+            {"type": "header", "text": {"type": "plain_text", "text": heading[:150]}},
+            {"type": "context", "elements": [{"type": "mrkdwn", "text": f"{len(chunk)}件"}]},
+        ]
+        blocks.extend(item_blocks[i] for i in chunk)
+        blocks.append({"type": "divider"})
+        blocks.append({"type": "context", "elements": [{"type": "mrkdwn", "text": footer}]})
+        futures.append((chunk, get_client().submit_message(SLACK_CHANNEL_ID, f"{heading}（{len(chunk)}件）", blocks)))
+    
+    for chunk, future in futures:
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"❌ Slackまとめ通知送信エラー: {e}")
+            continue
         
-        if result.get("ok"):
-            message_ts = result.get("ts")
-            print(f"✅ Slackメッセージ送信成功: {message_ts}")
-            
-            # メッセージIDと広告IDを記録
-            reaction_data = load_reaction_data()
-            reaction_data.append({
-                "ad_id": ad_id,
-                "ad_name": ad_name,
-                "message_ts": message_ts,
-                "channel_id": SLACK_CHANNEL_ID,
-                "created_at": datetime.now().isoformat(),
-                "status": "pending"
-            })
-            save_reaction_data(reaction_data)
-            
-            return message_ts
+        if result.get("ok") and result.get("ts"):
+            print(f"✅ Slackまとめ通知送信成功: {result['ts']}（{len(chunk)}件）")
+            for i in chunk:
+                message_ts_list[i] = result["ts"]
         else:
-            error_msg = result.get('error')
-            error_detail = result.get('response_metadata', {})
-            print(f"❌ Slackメッセージ送信失敗: {error_msg}")
-            if error_detail:
-                print(f"   詳細: {error_detail}")
-            return None
-    except Exception as e:
-        print(f"❌ Slackメッセージ送信エラー: {e}")
-        return None
+            print(f"❌ Slackまとめ通知送信失敗: {result.get('error')}")
+    
+    return message_ts_list
+
+def send_slack_digest_with_blocks(title, items, text, footer=None):
+    """
+    停止候補をまとめて送信し、広告ごとにリアクション管理レコードを記録
+
+    メッセージへの✅/❌はそのメッセージに載っている全広告に適用される
+
+    Args:
+        items: [{"ad_id": ..., "ad_name": ..., "block": 候補のブロック}, ...]
+
+    Returns:
+        {ad_id: message_ts}（送信できた広告のみ）
+    """
+    footer = footer or "👍 このメッセージに絵文字でリアクション: ✅ = 全件の停止を承認 | ❌ = 全件を却下"
+    message_ts_list = post_digest(title, [item["block"] for item in items], text, footer)
+    
+    created_at = datetime.now().isoformat()
+    entries = [
+        {
+            "ad_id": item["ad_id"],
+            "ad_name": item.get("ad_name", ""),
+            "message_ts": message_ts,
+            "channel_id": SLACK_CHANNEL_ID,
+            "created_at": created_at,
+            "status": "pending",
+            "digest": True
+        }
+        for item, message_ts in zip(items, message_ts_list) if message_ts
+    ]
+    add_reaction_entries(entries)
+    return {entry["ad_id"]: entry["message_ts"] for entry in entries}
 
 def get_message_reactions(message_ts):
     """
@@ -161,30 +360,108 @@ def get_message_reactions(message_ts):
         print("[警告] SLACK_CHANNEL_IDが未設定です")
         return []
     
-    url = "https://slack.com/api/reactions.get"
-    headers = {
-        "Authorization": f"Bearer {SLACK_BOT_TOKEN}"
-    }
+    try:
+        result = get_client().call("reactions.get", channel=SLACK_CHANNEL_ID, timestamp=message_ts)
+    except Exception as e:
+        print(f"リアクション取得エラー: {e}")
+        return []
+    
+    if result.get("ok"):
+        return result.get("message", {}).get("reactions", [])
+    
+    error = result.get("error")
+    if error != "message_not_found":
+        print(f"リアクション取得エラー: {error}")
+    return []
+
+def reaction_status(reactions):
+    """
+    リアクション一覧から承認状態を判定（承認が優先）
+    """
+    names = {reaction.get("name") for reaction in reactions}
+    if APPROVE_EMOJI in names:
+        return "approved"
+    if REJECT_EMOJI in names:
+        return "rejected"
+    return "pending"
+
+def fetch_channel_reactions(oldest):
+    """
+    conversations.historyでoldest以降のメッセージをまとめて取得し、リアクションを返す
+
+    Returns:
+        {message_ts: リアクション一覧} / 取得に失敗した場合はNone
+    """
+    if not SLACK_BOT_TOKEN or not SLACK_CHANNEL_ID:
+        print("[警告] SLACK_BOT_TOKENまたはSLACK_CHANNEL_IDが未設定です")
+        return None
+    
     params = {
         "channel": SLACK_CHANNEL_ID,
-        "timestamp": message_ts
+        "oldest": oldest,
+        "inclusive": "true",
+        "limit": HISTORY_PAGE_SIZE
     }
     
+    reactions_by_ts = {}
+    pages = 0
     try:
-        res = requests.get(url, headers=headers, params=params)
-        result = res.json()
-        
-        if result.get("ok"):
-            reactions = result.get("message", {}).get("reactions", [])
-            return reactions
-        else:
-            error = result.get("error")
-            if error != "message_not_found":
-                print(f"リアクション取得エラー: {error}")
-            return []
+        while True:
+            result = get_client().call("conversations.history", **params)
+            if not result.get("ok"):
+                print(f"チャンネル履歴取得エラー: {result.get('error')}")
+                return None
+            
+            pages += 1
+            for message in result.get("messages", []):
+                reactions_by_ts[message.get("ts")] = message.get("reactions", [])
+            
+            cursor = result.get("response_metadata", {}).get("next_cursor")
+            if not result.get("has_more") or not cursor:
+                break
+            params["cursor"] = cursor
     except Exception as e:
-        print(f"リアクション取得エラー: {e}")
-        return []
+        print(f"チャンネル履歴取得エラー: {e}")
+        return None
+    
+    print(f"📥 チャンネル履歴から{len(reactions_by_ts)}件のメッセージを取得（{pages}リクエスト）")
+    return reactions_by_ts
+
+def get_reactions_for_messages(message_ts_list):
+    """
+    複数メッセージのリアクションを取得
+
+    bulkモードでは直近REACTION_MAX_LOOKBACK_DAYS日以内のメッセージについて、
+    そのうち最も古いもの以降のチャンネル履歴を1回のページングで読んで解決する。
+    それより古いメッセージ（長く承認待ちのままのもの）まで履歴を遡ると
+    ページ数が際限なく増えるので、古いメッセージと履歴の取得に失敗した場合は
+    reactions.getで1件ずつ取得する。
+
+    Returns:
+        {message_ts: リアクション一覧}
+    """
+    message_ts_list = sorted(set(filter(None, message_ts_list)), key=float)
+    if not message_ts_list:
+        return {}
+    
+    reactions = {}
+    if REACTION_SCAN_MODE == "bulk":
+        cutoff = time.time() - REACTION_MAX_LOOKBACK_DAYS * 86400
+        recent = [ts for ts in message_ts_list if float(ts) >= cutoff]
+        if recent:
+            reactions_by_ts = fetch_channel_reactions(recent[0])
+            if reactions_by_ts is not None:
+                reactions = {ts: reactions_by_ts.get(ts, []) for ts in recent}
+            else:
+                print("↪️  reactions.getで1件ずつ取得します")
+        older = len(message_ts_list) - len(recent)
+        if older:
+            print(f"↪️  {REACTION_MAX_LOOKBACK_DAYS:g}日より古い{older}件はreactions.getで1件ずつ取得します")
+    
+    for ts in message_ts_list:
+        if ts not in reactions:
+            reactions[ts] = get_message_reactions(ts)
+    return reactions
 
 def check_approval_status(ad_id):
     """
@@ -196,67 +473,47 @@ def check_approval_status(ad_id):
         "pending": リアクションなし
         None: メッセージが見つからない
     """
-    reaction_data = load_reaction_data()
-    
-    # 広告IDに対応するメッセージを検索
-    message_entry = None
-    for entry in reaction_data:
-        if entry.get("ad_id") == ad_id and entry.get("status") == "pending":
-            message_entry = entry
-            break
-    
-    if not message_entry:
+    # 広告IDに対応する承認待ちメッセージをインデックスで検索
+    entries = get_reaction_index().find_by_ad_id(ad_id, status="pending")
+    if not entries:
         return None
     
-    message_ts = message_entry.get("message_ts")
-    reactions = get_message_reactions(message_ts)
-    
-    # リアクションをチェック
-    has_approve = False
-    has_reject = False
-    
-    for reaction in reactions:
-        emoji = reaction.get("name")
-        if emoji == APPROVE_EMOJI:
-            has_approve = True
-        elif emoji == REJECT_EMOJI:
-            has_reject = True
-    
-    # 承認が優先
-    if has_approve:
-        return "approved"
-    elif has_reject:
-        return "rejected"
-    else:
-        return "pending"
+    return reaction_status(get_message_reactions(entries[0].get("message_ts")))
 
 def get_approved_ads():
     """
     ✅リアクションがついた広告のリストを取得
     """
-    reaction_data = load_reaction_data()
     approved_ads = []
+    updates = []
     
-    for entry in reaction_data:
-        if entry.get("status") != "pending":
-            continue
-        
-        ad_id = entry.get("ad_id")
-        status = check_approval_status(ad_id)
+    # 承認待ちのメッセージだけをインデックスから取り出し、リアクションをまとめて取得
+    pending_entries = get_reaction_index().find_by_status("pending")
+    reactions_by_ts = get_reactions_for_messages(
+        [entry.get("message_ts") for entry in pending_entries]
+    )
+    
+    for entry in pending_entries:
+        message_ts = entry.get("message_ts")
+        status = reaction_status(reactions_by_ts.get(message_ts, []))
         
         if status == "approved":
             approved_ads.append({
-                "ad_id": ad_id,
-                "message_ts": entry.get("message_ts"),
+                "ad_id": entry.get("ad_id"),
+                "ad_name": entry.get("ad_name", ""),
+                "message_ts": message_ts,
                 "created_at": entry.get("created_at")
             })
-            
-            # ステータスを更新
-            entry["status"] = "approved"
-            entry["approved_at"] = datetime.now().isoformat()
+            updates.append((entry_key(entry), {
+                "status": "approved",
+                "approved_at": datetime.now().isoformat()
+            }))
     
-    # 更新を保存
-    save_reaction_data(reaction_data)
+    # ステータス変更はまとめて1回で追記
+    if update_reaction_entries(updates):
+        sync_approval_store(
+            [ad["ad_id"] for ad in approved_ads], "pending", "approved", approved_at=datetime.now().isoformat()
+        )
     
     print(f"✅ 承認済み広告: {len(approved_ads)}件")
     return approved_ads
@@ -265,17 +522,36 @@ def mark_as_stopped(ad_id):
     """
     広告を停止済みとしてマーク
     """
-    reaction_data = load_reaction_data()
+    return bool(mark_many_as_stopped([ad_id]))
+
+def mark_many_as_stopped(ad_ids):
+    """
+    複数の広告を停止済みとしてまとめてマーク
     
-    for entry in reaction_data:
-        if entry.get("ad_id") == ad_id:
-            entry["status"] = "stopped"
-            entry["stopped_at"] = datetime.now().isoformat()
-            save_reaction_data(reaction_data)
-            print(f"✅ 広告 {ad_id} を停止済みにマークしました")
-            return True
+    Returns:
+        停止済みにした広告IDのリスト
+    """
+    index = get_reaction_index()
+    stopped_at = datetime.now().isoformat()
+    updates = []
+    marked = []
+    
+    for ad_id in dict.fromkeys(ad_ids):
+        # 停止を承認したメッセージだけを停止済みにする（承認待ち・却下のメッセージはそのまま）
+        entries = index.find_by_ad_id(ad_id, status="approved")
+        if not entries:
+            continue
+        for entry in entries:
+            updates.append((entry_key(entry), {"status": "stopped", "stopped_at": stopped_at}))
+        marked.append(ad_id)
+    
+    if not update_reaction_entries(updates):
+        return []
+    sync_approval_store(marked, "approved", "stopped", stopped_at=stopped_at)
     
-    return False
+    for ad_id in marked:
+        print(f"✅ 広告 {ad_id} を停止済みにマークしました")
+    return marked
 
 def test_slack_connection():
     """
@@ -289,14 +565,8 @@ def test_slack_connection():
         print("❌ SLACK_CHANNEL_IDが未設定です")
         return False
     
-    url = "https://slack.com/api/auth.test"
-    headers = {
-        "Authorization": f"Bearer {SLACK_BOT_TOKEN}"
-    }
-    
     try:
-        res = requests.get(url, headers=headers)
-        result = res.json()
+        result = get_client().call("auth.test")
         
         if result.get("ok"):
             print(f"✅ Slack接続成功")
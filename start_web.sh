@@ -16,9 +16,15 @@ fi
 
 # Flaskの起動
 echo "📊 Web UIを起動中..."
-echo "   アクセスURL: http://localhost:5000"
+echo "   アクセスURL: http://localhost:${PORT:-5000}"
 echo ""
 echo "停止するには Ctrl+C を押してください"
 echo ""
 
+# Gunicornがあれば本番用の設定（複数ワーカー）で起動し、無ければ開発用サーバーで起動
+if command -v gunicorn &> /dev/null; then
+    exec gunicorn -c gunicorn.conf.py approval_web:app
+fi
+
+echo "⚠️  gunicornが見つからないため開発用サーバーで起動します（pip install gunicorn）"
 python3 approval_web.py
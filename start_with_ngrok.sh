@@ -32,7 +32,11 @@ echo ""
 
 # Flaskを起動（バックグラウンド）
 echo "📊 Web UIを起動中..."
-python3 approval_web.py > /dev/null 2>&1 &
+if command -v gunicorn &> /dev/null; then
+    gunicorn -c gunicorn.conf.py approval_web:app > /dev/null 2>&1 &
+else
+    WEB_DEBUG=0 python3 approval_web.py > /dev/null 2>&1 &
+fi
 FLASK_PID=$!
 
 # Flaskの起動を待つ
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+状態データの読み書き窓口
+
+承認データ・コピー履歴・Slackリアクションの読み込みはこのモジュールを使う。
+読み込んだ内容はプロセス内にキャッシュし、ファイルの更新日時・サイズ（inode）が
+変わった時だけ読み直すので、Web UIのページ表示や繰り返しの呼び出しでも再パースしない。
+"""
+
+from bisect import bisect_left, bisect_right
+
+import approval_store
+from local_state import (
+    atomic_write_json,
+    cached,
+    file_lock,
+    file_signature,
+    read_json_cached,
+    update_json,
+)
+
+COPY_HISTORY_FILE = "ad_copy_history.json"
+
+
+# --- 承認データ ---
+def load_approvals(status=None, kind=None):
+    """承認データを取得（承認ストアが変更されるまでキャッシュ）
+
+    レコードは呼び出しごとにコピーして返すので、変更して save_approvals に渡してよい
+    """
+    records = cached(
+        ("approvals", status, kind),
+        approval_store.store_signature(),
+        lambda: approval_store.load_approvals(status=status, kind=kind),
+    )
+    return [dict(record) for record in records]
+
+
+# 並べ替えに使えるフィールド
+APPROVAL_SORT_FIELDS = ("created_at", "id", "cpa", "status", "campaign_name", "adset_name")
+
+
+def _sort_value(record, field):
+    value = record.get(field)
+    if field == "cpa":
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    if field == "id":
+        return value
+    return None if value is None else str(value)
+
+
+def approval_sort_key(record, field):
+    """並べ替えのキー（値が無いレコードは最後、同じ値はid順）"""
+    value = _sort_value(record, field)
+    if value is None:
+        return (1, "", record["id"])
+    return (0, value, record["id"])
+
+
+def _sorted_approvals(field):
+    """全承認データをfieldの昇順に並べたリストとキーのリスト（承認ストアが変更されるまでキャッシュ）"""
+    def load():
+        records = sorted(approval_store.load_approvals(), key=lambda record: approval_sort_key(record, field))
+        return records, [approval_sort_key(record, field) for record in records]
+
+    return cached(("approvals_sorted", field), approval_store.store_signature(), load)
+
+
+def _matches(record, statuses, kind, campaign, adset, since, until):
+    if statuses and record.get("status") not in statuses:
+        return False
+    if kind is not None and not approval_store.matches_kind(record, kind):
+        return False
+    if campaign is not None and campaign not in (str(record.get("campaign_id")), record.get("campaign_name")):
+        return False
+    if adset is not None and adset not in (str(record.get("adset_id")), record.get("adset_name")):
+        return False
+    created_at = record.get("created_at") or ""
+    if since is not None and created_at < since:
+        return False
+    # 日付だけを指定した場合はその日を含める
+    if until is not None and created_at[:len(until)] > until:
+        return False
+    return True
+
+
+def query_approvals(statuses=None, kind=None, campaign=None, adset=None, since=None, until=None,
+                    sort="created_at", descending=False, after=None, limit=100):
+    """承認データを絞り込み・並べ替えて1ページ分取得
+
+    並べ替え済みのリストはキャッシュし、afterのキーの位置から二分探索で読み始めるので
+    ページの取得は履歴の件数に比例しない（絞り込みで飛ばすレコードの分だけ読む）
+
+    Args:
+        statuses: ステータスのリスト（いずれかに一致）
+        campaign: キャンペーンIDまたはキャンペーン名
+        adset: 広告セットIDまたは広告セット名
+        since / until: created_at の範囲（ISO形式、untilは日付だけなら当日を含む）
+        after: 前のページの最後のレコードのキー（approval_sort_key）
+        limit: 1ページの件数（Noneの場合は条件に合う全件）
+
+    Returns:
+        (レコードのリスト, 次のページがある場合は最後のレコードのキー / 無ければNone)
+    """
+    records, keys = _sorted_approvals(sort)
+
+    if descending:
+        start = bisect_left(keys, after) - 1 if after is not None else len(records) - 1
+        positions = range(start, -1, -1)
+    else:
+        start = bisect_right(keys, after) if after is not None else 0
+        positions = range(start, len(records))
+
+    page = []
+    for position in positions:
+        record = records[position]
+        if not _matches(record, statuses, kind, campaign, adset, since, until):
+            continue
+        if len(page) == limit:
+            return page, keys[page_position]
+        page.append(dict(record))
+        page_position = position
+    return page, None
+
+
+# --- コピー履歴 ---
+def load_copy_history():
+    """コピー履歴を読み込み（ファイルが変更されるまでキャッシュ）"""
+    try:
+        return list(read_json_cached(COPY_HISTORY_FILE, []))
+    except Exception as e:
+        print(f"コピー履歴読み込みエラー: {e}")
+    return []
+
+
+def load_copy_history_records(include_archived=False):
+    """コピー履歴をCopyHistoryRecordのリストとして読み込み（ファイルが変更されるまでキャッシュ）"""
+    from records import load_copy_history_records as load_records
+
+    signature = file_signature(COPY_HISTORY_FILE)
+    if include_archived:
+        from retention import list_shards
+
+        shards = list_shards("copy_history")
+        signature += tuple(shards) + file_signature(*shards)
+    return list(cached(
+        ("copy_history_records", include_archived),
+        signature,
+        lambda: load_records(COPY_HISTORY_FILE, include_archived=include_archived),
+    ))
+
+
+def save_copy_history(history):
+    """コピー履歴を保存"""
+    try:
+        with file_lock(COPY_HISTORY_FILE):
+            atomic_write_json(COPY_HISTORY_FILE, history)
+        return True
+    except Exception as e:
+        print(f"コピー履歴保存エラー: {e}")
+        return False
+
+
+def append_copy_history(record):
+    """コピー履歴に1件追加（他プロセスの追加を失わないようロックして追記）"""
+    try:
+        update_json(COPY_HISTORY_FILE, [], lambda history: history.append(record))
+        return True
+    except Exception as e:
+        print(f"コピー履歴保存エラー: {e}")
+        return False
+
+
+# --- Slackリアクション ---
+def load_reaction_data():
+    """リアクション管理レコードを取得（イベントログの未読分だけを読み込む）"""
+    from slack_reaction_helper import load_reaction_data as load
+
+    return load()
@@ -0,0 +1,174 @@
+function showNotification(message, isSuccess = true) {
+    const notification = document.getElementById('notification');
+    notification.textContent = message;
+    notification.style.background = isSuccess ? '#28a745' : '#dc3545';
+    notification.style.display = 'block';
+    
+    setTimeout(() => {
+        notification.style.display = 'none';
+    }, 3000);
+}
+
+function selectedAdIds() {
+    return Array.from(document.querySelectorAll('.ad-card .ad-select:checked')).map(el => el.value);
+}
+
+function updateSelection() {
+    const count = selectedAdIds().length;
+    document.getElementById('selected-count').textContent = `${count}件選択中`;
+    document.querySelectorAll('.bulk-btn').forEach(button => button.disabled = count === 0);
+}
+
+function selectAll(checked) {
+    document.querySelectorAll('.ad-card .ad-select').forEach(el => el.checked = checked);
+    updateSelection();
+}
+
+const STATUSES = ['pending', 'approved', 'stopped', 'rejected'];
+
+function updateCounts(counts) {
+    STATUSES.forEach(status => {
+        const el = document.getElementById(`count-${status}`);
+        if (el) el.textContent = counts[status] || 0;
+    });
+    document.getElementById('bulk-bar').hidden = !counts.pending;
+}
+
+// 一覧が空のときだけ「〜の広告はありません」を表示する
+function updateEmptyStates() {
+    document.querySelectorAll('.ad-list').forEach(list => {
+        const empty = list.nextElementSibling;
+        if (empty && empty.classList.contains('empty-state')) {
+            empty.hidden = list.children.length > 0;
+        }
+    });
+}
+
+function resetSelection() {
+    document.getElementById('select-all').checked = false;
+    updateSelection();
+}
+
+function cardFromHtml(html) {
+    const template = document.createElement('template');
+    template.innerHTML = html.trim();
+    return template.content.firstElementChild;
+}
+
+// 承認データ1件の変更を一覧に反映する（ページを再読み込みせずにカードを移動・置き換え・削除）
+function applyChange(change) {
+    const existing = document.querySelector(`.ad-card[data-approval-id="${change.id}"]`);
+    const list = document.getElementById(`list-${change.status}`);
+    // 承認済み・停止済み・却下済みは新しい順なので、1ページ目を表示している場合だけ先頭に追加する
+    const visible = list && change.html && (change.status === 'pending' || list.dataset.page === '1');
+    
+    if (!visible) {
+        if (existing) existing.remove();
+        return;
+    }
+    const card = cardFromHtml(change.html);
+    if (existing && existing.parentElement === list) {
+        // 同じ一覧のまま内容だけ変わった場合は選択状態を残して置き換える
+        const checkbox = existing.querySelector('.ad-select');
+        const newCheckbox = card.querySelector('.ad-select');
+        if (checkbox && newCheckbox) newCheckbox.checked = checkbox.checked;
+        existing.replaceWith(card);
+        return;
+    }
+    if (existing) existing.remove();
+    if (change.status === 'pending') {
+        list.append(card);
+    } else {
+        list.prepend(card);
+        const pageSize = Number(list.dataset.pageSize);
+        while (pageSize && list.children.length > pageSize) list.lastElementChild.remove();
+    }
+}
+
+function applyChanges(changes, counts) {
+    changes.forEach(applyChange);
+    updateCounts(counts);
+    updateEmptyStates();
+    updateSelection();
+}
+
+// 一覧部分だけを読み直す（ライブ更新で差分を追えなくなった場合・更新ボタン）
+async function refreshSections() {
+    try {
+        const response = await fetch('/api/dashboard' + location.search);
+        const data = await response.json();
+        STATUSES.forEach(status => {
+            document.getElementById(`section-${status}`).innerHTML = data.sections[status];
+        });
+        updateCounts(data.counts);
+        resetSelection();
+    } catch (error) {
+        showNotification('❌ 一覧の更新に失敗しました', false);
+        console.error(error);
+    }
+}
+
+// 承認データの変更をServer-Sent Eventsで受け取り、その場で一覧に反映する
+// （Web UI・Slackのリアクション・approved_stopper.py のどこからの変更も届く）
+function startLiveUpdates() {
+    if (!window.EventSource) return;
+    const cursor = encodeURIComponent(document.body.dataset.cursor || '');
+    const source = new EventSource(`/api/approvals/stream?cursor=${cursor}`);
+    source.addEventListener('approvals', event => {
+        const data = JSON.parse(event.data);
+        applyChanges(data.changes, data.counts);
+    });
+    source.addEventListener('reset', () => refreshSections());
+}
+
+// 承認・却下した広告はページを再読み込みせずに一覧から外し、件数だけ更新する
+// （承認済み・却下済みの一覧への追加はライブ更新で届く）
+async function applyAction(action, adIds) {
+    try {
+        const response = await fetch('/api/approvals/bulk', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({action: action, ad_ids: adIds})
+        });
+        const data = await response.json();
+        
+        if (!data.success) {
+            showNotification('❌ ' + data.message, false);
+            return;
+        }
+        
+        data.updated.forEach(adId => {
+            const card = document.querySelector(`#list-pending .ad-card[data-ad-id="${adId}"]`);
+            if (card) card.remove();
+        });
+        updateCounts(data.counts);
+        updateEmptyStates();
+        resetSelection();
+        
+        const suffix = data.not_found.length ? `（${data.not_found.length}件は処理済みのためスキップ）` : '';
+        showNotification((action === 'approve' ? '✅ ' : '❌ ') + data.message + suffix);
+    } catch (error) {
+        showNotification('❌ エラーが発生しました', false);
+        console.error(error);
+    }
+}
+
+async function bulkAction(action) {
+    const adIds = selectedAdIds();
+    if (adIds.length === 0) return;
+    const label = action === 'approve' ? '停止を承認' : '却下';
+    if (!confirm(`選択した${adIds.length}件の広告を${label}しますか？`)) return;
+    await applyAction(action, adIds);
+}
+
+async function approveAd(adId) {
+    if (!confirm('この広告の停止を承認しますか？')) return;
+    await applyAction('approve', [adId]);
+}
+
+async function rejectAd(adId) {
+    if (!confirm('この広告の停止を却下しますか？')) return;
+    await applyAction('reject', [adId]);
+}
+
+startLiveUpdates();
@@ -0,0 +1,19 @@
+"""
+テスト共通の設定
+
+モジュールはリポジトリ直下にあるのでパスに追加し、
+各テストは一時ディレクトリをカレントディレクトリにして状態ファイルを分離する。
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,134 @@
+import multiprocessing
+
+import pytest
+
+import approval_store
+
+
+@pytest.fixture(autouse=True, params=["sqlite", "eventlog"])
+def backend(request, monkeypatch, workdir):
+    monkeypatch.setattr(approval_store, "APPROVAL_STORE_BACKEND", request.param)
+    # 終了時のチェックポイントはカレントディレクトリが戻ってから動くので絶対パスにする
+    monkeypatch.setattr(approval_store, "APPROVAL_DB_FILE", str(workdir / "approvals.db"))
+    monkeypatch.setattr(approval_store, "APPROVAL_LOG_FILE", str(workdir / "approvals.jsonl"))
+    monkeypatch.setattr(approval_store, "_backend", None)
+    return request.param
+
+
+def fresh_backend():
+    """別プロセスと同じく、接続やメモリ上のインデックスを共有しないバックエンドにする"""
+    approval_store._backend = None
+    return approval_store.get_backend()
+
+
+def claim_all(record_ids, results):
+    fresh_backend()
+    won = [
+        record_id for record_id in record_ids
+        if approval_store.update_approval_if(record_id, {"status": "approved"}, status="approved_running")
+    ]
+    results.put(won)
+
+
+def add_many(prefix, count):
+    fresh_backend()
+    for i in range(count):
+        approval_store.add_approval({"ad_id": f"{prefix}-{i}", "status": "pending"})
+
+
+def test_add_update_and_lookup():
+    record_id = approval_store.add_approval({"ad_id": "1", "status": "pending", "message_ts": "100.1"})
+    assert approval_store.get_approval(record_id)["ad_id"] == "1"
+    assert approval_store.find_by_message_ts("100.1")["id"] == record_id
+
+    assert approval_store.update_approval(record_id, status="approved", approved_by="u1")
+    assert approval_store.get_by_ad_id("1", status="approved")["approved_by"] == "u1"
+    assert approval_store.get_by_ad_id("1", status="pending") is None
+    assert approval_store.count_by_status()["approved"] == 1
+
+
+def test_update_approval_if_checks_expected_fields():
+    record_id = approval_store.add_approval({"ad_id": "1", "status": "approved"})
+
+    assert not approval_store.update_approval_if(record_id, {"status": "pending"}, status="stopped")
+    assert approval_store.update_approval_if(record_id, {"status": "approved"}, status="approved_running")
+    assert not approval_store.update_approval_if(record_id, {"status": "approved"}, status="approved_running")
+    assert not approval_store.update_approval_if("missing", {"status": "approved"}, status="stopped")
+    assert approval_store.get_approval(record_id)["status"] == "approved_running"
+
+
+def test_transition_many_only_moves_matching_status():
+    approval_store.add_approval({"ad_id": "1", "status": "pending"})
+    approval_store.add_approval({"ad_id": "2", "status": "rejected"})
+
+    assert approval_store.transition_many(["1", "2", "3"], "pending", "approved") == ["1"]
+    assert approval_store.get_by_ad_id("1")["status"] == "approved"
+    assert approval_store.get_by_ad_id("2")["status"] == "rejected"
+
+
+def test_upsert_pending_updates_existing_pending_records():
+    added, updated = approval_store.upsert_pending_approvals([{"ad_id": "1", "cpa": 100}])
+    assert (added, updated) == (["1"], [])
+
+    added, updated = approval_store.upsert_pending_approvals([
+        {"ad_id": "1", "cpa": 120},
+        {"ad_id": "2", "cpa": 90},
+    ])
+    assert (added, updated) == (["2"], ["1"])
+    assert approval_store.get_by_ad_id("1")["cpa"] == 120
+    assert approval_store.count_by_status()["pending"] == 2
+
+
+def test_changes_since_reports_changes_after_cursor():
+    changes, cursor = approval_store.changes_since(None)
+    assert changes is None
+
+    record_id = approval_store.add_approval({"ad_id": "1", "status": "pending"})
+    approval_store.update_approval(record_id, status="approved")
+    changes, cursor = approval_store.changes_since(cursor)
+    assert [(change["id"], change["status"]) for change in changes] == [
+        (record_id, "pending"), (record_id, "approved"),
+    ]
+    assert approval_store.changes_since(cursor) == ([], cursor)
+
+
+def test_store_is_reopened_from_disk():
+    record_id = approval_store.add_approval({"ad_id": "1", "status": "pending"})
+    approval_store.update_approval(record_id, status="approved")
+
+    fresh_backend()
+    assert approval_store.get_approval(record_id)["status"] == "approved"
+    assert approval_store.count_by_status()["approved"] == 1
+
+
+def test_concurrent_claims_from_processes_win_once():
+    record_ids = [approval_store.add_approval({"ad_id": str(i), "status": "approved"}) for i in range(20)]
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    processes = [context.Process(target=claim_all, args=(record_ids, results)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    won = [record_id for _ in processes for record_id in results.get(timeout=60)]
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    assert sorted(won) == sorted(record_ids)
+    fresh_backend()
+    assert approval_store.count_by_status().get("approved_running") == 20
+
+
+def test_concurrent_adds_from_processes_get_unique_ids():
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=add_many, args=(str(n), 15)) for n in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    fresh_backend()
+    records = approval_store.load_approvals()
+    assert len(records) == 60
+    assert len({record["id"] for record in records}) == 60
+    assert approval_store.count_by_status()["pending"] == 60
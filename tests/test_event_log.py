@@ -0,0 +1,144 @@
+import os
+import threading
+import multiprocessing
+
+from event_log import EventLog
+
+
+def wait_for_compaction():
+    for thread in threading.enumerate():
+        if thread.name.startswith("compact:"):
+            thread.join()
+
+
+def increment(path, key, times, compact_every):
+    """別プロセスから「読んでから更新」を繰り返す"""
+    log = EventLog(path, compact_every=compact_every)
+    for _ in range(times):
+        with log.exclusive():
+            count = log.records().get(key, {}).get("count", 0)
+            log.put(key, {"count": count + 1})
+    wait_for_compaction()
+
+
+def test_put_update_delete_replay_in_another_instance():
+    writer = EventLog("events.jsonl")
+    writer.put("a", {"status": "pending"})
+    writer.put("b", {"status": "pending"})
+    writer.update("a", status="approved", by="u1")
+    writer.delete("b")
+    writer.update("missing", status="approved")
+
+    reader = EventLog("events.jsonl")
+    assert reader.records() == {"a": {"status": "approved", "by": "u1"}}
+
+
+def test_catch_up_reads_only_new_events_and_calls_on_change():
+    changes = []
+    writer = EventLog("events.jsonl")
+    reader = EventLog("events.jsonl", on_change=lambda key, old, new: changes.append((key, old, new)))
+    writer.put("a", {"n": 1})
+    assert reader.records() == {"a": {"n": 1}}
+
+    writer.update("a", n=2)
+    writer.put("b", {"n": 1})
+    assert reader.records() == {"a": {"n": 2}, "b": {"n": 1}}
+    assert changes == [("a", {"n": 1}, {"n": 2}), ("b", None, {"n": 1})]
+
+
+def test_partial_last_line_is_ignored_until_complete():
+    log = EventLog("events.jsonl")
+    log.put("a", {"n": 1})
+    with open("events.jsonl", "ab") as f:
+        f.write(b'{"op": "put", "key": "b", "rec')
+
+    assert EventLog("events.jsonl").records() == {"a": {"n": 1}}
+
+    with open("events.jsonl", "ab") as f:
+        f.write(b'ord": {"n": 2}}\n')
+    assert log.records() == {"a": {"n": 1}, "b": {"n": 2}}
+
+
+def test_compaction_writes_snapshot_and_reader_reloads():
+    resets = []
+    writer = EventLog("events.jsonl")
+    reader = EventLog("events.jsonl", on_reset=lambda records: resets.append(dict(records)))
+    for i in range(5):
+        writer.put(str(i), {"i": i})
+    writer.delete("0")
+    assert len(reader.records()) == 4
+
+    assert writer.compact()
+    assert os.path.getsize("events.jsonl.snapshot") > 0
+    assert not os.path.exists("events.jsonl")
+    assert not os.path.exists("events.jsonl.compacting")
+
+    writer.update("1", i=10)
+    expected = {"1": {"i": 10}, "2": {"i": 2}, "3": {"i": 3}, "4": {"i": 4}}
+    assert reader.records() == expected
+    assert reader._generation == 1
+    assert resets[-1] == expected
+    assert EventLog("events.jsonl").records() == expected
+
+
+def test_automatic_compaction_after_compact_every_events():
+    log = EventLog("events.jsonl", compact_every=3)
+    for i in range(7):
+        log.put(str(i), {"i": i})
+    wait_for_compaction()
+
+    assert os.path.exists("events.jsonl.snapshot")
+    assert EventLog("events.jsonl").records() == {str(i): {"i": i} for i in range(7)}
+
+
+def test_interrupted_compaction_is_recovered():
+    log = EventLog("events.jsonl")
+    log.put("a", {"n": 1})
+    log.put("b", {"n": 1})
+    # ログをローテートした直後にコンパクションが止まった状態
+    os.replace("events.jsonl", "events.jsonl.compacting")
+    log.update("a", n=2)
+
+    assert EventLog("events.jsonl").records() == {"a": {"n": 2}, "b": {"n": 1}}
+
+    assert log.compact()
+    assert not os.path.exists("events.jsonl.compacting")
+    log.update("b", n=3)
+    assert EventLog("events.jsonl").records() == {"a": {"n": 2}, "b": {"n": 3}}
+
+
+def test_import_records_creates_initial_snapshot():
+    log = EventLog("events.jsonl")
+    assert log.import_records([("a", {"n": 1}), ("b", {"n": 2})])
+    assert not os.path.exists("events.jsonl")
+    assert EventLog("events.jsonl").records() == {"a": {"n": 1}, "b": {"n": 2}}
+
+
+def test_concurrent_read_modify_write_from_threads():
+    path = "events.jsonl"
+    threads = [
+        threading.Thread(target=increment, args=(path, "counter", 25, 10))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert EventLog(path).records() == {"counter": {"count": 100}}
+
+
+def test_concurrent_read_modify_write_from_processes_with_compaction():
+    path = "events.jsonl"
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=increment, args=(path, "counter", 30, 7))
+        for _ in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    assert EventLog(path).records() == {"counter": {"count": 120}}
@@ -0,0 +1,188 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import job_queue
+
+
+@pytest.fixture(autouse=True)
+def clean_queue(monkeypatch):
+    monkeypatch.setattr(job_queue, "_log", None)
+    monkeypatch.setattr(job_queue, "_handlers", {})
+    monkeypatch.setattr(job_queue, "_batch_windows", {})
+    monkeypatch.setattr(job_queue, "JOB_RETRY_DELAY", 0)
+    return job_queue
+
+
+def jobs():
+    return job_queue.get_job_log().records()
+
+
+def test_run_pending_runs_each_job_once():
+    seen = []
+    job_queue.register_handler("stop", lambda payload: seen.append(payload["ad_id"]))
+    first = job_queue.enqueue("stop", {"ad_id": "1"})
+    second = job_queue.enqueue("stop", {"ad_id": "2"})
+
+    assert job_queue.run_pending() == 2
+    assert seen == ["1", "2"]
+    assert jobs()[first]["status"] == "done"
+    assert jobs()[second]["attempts"] == 1
+    assert job_queue.run_pending() == 0
+
+
+def test_dedupe_key_returns_active_job_until_finished():
+    job_queue.register_handler("copy", lambda payload: None)
+    first = job_queue.enqueue("copy", {"n": 1}, dedupe_key="copy:1")
+    assert job_queue.enqueue("copy", {"n": 2}, dedupe_key="copy:1") == first
+    assert job_queue.enqueue_many("copy", [({"n": 3}, "copy:2"), ({"n": 4}, "copy:2")]) == [
+        job_queue.enqueue("copy", {"n": 5}, dedupe_key="copy:2")
+    ] * 2
+    assert len(jobs()) == 2
+
+    job_queue.run_pending()
+    assert job_queue.enqueue("copy", {"n": 6}, dedupe_key="copy:1") != first
+
+
+def test_cancel_only_affects_queued_jobs():
+    job_queue.register_handler("copy", lambda payload: None)
+    queued = job_queue.enqueue("copy", {}, dedupe_key="copy:1")
+    assert job_queue.cancel("copy:1") == 1
+    assert jobs()[queued]["status"] == "cancelled"
+    assert job_queue.run_pending() == 0
+
+    running = job_queue.enqueue("copy", {}, dedupe_key="copy:1")
+    job_queue.claim_next()
+    assert job_queue.cancel("copy:1") == 0
+    assert jobs()[running]["status"] == "running"
+
+
+def test_failed_job_is_retried_until_success():
+    calls = []
+
+    def flaky(payload):
+        calls.append(payload)
+        if len(calls) < 2:
+            raise RuntimeError("temporary")
+
+    job_queue.register_handler("stop", flaky)
+    job_id = job_queue.enqueue("stop", {"ad_id": "1"})
+    job_queue.run_pending()
+
+    job = jobs()[job_id]
+    assert len(calls) == 2
+    assert job["status"] == "done"
+    assert job["attempts"] == 2
+
+
+def test_failed_job_stops_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_MAX_ATTEMPTS", 3)
+
+    def broken(payload):
+        raise RuntimeError("broken")
+
+    job_queue.register_handler("stop", broken)
+    job_id = job_queue.enqueue("stop", {})
+    job_queue.run_pending()
+
+    job = jobs()[job_id]
+    assert job["status"] == "failed"
+    assert job["attempts"] == 3
+    assert job["error"] == "broken"
+
+
+def test_retry_waits_for_retry_delay(monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_RETRY_DELAY", 60)
+    job_queue.register_handler("stop", lambda payload: 1 / 0)
+    job_id = job_queue.enqueue("stop", {})
+
+    assert job_queue.run_pending() == 1
+    assert jobs()[job_id]["status"] == "queued"
+    assert job_queue.claim_next() == ([], None)
+
+
+def test_unregistered_kind_fails_without_retry():
+    job_id = job_queue.enqueue("unknown", {})
+    job_queue.run_pending()
+    assert jobs()[job_id]["status"] == "failed"
+
+
+def test_stale_running_job_is_recovered():
+    seen = []
+    job_queue.register_handler("stop", lambda payload: seen.append(payload))
+    job_id = job_queue.enqueue("stop", {"ad_id": "1"})
+    # ワーカーが実行中のまま止まった状態
+    claimed, _ = job_queue.claim_next()
+    assert [claimed_id for claimed_id, _ in claimed] == [job_id]
+
+    # まだ新しい実行中のジョブは他のワーカーが取らない
+    assert job_queue.run_pending() == 0
+
+    started_at = (datetime.now() - timedelta(seconds=job_queue.JOB_STALE_SECONDS + 1)).isoformat()
+    job_queue.get_job_log().update(job_id, started_at=started_at)
+    assert job_queue.run_pending() == 1
+    assert seen == [{"ad_id": "1"}]
+    assert jobs()[job_id]["status"] == "done"
+    assert jobs()[job_id]["attempts"] == 2
+
+
+def test_batch_jobs_wait_for_window_and_report_per_payload_errors():
+    batches = []
+
+    def handler(payloads):
+        batches.append([payload["ad_id"] for payload in payloads])
+        # 最初のまとめ実行では2番目だけ失敗する
+        return ["failed" if len(batches) == 1 and payload["ad_id"] == "2" else None for payload in payloads]
+
+    job_queue.register_handler("web_stop", handler, batch_window=60)
+    ids = job_queue.enqueue_many("web_stop", [({"ad_id": str(i)}, None) for i in range(3)])
+
+    claimed, wait = job_queue.claim_next()
+    assert claimed == []
+    assert 0 < wait <= 60
+
+    assert job_queue.run_pending() == 4
+    assert batches[0] == ["0", "1", "2"]
+    assert [jobs()[job_id]["status"] for job_id in ids] == ["done", "done", "done"]
+    # 失敗した1件だけが再試行される
+    assert batches[1:] == [["2"]]
+    assert jobs()[ids[2]]["attempts"] == 2
+
+
+def test_concurrent_workers_do_not_claim_the_same_job():
+    job_queue.register_handler("stop", lambda payload: None)
+    ids = set(job_queue.enqueue_many("stop", [({"n": i}, None) for i in range(40)]))
+    claimed = []
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            jobs_, _ = job_queue.claim_next()
+            if not jobs_:
+                return
+            with lock:
+                claimed.extend(job_id for job_id, _ in jobs_)
+            job_queue.run_job(*jobs_[0])
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == sorted(ids)
+    assert all(jobs()[job_id]["status"] == "done" for job_id in ids)
+
+
+def test_purge_finished_keeps_active_jobs(monkeypatch):
+    job_queue.register_handler("stop", lambda payload: None)
+    done = job_queue.enqueue("stop", {})
+    job_queue.run_pending()
+    queued = job_queue.enqueue("stop", {})
+
+    assert job_queue.purge_finished() == 0
+    monkeypatch.setattr(job_queue, "JOB_KEEP_DAYS", -1)
+    assert job_queue.purge_finished() == 1
+    assert done not in jobs()
+    assert queued in jobs()
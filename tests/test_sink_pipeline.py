@@ -0,0 +1,158 @@
+import threading
+
+import pytest
+
+import sink_pipeline
+from sink_pipeline import BufferedSink, Sink, SinkPipeline
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(sink_pipeline, "SINK_RETRY_DELAY", 0)
+
+
+class RecordingSink(Sink):
+    def __init__(self, name="recording", fail_times=0, kind=None):
+        self.name = name
+        self.kind = kind
+        self.fail_times = fail_times
+        self.written = []
+        self.flushes = 0
+
+    def accepts(self, event):
+        return self.kind is None or event.get("kind") == self.kind
+
+    def write(self, events):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("write failed")
+        self.written.extend(events)
+
+    def flush(self):
+        self.flushes += 1
+
+
+class RecordingBufferedSink(BufferedSink):
+    name = "buffered"
+
+    def __init__(self, fail_times=0):
+        super().__init__()
+        self.fail_times = fail_times
+        self.calls = []
+
+    def write_all(self, events):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("write_all failed")
+        self.calls.append(list(events))
+
+
+def test_events_are_written_in_order_to_accepting_sinks():
+    stops = RecordingSink("stops", kind="stop")
+    everything = RecordingSink("all")
+    pipeline = SinkPipeline([stops, everything])
+    events = [{"kind": "stop" if i % 2 else "copy", "n": i} for i in range(10)]
+    for event in events:
+        pipeline.emit(event)
+
+    assert pipeline.close() == {"stops": 0, "all": 0}
+    assert everything.written == events
+    assert stops.written == [event for event in events if event["kind"] == "stop"]
+    # close() でも区切りの処理が1回行われる
+    assert everything.flushes == 1
+
+
+def test_buffered_sink_writes_once_per_flush():
+    sink = RecordingBufferedSink()
+    pipeline = SinkPipeline([sink])
+    for i in range(120):
+        pipeline.emit({"n": i})
+    pipeline.flush()
+    pipeline.emit({"n": 120})
+    pipeline.close()
+
+    assert [len(call) for call in sink.calls] == [120, 1]
+    assert [event["n"] for call in sink.calls for event in call] == list(range(121))
+
+
+def test_failed_write_is_retried():
+    sink = RecordingSink(fail_times=2)
+    sink.max_retries = 2
+    pipeline = SinkPipeline([sink])
+    pipeline.emit({"n": 1})
+
+    assert pipeline.close() == {"recording": 0}
+    assert sink.written == [{"n": 1}]
+
+
+def test_write_failure_after_retries_counts_failed_events():
+    sink = RecordingSink(fail_times=10)
+    sink.max_retries = 1
+    pipeline = SinkPipeline([sink])
+    pipeline.emit({"n": 1})
+    pipeline.emit({"n": 2})
+
+    assert pipeline.close() == {"recording": 2}
+    assert sink.written == []
+
+
+def test_buffered_sink_rewrites_same_batch_on_retry():
+    sink = RecordingBufferedSink(fail_times=1)
+    sink.max_retries = 1
+    pipeline = SinkPipeline([sink])
+    for i in range(3):
+        pipeline.emit({"n": i})
+
+    assert pipeline.close() == {"buffered": 0}
+    assert sink.calls == [[{"n": 0}, {"n": 1}, {"n": 2}]]
+
+
+def test_buffered_sink_discards_batch_when_flush_keeps_failing():
+    class RejectingSink(RecordingBufferedSink):
+        def write_all(self, events):
+            if any(event.get("bad") for event in events):
+                raise RuntimeError("rejected")
+            super().write_all(events)
+
+    sink = RejectingSink()
+    sink.max_retries = 1
+    pipeline = SinkPipeline([sink])
+    for i in range(3):
+        pipeline.emit({"n": i, "bad": True})
+    pipeline.flush()
+
+    # 失敗した区切りのイベントは次の区切りに持ち越さない
+    pipeline.emit({"n": 3})
+    assert pipeline.close() == {"buffered": 3}
+    assert sink.calls == [[{"n": 3}]]
+
+
+def test_emit_waits_when_sink_queue_is_full(monkeypatch):
+    monkeypatch.setattr(sink_pipeline, "SINK_QUEUE_SIZE", 1)
+    release = threading.Event()
+
+    class SlowSink(RecordingSink):
+        def write(self, events):
+            release.wait(5)
+            super().write(events)
+
+    sink = SlowSink()
+    pipeline = SinkPipeline([sink])
+    emitted = []
+
+    def produce():
+        for i in range(5):
+            pipeline.emit({"n": i})
+            emitted.append(i)
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    producer.join(0.3)
+    # 書き込みが止まっている間は評価側も止まる
+    assert producer.is_alive()
+    assert len(emitted) < 5
+
+    release.set()
+    producer.join(5)
+    assert pipeline.close() == {"recording": 0}
+    assert sink.written == [{"n": i} for i in range(5)]
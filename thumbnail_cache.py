@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+広告画像のサムネイルキャッシュ
+
+承認画面やSlack通知の広告画像を、FacebookのCDNから直接ではなくローカルのキャッシュから返す。
+CDNの画像URLは期限切れになるので、広告IDごとに一度だけ取得して縮小し、ディスクに保存する。
+
+- キャッシュは THUMBNAIL_DIR に広告IDごとのファイルとして保存し、合計サイズが
+  THUMBNAIL_MAX_BYTES を超えたら最近使われていないもの（LRU、更新日時の古い順）から削除する
+- Pillowがインストールされていれば長辺THUMBNAIL_SIZEピクセルのJPEGに縮小する（無ければ元の画像のまま保存）
+- 記録されている画像URLが期限切れの場合は、Meta APIから最新のサムネイルURLを取得し直す
+- 取得に失敗した広告はしばらく（THUMBNAIL_RETRY_AFTER秒）取得し直さない
+  （失敗の記録はこの時間を過ぎると削除するので、長時間動かしても増え続けない）
+
+使い方:
+    python3 thumbnail_cache.py stats   キャッシュの件数とサイズ
+    python3 thumbnail_cache.py clear   キャッシュを削除
+"""
+
+import io
+import os
+import re
+import sys
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import requests
+
+from local_state import atomic_write_bytes, file_lock
+
+try:
+    from PIL import Image
+except ModuleNotFoundError:
+    Image = None
+
+try:
+    from dotenv import load_dotenv
+except ModuleNotFoundError:
+    def load_dotenv(*args, **kwargs):
+        return False
+
+load_dotenv()
+
+ACCESS_TOKEN = os.getenv("ACCESS_TOKEN")
+
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", "thumbnails")
+# キャッシュの合計サイズの上限（バイト）
+THUMBNAIL_MAX_BYTES = int(os.getenv("THUMBNAIL_MAX_BYTES", str(200 * 1024 * 1024)))
+# 縮小後の長辺のピクセル数とJPEGの画質
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "320"))
+THUMBNAIL_QUALITY = 80
+# 元画像として受け付ける最大サイズ（バイト）
+THUMBNAIL_MAX_SOURCE_BYTES = 10 * 1024 * 1024
+THUMBNAIL_TIMEOUT = 15
+# 取得に失敗した広告を取得し直すまでの時間（秒）
+THUMBNAIL_RETRY_AFTER = int(os.getenv("THUMBNAIL_RETRY_AFTER", "600"))
+# Slack通知の画像をサムネイル経由にする場合の、承認Web UIの公開URL（例: https://xxxx.ngrok.io）
+THUMBNAIL_PUBLIC_URL = os.getenv("THUMBNAIL_PUBLIC_URL")
+
+# 画像がないことを表す値（meta_abtest_runner.py が記録する）
+NO_IMAGE_VALUES = ("", "N/A", "画像なし")
+
+SUFFIX = ".thumb"
+_AD_ID_PATTERN = re.compile(r"^\d{1,32}$")
+
+# 先頭のバイト列 → Content-Type
+_MAGIC_TYPES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF8", "image/gif"),
+    (b"RIFF", "image/webp"),
+)
+
+# 広告ID → 取得に失敗した時刻（古い順）
+_failures = OrderedDict()
+_failures_lock = threading.Lock()
+# 広告ID → [ロック, 使用中のスレッド数]
+_fetch_locks = {}
+_fetch_locks_guard = threading.Lock()
+
+
+def is_valid_ad_id(ad_id):
+    return bool(_AD_ID_PATTERN.match(str(ad_id)))
+
+
+def has_image(image_url):
+    return bool(image_url) and image_url not in NO_IMAGE_VALUES
+
+
+def thumbnail_path(ad_id):
+    return os.path.join(THUMBNAIL_DIR, f"{ad_id}{SUFFIX}")
+
+
+def content_type(path):
+    """保存した画像のContent-Type（先頭のバイト列から判定）"""
+    with open(path, "rb") as f:
+        head = f.read(12)
+    for magic, mimetype in _MAGIC_TYPES:
+        if head.startswith(magic) and (mimetype != "image/webp" or head[8:12] == b"WEBP"):
+            return mimetype
+    return "application/octet-stream"
+
+
+def lookup(ad_id):
+    """キャッシュ済みのサムネイルのパス（無ければNone）。使われた順を記録するため更新日時を更新する"""
+    if not is_valid_ad_id(ad_id):
+        return None
+    path = thumbnail_path(ad_id)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def fetch_thumbnail_url(ad_id):
+    """Meta APIから広告クリエイティブの最新のサムネイルURLを取得"""
+    if not ACCESS_TOKEN:
+        return None
+    try:
+        res = requests.get(
+            f"https://graph.facebook.com/v19.0/{ad_id}",
+            params={"fields": "creative{thumbnail_url}", "access_token": ACCESS_TOKEN},
+            timeout=THUMBNAIL_TIMEOUT,
+        )
+        return res.json().get("creative", {}).get("thumbnail_url")
+    except (requests.RequestException, ValueError) as e:
+        print(f"サムネイルURLの取得エラー ({ad_id}): {e}")
+        return None
+
+
+def download(url):
+    """画像をダウンロード（失敗・画像以外・大きすぎる場合はNone）"""
+    try:
+        with requests.get(url, stream=True, timeout=THUMBNAIL_TIMEOUT) as res:
+            if res.status_code != 200 or not res.headers.get("Content-Type", "").startswith("image/"):
+                return None
+            data = bytearray()
+            for chunk in res.iter_content(64 * 1024):
+                data.extend(chunk)
+                if len(data) > THUMBNAIL_MAX_SOURCE_BYTES:
+                    return None
+            return bytes(data)
+    except requests.RequestException:
+        return None
+
+
+def resize(data):
+    """長辺THUMBNAIL_SIZEピクセルのJPEGに縮小（Pillowが無い・読めない画像の場合は元のまま）"""
+    if Image is None:
+        return data
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            out = io.BytesIO()
+            image.save(out, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        print(f"サムネイルの縮小エラー: {e}")
+        return data
+    # 元の画像の方が小さい場合（小さいJPEGなど）は元のまま使う
+    return out.getvalue() if out.tell() < len(data) else data
+
+
+@contextmanager
+def _fetch_lock(ad_id):
+    """広告IDごとのロック（使い終わって待っているスレッドがなければ削除する）"""
+    with _fetch_locks_guard:
+        entry = _fetch_locks.setdefault(ad_id, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _fetch_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _fetch_locks[ad_id]
+
+
+def _prune_failures():
+    """再取得までの時間を過ぎた失敗の記録を古い順に削除"""
+    expired = time.monotonic() - THUMBNAIL_RETRY_AFTER
+    while _failures and next(iter(_failures.values())) <= expired:
+        _failures.popitem(last=False)
+
+
+def _recently_failed(ad_id):
+    with _failures_lock:
+        _prune_failures()
+        return ad_id in _failures
+
+
+def _record_result(ad_id, failed):
+    with _failures_lock:
+        _failures.pop(ad_id, None)
+        if failed:
+            _failures[ad_id] = time.monotonic()
+        _prune_failures()
+
+
+def get_thumbnail(ad_id, image_url=None):
+    """広告のサムネイルのパスを返す（キャッシュに無ければ取得して保存。取得できない場合はNone）
+
+    Args:
+        image_url: 記録されている画像URL（期限切れの場合はMeta APIから取得し直す）
+    """
+    if not is_valid_ad_id(ad_id):
+        return None
+    path = lookup(ad_id)
+    if path:
+        return path
+
+    # 同じ広告を複数のリクエストで同時に取得しない
+    with _fetch_lock(ad_id):
+        path = lookup(ad_id)
+        if path:
+            return path
+        if _recently_failed(ad_id):
+            return None
+
+        data = download(image_url) if has_image(image_url) else None
+        if data is None:
+            fresh_url = fetch_thumbnail_url(ad_id)
+            if fresh_url and fresh_url != image_url:
+                data = download(fresh_url)
+        _record_result(ad_id, failed=data is None)
+        if data is None:
+            return None
+
+        os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+        path = thumbnail_path(ad_id)
+        atomic_write_bytes(path, resize(data))
+
+    evict()
+    return path
+
+
+def _entries():
+    """キャッシュのファイル一覧 [(更新日時, サイズ, パス), ...]"""
+    entries = []
+    try:
+        with os.scandir(THUMBNAIL_DIR) as it:
+            for entry in it:
+                if entry.name.endswith(SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def evict(max_bytes=None):
+    """合計サイズが上限を超えていれば、最近使われていないサムネイルから削除
+
+    Returns:
+        削除した件数
+    """
+    max_bytes = THUMBNAIL_MAX_BYTES if max_bytes is None else max_bytes
+    entries = _entries()
+    total = sum(size for _, size, _ in entries)
+    if total <= max_bytes:
+        return 0
+
+    removed = 0
+    # 複数のワーカーが同時に削除しないよう、削除はロックを取って行う
+    with file_lock(os.path.join(THUMBNAIL_DIR, "cache"), blocking=False) as locked:
+        if not locked:
+            return 0
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+    return removed
+
+
+def slack_image_url(ad_id, image_url):
+    """Slackのimageブロックに使う画像URL（画像がない場合はNone）
+
+    THUMBNAIL_PUBLIC_URLを設定している場合は、期限切れにならないサムネイルのURLにする
+    """
+    if not has_image(image_url):
+        return None
+    if THUMBNAIL_PUBLIC_URL and is_valid_ad_id(ad_id):
+        return f"{THUMBNAIL_PUBLIC_URL.rstrip('/')}/thumbs/{ad_id}"
+    return image_url
+
+
+def main():
+    if len(sys.argv) == 2 and sys.argv[1] == "stats":
+        entries = _entries()
+        total = sum(size for _, size, _ in entries)
+        print(f"  - 件数: {len(entries)}")
+        print(f"  - サイズ: {total / 1024 / 1024:.1f}MB / {THUMBNAIL_MAX_BYTES / 1024 / 1024:.1f}MB")
+        print(f"  - 縮小: {'Pillow' if Image is not None else 'なし（Pillow未インストール）'}")
+        return
+
+    if len(sys.argv) == 2 and sys.argv[1] == "clear":
+        removed = evict(max_bytes=0)
+        print(f"✅ {removed}件のサムネイルを削除しました")
+        return
+
+    print("使い方:")
+    print("  python3 thumbnail_cache.py stats")
+    print("  python3 thumbnail_cache.py clear")
+
+
+if __name__ == "__main__":
+    main()